@@ -1,12 +1,41 @@
-from web3 import Web3
+"""BSC USDT payment listener.
+
+Scans USDT Transfer logs to USDT_TRAN_ADDRESS and marks the sender's
+pending PayTable row (currpay) as paid.
+
+Instead of a `create_filter(from_block="latest")` poll, which dropped
+every transfer that landed while the process was down or after the node
+expired the filter, the listener walks block ranges with eth_getLogs and
+persists the last processed block in ChainCursor:
+
+  - only blocks at least BNB_LISTENER_CONFIRMATIONS deep are scanned, so
+    a reorg near the head can't mark a payment that later disappears;
+  - the range per eth_getLogs call grows by a quarter while the node
+    answers and is halved when it errors (public BSC nodes cap both
+    block range and result size);
+  - logs are filtered node-side on the token contract and the receiver
+    topic, and each range's matches are resolved against PayTable in a
+    few bulk queries.
+
+A fresh deploy with no cursor starts BNB_LISTENER_LOOKBACK blocks back.
+Re-scanning a range is harmless: hashes already recorded as paid are
+skipped.
+"""
 import os
 import asyncio
+from typing import Any, Dict, List
 
-from apps.web.models.pay import PayTableInstall
+from web3 import Web3
 
-BNB_RPC = os.getenv("BNB_RPC")
-USDT_CONTRACT_ADDRESS = os.getenv("USDT_CONTRACT_ADDRESS")
-USDT_TRAN_ADDRESS = "0x3011aef25585d026BfA3d3c3Fb4323f4b0eF3Eaa"
+from apps.web.models.chain_cursor import ChainCursorInstance
+from apps.web.models.pay import PayTableInstall
+from apps.web.util.chainrpc import (
+    TRANSFER_TOPIC,
+    JsonRpcPool,
+    address_topic,
+    parse_transfer_log,
+    to_wei,
+)
 
 
 import logging
@@ -14,68 +43,118 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# BNB USDT ABI
-USDT_ABI = [
-    {
-        "anonymous": False,
-        "inputs": [
-            {"indexed": True, "name": "from", "type": "address"},
-            {"indexed": True, "name": "to", "type": "address"},
-            {"indexed": False, "name": "value", "type": "uint256"},
-        ],
-        "name": "Transfer",
-        "type": "event",
-    }
-]
+BNB_RPC = os.getenv("BNB_RPC")
+# Same receiver and token the /bnb/check endpoint verifies against.
+USDT_CONTRACT_ADDRESS = os.getenv("USDT_CONTRACT_ADDRESS", "0x55d398326f99059fF775485246999027B3197955")
+USDT_TRAN_ADDRESS = "0x3011aef25585d026BfA3d3c3Fb4323f4b7eF3Eaa"
 
-w3 = Web3(Web3.HTTPProvider(BNB_RPC))
-contract = w3.eth.contract(address=USDT_CONTRACT_ADDRESS, abi=USDT_ABI)
+CURSOR_NAME = "bnbusdt"
+LISTENER_CONFIRMATIONS = int(os.getenv("BNB_LISTENER_CONFIRMATIONS", "15"))
+LISTENER_LOOKBACK = int(os.getenv("BNB_LISTENER_LOOKBACK", "2000"))
+LISTENER_POLL_S = float(os.getenv("BNB_LISTENER_POLL_S", "3"))
+LISTENER_MIN_RANGE = 10
+LISTENER_MAX_RANGE = int(os.getenv("BNB_LISTENER_MAX_RANGE", "5000"))
+LISTENER_ERROR_SLEEP_S = 5
 
 
 class BNBUSDTPayListener:
 
-    async def start_listening(self):
-        # create tran event
-        event_filter = contract.events.Transfer.create_filter(from_block="latest")
+    def __init__(self):
+        self.rpc = JsonRpcPool()
+        self.block_range = LISTENER_MIN_RANGE * 10
 
-        while True:
+    async def start_listening(self):
+        if not BNB_RPC:
+            logger.warning("BNB_RPC not set; USDT pay listener disabled")
+            return
+        try:
+            while True:
+                try:
+                    await self.scan()
+                    await asyncio.sleep(LISTENER_POLL_S)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning(f"Listener Error: {e}")
+                    await asyncio.sleep(LISTENER_ERROR_SLEEP_S)
+        finally:
+            await self.rpc.close()
+
+    async def scan(self):
+        """Process every confirmed block after the cursor."""
+        head = int(await self.rpc.call(BNB_RPC, "eth_blockNumber", []), 16)
+        safe = head - LISTENER_CONFIRMATIONS
+        cursor = await asyncio.to_thread(ChainCursorInstance.get_block, CURSOR_NAME)
+        if cursor is None:
+            cursor = max(0, safe - LISTENER_LOOKBACK)
+            logger.info(f"USDT listener has no cursor, starting at block {cursor}")
+
+        while cursor < safe:
+            to_block = min(safe, cursor + self.block_range)
             try:
-                # check new event
-                for event in event_filter.get_new_entries():
-                    await self.handle_transfer_event(event)
-
-                # check every 2s
-                await asyncio.sleep(2)
-
+                logs = await self.get_logs(cursor + 1, to_block)
             except Exception as e:
-                await asyncio.sleep(5)
-                event_filter = self.contract.events.Transfer.create_filter(
-                    from_block="latest"
-                )
-
-    async def handle_transfer_event(self, event):
-        try:
-            from_address = event["args"]["from"]
-            to_address = event["args"]["to"]
-            value = event["args"]["value"]
-
-            # check tran info
-            if to_address.lower() == USDT_TRAN_ADDRESS:
-                amount = w3.from_wei(value, "ether")
-                tx_hash = event["transactionHash"].hex()
-
-                payinfo = PayTableInstall.get_currpay_byaddress(from_address)
-                print("===================Pay Info==============", payinfo)
-                if payinfo is not None:
-                    PayTableInstall.update_hash_status(payinfo.id, tx_hash, True, True)
-
-                print("===================Pay Info==============")
-                print(f"Pay Amount: {amount} USDT")
-                print(f"From Address: {from_address}")
-                print(f"Tran Hash: {tx_hash}")
-
-        except Exception as e:
-            print(f"Listener Error: {e}")
+                if self.block_range <= LISTENER_MIN_RANGE:
+                    raise
+                self.block_range = max(LISTENER_MIN_RANGE, self.block_range // 2)
+                logger.info(f"eth_getLogs {cursor + 1}-{to_block} failed ({e}); range -> {self.block_range}")
+                continue
+
+            if logs:
+                await asyncio.to_thread(self.handle_transfer_logs, logs)
+            await asyncio.to_thread(ChainCursorInstance.set_block, CURSOR_NAME, to_block)
+            cursor = to_block
+            # Grow slower than we shrink so we don't keep hitting the node's cap.
+            self.block_range = min(LISTENER_MAX_RANGE, self.block_range + self.block_range // 4)
+
+    async def get_logs(self, from_block: int, to_block: int) -> List[Dict[str, Any]]:
+        return await self.rpc.call(BNB_RPC, "eth_getLogs", [{
+            "fromBlock": hex(from_block),
+            "toBlock": hex(to_block),
+            "address": USDT_CONTRACT_ADDRESS,
+            "topics": [TRANSFER_TOPIC, None, address_topic(USDT_TRAN_ADDRESS)],
+        }])
+
+    def handle_transfer_logs(self, logs: List[Dict[str, Any]]):
+        """Mark pending pays for a batch of Transfer logs (runs in a thread)."""
+        transfers = []
+        for evt in logs:
+            if evt.get("removed"):
+                continue
+            t = parse_transfer_log(evt)
+            if t is None or t.receiver != USDT_TRAN_ADDRESS.lower():
+                continue
+            transfers.append((t, evt.get("transactionHash", "")))
+        if not transfers:
+            return
+
+        used = PayTableInstall.used_hashes([tx_hash for _t, tx_hash in transfers])
+        senders = {t.sender for t, _h in transfers}
+        # wallet_addr is stored as the client sent it, usually checksummed.
+        lookup = list(senders) + [Web3.to_checksum_address(a) for a in senders]
+        pending = PayTableInstall.get_currpay_by_addresses(lookup)
+
+        updates = []
+        for t, tx_hash in transfers:
+            if tx_hash in used:
+                continue
+            payinfo = pending.get(t.sender)
+            if payinfo is None:
+                continue
+            expected = to_wei(payinfo.amount)
+            if expected is not None and t.value < expected:
+                logger.info(f"USDT transfer {tx_hash} from {t.sender} below pay amount {payinfo.amount}")
+                continue
+            updates.append((payinfo.id, tx_hash))
+            pending.pop(t.sender)
+            logger.info(
+                f"USDT pay {payinfo.id}: {Web3.from_wei(t.value, 'ether')} USDT "
+                f"from {t.sender} tx {tx_hash}"
+            )
+
+        if updates and not PayTableInstall.update_hash_status_bulk(updates):
+            # Leave the cursor where it was so the range is retried.
+            raise RuntimeError("PayTable bulk update failed")
 
 
 BNBUSDTPayListenerInstance = BNBUSDTPayListener()
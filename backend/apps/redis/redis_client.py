@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio as aioredis
 import json
 import logging
 import os
@@ -9,6 +10,8 @@ REDIS_HOST = os.environ.get("REDIS_HOST")
 REDIS_PORT = os.environ.get("REDIS_PORT")
 REDIS_DB = os.environ.get("REDIS_DB")
 REDIS_PWD = os.environ.get("REDIS_PWD")
+# Shared asyncio pool size per worker process.
+REDIS_MAX_CONNECTIONS = int(os.environ.get("REDIS_MAX_CONNECTIONS", "50"))
 
 
 class RedisClient:
@@ -65,4 +68,137 @@ class RedisClient:
             return 0
 
 
-RedisClientInstance = RedisClient()
\ No newline at end of file
+RedisClientInstance = RedisClient()
+
+
+class AsyncRedisClient:
+    """asyncio-native counterpart of RedisClient for use in async handlers.
+
+    The sync client blocks the event loop for up to socket_timeout on a
+    slow Redis; this one shares a connection pool across the worker and
+    awaits instead. Same JSON conventions and fail-soft behaviour as
+    RedisClient (errors are logged, reads return None, writes False).
+
+    Enabled only when the sync client connected at startup, so a box
+    without Redis doesn't pay a connect timeout on every call. The pool
+    is created lazily inside the running loop and closed from
+    main.lifespan.
+    """
+
+    def __init__(self, host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, password=REDIS_PWD):
+        self._params = dict(host=host, port=port, db=db, password=password)
+        self._client = None
+
+    @property
+    def redis_client(self):
+        if self._client is None and RedisClientInstance.redis_client is not None:
+            pool = aioredis.ConnectionPool(
+                **self._params,
+                decode_responses=True,
+                socket_connect_timeout=2,
+                socket_timeout=2,
+                max_connections=REDIS_MAX_CONNECTIONS,
+            )
+            self._client = aioredis.Redis(connection_pool=pool)
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def add_key_value(self, key, value, ttl=None):
+        """Store value as JSON. `ttl` is optional seconds; None => no expiry."""
+        r = self.redis_client
+        if r is None:
+            return False
+        try:
+            value_json = json.dumps(value)
+            if ttl is not None:
+                return await r.setex(key, int(ttl), value_json)
+            return await r.set(key, value_json)
+        except Exception as e:
+            log.error(f"Redis add_key_value error: {e}")
+            return False
+
+    async def get_value_by_key(self, key):
+        r = self.redis_client
+        if r is None:
+            return None
+        try:
+            value = await r.get(key)
+            if value is None:
+                return None
+            return json.loads(value)
+        except Exception as e:
+            log.error(f"Redis get_value_by_key error: {e}")
+            return None
+
+    async def delete_key(self, *keys):
+        r = self.redis_client
+        if r is None or not keys:
+            return 0
+        try:
+            return await r.delete(*keys)
+        except Exception as e:
+            log.error(f"Redis delete_key error: {e}")
+            return 0
+
+    async def get_values_by_keys(self, keys):
+        """MGET + JSON decode; missing or undecodable keys come back as None."""
+        r = self.redis_client
+        if r is None or not keys:
+            return [None] * len(keys)
+        try:
+            raw = await r.mget(keys)
+        except Exception as e:
+            log.error(f"Redis get_values_by_keys error: {e}")
+            return [None] * len(keys)
+        values = []
+        for value in raw:
+            try:
+                values.append(json.loads(value) if value is not None else None)
+            except ValueError:
+                values.append(None)
+        return values
+
+    async def add_key_values(self, mapping, ttl=None):
+        """Store several JSON values in one pipelined round trip."""
+        r = self.redis_client
+        if r is None or not mapping:
+            return False
+        try:
+            async with r.pipeline(transaction=False) as pipe:
+                for key, value in mapping.items():
+                    if ttl is not None:
+                        pipe.setex(key, int(ttl), json.dumps(value))
+                    else:
+                        pipe.set(key, json.dumps(value))
+                await pipe.execute()
+            return True
+        except Exception as e:
+            log.error(f"Redis add_key_values error: {e}")
+            return False
+
+    async def incr_with_ttl(self, key, ttl):
+        """INCR a counter and set its expiry on first use, in one round trip.
+
+        Returns the new count, or None if Redis is unavailable.
+        """
+        r = self.redis_client
+        if r is None:
+            return None
+        try:
+            # SET NX seeds the counter with its expiry on first use (works
+            # on Redis < 7, which lacks EXPIRE ... NX).
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.set(key, 0, ex=int(ttl), nx=True)
+                pipe.incr(key)
+                _, count = await pipe.execute()
+            return count
+        except Exception as e:
+            log.error(f"Redis incr_with_ttl error: {e}")
+            return None
+
+
+AsyncRedisClientInstance = AsyncRedisClient()
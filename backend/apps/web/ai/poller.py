@@ -0,0 +1,245 @@
+"""Shared WaveSpeed prediction poller.
+
+Every SSE stream and canvas block used to run its own
+get_prediction_result loop, so N viewers of one createId meant N polls
+per tick against WaveSpeed. This module owns the set of pending request
+ids for the worker process instead: each id is polled once per interval
+no matter how many callers are waiting on it, and every poll result is
+fanned out to all subscribers through asyncio queues.
+
+Intervals adapt per id: they start at WAVESPEED_POLL_MIN_S, grow by
+WAVESPEED_POLL_BACKOFF while the status stays the same (a job sitting in
+"processing" for two minutes doesn't need 1 Hz polling) and drop back
+to the minimum as soon as the status changes. Each poll runs as its own
+task and re-arms its id when it returns, so one slow upstream call only
+delays that id, not every other pending request.
+
+Usage:
+
+    async for poll in PredictionPollerInstance.watch(request_id, timeout=240):
+        status, inner = parse_prediction(poll)
+        ...
+
+`watch` yields the raw get_prediction_result dicts, ends after a
+terminal status, and simply stops (without a terminal result) when the
+caller's timeout elapses.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, AsyncIterator, Dict, Optional, Set, Tuple
+
+log = logging.getLogger(__name__)
+
+POLL_MIN_INTERVAL_S = float(os.getenv("WAVESPEED_POLL_MIN_S", "1.0"))
+POLL_MAX_INTERVAL_S = float(os.getenv("WAVESPEED_POLL_MAX_S", "5.0"))
+POLL_BACKOFF = float(os.getenv("WAVESPEED_POLL_BACKOFF", "1.5"))
+# Upper bound on concurrent upstream status calls.
+POLL_CONCURRENCY = int(os.getenv("WAVESPEED_POLL_CONCURRENCY", "16"))
+# Finished results are kept briefly so a viewer that subscribes just
+# after completion gets the answer without another upstream call.
+TERMINAL_CACHE_TTL_S = 60.0
+
+TERMINAL_OK = ("completed", "succeeded", "success")
+TERMINAL_FAILED = ("failed", "error", "cancelled", "canceled")
+
+
+def parse_prediction(poll: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Return (lower-cased status, inner prediction dict) for a poll result.
+
+    WaveSpeed wraps the prediction inside another `data` field. Failed
+    HTTP polls come back as ("", {}).
+    """
+    if not poll or not poll.get("success"):
+        return "", {}
+    data = poll.get("data") or {}
+    inner = data.get("data") if isinstance(data.get("data"), dict) else data
+    return (inner.get("status") or "").lower(), inner
+
+
+def is_terminal(status: str) -> bool:
+    return status in TERMINAL_OK or status in TERMINAL_FAILED
+
+
+class _PendingPrediction:
+    __slots__ = ("request_id", "subscribers", "interval", "next_poll_at", "last_status", "polling")
+
+    def __init__(self, request_id: str, now: float):
+        self.request_id = request_id
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.interval = POLL_MIN_INTERVAL_S
+        self.next_poll_at = now
+        self.last_status: Optional[str] = None
+        self.polling = False
+
+
+def _fan_out(job: _PendingPrediction, poll: Dict[str, Any]) -> None:
+    for q in list(job.subscribers):
+        if q.full():
+            # Slow consumer: status snapshots supersede each other, so
+            # dropping the oldest one loses nothing important.
+            try:
+                q.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        q.put_nowait(poll)
+
+
+class PredictionPoller:
+    def __init__(self):
+        self._pending: Dict[str, _PendingPrediction] = {}
+        self._finished: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._polls: Set[asyncio.Task] = set()
+        self._sem = asyncio.Semaphore(POLL_CONCURRENCY)
+
+    # ----- subscription -----
+
+    def subscribe(self, request_id: str) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(maxsize=8)
+        self._expire_finished()
+        finished = self._finished.get(request_id)
+        if finished is not None and time.monotonic() - finished[0] < TERMINAL_CACHE_TTL_S:
+            q.put_nowait(finished[1])
+            return q
+        job = self._pending.get(request_id)
+        if job is None:
+            job = _PendingPrediction(request_id, time.monotonic())
+            self._pending[request_id] = job
+        job.subscribers.add(q)
+        self._ensure_running()
+        return q
+
+    def unsubscribe(self, request_id: str, q: asyncio.Queue) -> None:
+        job = self._pending.get(request_id)
+        if job is None:
+            return
+        job.subscribers.discard(q)
+        if not job.subscribers:
+            # Nobody is listening any more; stop spending upstream calls on it.
+            self._pending.pop(request_id, None)
+
+    async def watch(self, request_id: str, timeout: float) -> AsyncIterator[Dict[str, Any]]:
+        q = self.subscribe(request_id)
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    poll = await asyncio.wait_for(q.get(), remaining)
+                except asyncio.TimeoutError:
+                    return
+                yield poll
+                if is_terminal(parse_prediction(poll)[0]):
+                    return
+        finally:
+            self.unsubscribe(request_id, q)
+
+    async def wait(self, request_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Return the terminal poll result, or the last one seen on timeout."""
+        last = None
+        async for poll in self.watch(request_id, timeout):
+            last = poll
+        return last
+
+    async def close(self) -> None:
+        for task in list(self._polls):
+            task.cancel()
+        await asyncio.gather(*self._polls, return_exceptions=True)
+        self._polls.clear()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    # ----- background loop -----
+
+    def _ensure_running(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        # Only schedules: each due id gets its own poll task, which sets
+        # next_poll_at and wakes this loop when it returns.
+        while self._pending:
+            now = time.monotonic()
+            for job in list(self._pending.values()):
+                if not job.polling and job.next_poll_at <= now:
+                    job.polling = True
+                    task = asyncio.create_task(self._poll_one(job))
+                    self._polls.add(task)
+                    task.add_done_callback(self._poll_done)
+            self._expire_finished()
+            idle = [job.next_poll_at for job in self._pending.values() if not job.polling]
+            # Everything in flight: sleep until a poll returns.
+            timeout = max(0.0, min(idle) - time.monotonic()) if idle else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _poll_done(self, task: asyncio.Task) -> None:
+        self._polls.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("prediction poll task crashed: %s", task.exception())
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _poll_one(self, job: _PendingPrediction) -> None:
+        try:
+            await self._poll_and_fan_out(job)
+        finally:
+            job.polling = False
+
+    async def _poll_and_fan_out(self, job: _PendingPrediction) -> None:
+        from apps.web.ai.wave import AsyncWaveApiInstance
+
+        async with self._sem:
+            try:
+                poll = await AsyncWaveApiInstance.get_prediction_result(job.request_id)
+            except Exception as e:
+                log.warning("prediction poll %s errored: %s", job.request_id, e)
+                poll = {"success": False, "error": f"Err: {e}"}
+
+        status, _inner = parse_prediction(poll)
+        if status and status == job.last_status:
+            job.interval = min(job.interval * POLL_BACKOFF, POLL_MAX_INTERVAL_S)
+        elif status:
+            job.interval = POLL_MIN_INTERVAL_S
+        else:
+            # Upstream error: back off without resetting the status memory.
+            job.interval = min(job.interval * POLL_BACKOFF, POLL_MAX_INTERVAL_S)
+        job.last_status = status or job.last_status
+        job.next_poll_at = time.monotonic() + job.interval
+
+        _fan_out(job, poll)
+
+        if is_terminal(status):
+            self._finished[job.request_id] = (time.monotonic(), poll)
+            current = self._pending.get(job.request_id)
+            if current is not None:
+                # The id may have been dropped and re-subscribed while this
+                # poll was in flight; the newer entry is finished too.
+                if current is not job:
+                    _fan_out(current, poll)
+                self._pending.pop(job.request_id, None)
+
+    def _expire_finished(self) -> None:
+        cutoff = time.monotonic() - TERMINAL_CACHE_TTL_S
+        for request_id in [k for k, (ts, _) in self._finished.items() if ts < cutoff]:
+            self._finished.pop(request_id, None)
+
+
+PredictionPollerInstance = PredictionPoller()
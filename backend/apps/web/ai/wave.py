@@ -1,12 +1,25 @@
+import asyncio
+import json
 import os
+
+import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
 from apps.web.models.aimodel import AiModelReq
-from apps.web.models.pay import PayTableInstall
 
 
 wave_url = os.getenv("WAVESPEED_URL")
 wave_key = os.getenv("WAVESPEED_KEY")
 
+# Connection pool for AsyncWaveApi. One pool per worker process; the
+# per-host cap keeps a burst of canvas runs from opening hundreds of
+# sockets to WaveSpeed at once.
+WAVE_POOL_LIMIT = int(os.getenv("WAVESPEED_POOL_LIMIT", "100"))
+WAVE_POOL_PER_HOST = int(os.getenv("WAVESPEED_POOL_PER_HOST", "32"))
+WAVE_KEEPALIVE_S = float(os.getenv("WAVESPEED_KEEPALIVE_S", "60"))
+WAVE_CONNECT_TIMEOUT_S = float(os.getenv("WAVESPEED_CONNECT_TIMEOUT_S", "10"))
+WAVE_TIMEOUT_S = float(os.getenv("WAVESPEED_TIMEOUT_S", "60"))
+
 # Pricing tiers per model slug. Slugs must match MODEL_REGISTRY in x402pay.py.
 # Updated 2026-04-22: Sora 2 removed (OpenAI API shutting down 2026-09-24),
 # replaced by Luma Ray 2 + Vidu Q3. All models upgraded to latest WaveSpeed versions.
@@ -57,9 +70,35 @@ amounts = {
   }
 }
 
+# Fallback for models / sizes / durations missing from `amounts`.
+DEFAULT_PRICE = "$0.02"
+
+
+def _build_price_table():
+	"""Flatten `amounts` into {(model, size_tier, duration): "$price"}."""
+	table = {}
+	for model, tiers in amounts.items():
+		for size_tier, durations in tiers.items():
+			for duration, price in durations.items():
+				table[(model, size_tier, duration)] = f"${price}"
+	return table
+
+
+# Every registry price, formatted once at import. calc_model_price only
+# resolves the size tier and does a dict lookup.
+PRICE_TABLE = _build_price_table()
+
 
 class WaveApi:
-    
+
+	def __init__(self):
+		# Keep-alive session for the remaining sync callers; async code
+		# paths should use AsyncWaveApiInstance instead.
+		self._http = requests.Session()
+		adapter = HTTPAdapter(pool_maxsize=WAVE_POOL_PER_HOST)
+		self._http.mount("https://", adapter)
+		self._http.mount("http://", adapter)
+
 	def check_model(self, model: str):
 		# Keep in sync with MODEL_REGISTRY in x402pay.py and `amounts` above.
 		models = [
@@ -77,12 +116,15 @@ class WaveApi:
 		]
 		return model in models
 
-	# Create Video ID      
-	def create(self, param: AiModelReq):
-		headers = {
+	def _headers(self):
+		return {
 			"Authorization": f'Bearer {wave_key}',
 			"Content-Type": "application/json"
 		}
+
+	# Request builders. Each returns (url, body) so the sync client below
+	# and AsyncWaveApi share one copy of the per-vendor request shapes.
+	def _create_request(self, param: AiModelReq):
 		user_data_list = [item for item in param.messages if item.get("role") == "user"]
 		last_message = user_data_list[-1]
 		contents = self.judge_content_type(last_message.get("content"))
@@ -115,22 +157,9 @@ class WaveApi:
 			}
 		if contents.get("image") is not None:
 			data["image"] = contents.get("image").get("url")
+		return f'{wave_url}/{param.source}/{param.model}', data
 
-		try:
-			url = f'{wave_url}/{param.source}/{param.model}'
-			response = requests.post(url, json=data, headers=headers)
-			response.raise_for_status()
-			return response.json()
-		except Exception as e:
-			print(f"Request Err: {e}, {response.json()}")
-			return None
-		
-	# Create X402 Video ID
-	def x402create(self, source: str, model: str, prompt: str, duration: int, size: str):
-		headers = {
-			"Authorization": f'Bearer {wave_key}',
-			"Content-Type": "application/json"
-		}
+	def _x402_request(self, source: str, model: str, prompt: str, duration: int, size: str):
 		# Map a Canvas-style resolution token ("720p" / "480p" / "1080p")
 		# to a 16:9 aspect ratio when the model wants aspect_ratio instead
 		# of size. This lets Canvas pass `resolution` through unchanged
@@ -204,32 +233,10 @@ class WaveApi:
 				"prompt": prompt,
 				"size": size
 			}
+		return f'{wave_url}/{source}/{model}', data
 
-		try:
-			url = f'{wave_url}/{source}/{model}'
-			response = requests.post(url, json=data, headers=headers)
-			response.raise_for_status()
-			return response.json()
-		except Exception as e:
-			body = ""
-			try:
-				body = response.text[:400] if 'response' in locals() else ""
-			except Exception:
-				pass
-			print(f"Request Err: {e} body={body!r}")
-			return None
-
-	# Create X402 Video ID — image-to-video variant.
-	#
-	# Used by Canvas multi-shot chaining: the last frame of shot N becomes
-	# the first frame of shot N+1, so character + scene continuity carries
-	# across cuts. Currently wired for HappyHorse 1.0 (others may follow).
-	def x402create_i2v(self, source: str, model: str, prompt: str,
-	                   duration: int, size: str, image_url: str):
-		headers = {
-			"Authorization": f'Bearer {wave_key}',
-			"Content-Type": "application/json"
-		}
+	def _i2v_request(self, source: str, model: str, prompt: str,
+					 duration: int, size: str, image_url: str):
 		def _to_aspect_ratio(s: str) -> str:
 			if s and ":" in s:
 				return s
@@ -253,33 +260,10 @@ class WaveApi:
 		if i2v_model == model:
 			# Caller passed an already-i2v path, leave it.
 			i2v_model = model
+		return f'{wave_url}/{source}/{i2v_model}', data
 
-		try:
-			url = f'{wave_url}/{source}/{i2v_model}'
-			response = requests.post(url, json=data, headers=headers)
-			response.raise_for_status()
-			return response.json()
-		except Exception as e:
-			body = ""
-			try:
-				body = response.text[:400] if 'response' in locals() else ""
-			except Exception:
-				pass
-			print(f"i2v Request Err: {e} body={body!r}")
-			return None
-
-	# Create X402 Image ID — text-to-image variant.
-	#
-	# Used by Canvas imagegen blocks. Same poll endpoint as t2v, just
-	# different request body shape per WaveSpeed image-gen schema.
-	def x402create_t2i(self, source: str, model: str, prompt: str,
-	                   aspect_ratio: str = "16:9",
-	                   resolution: str = "1k",
-	                   quality: str = "medium"):
-		headers = {
-			"Authorization": f'Bearer {wave_key}',
-			"Content-Type": "application/json"
-		}
+	def _t2i_request(self, source: str, model: str, prompt: str,
+					 aspect_ratio: str, resolution: str, quality: str):
 		# WaveSpeed t2i common shape — works for openai/gpt-image-2,
 		# google/nano-banana-2, bytedance/seedream-v5.0-lite.
 		data = {
@@ -288,9 +272,14 @@ class WaveApi:
 			"resolution": resolution if resolution else "1k",
 			"quality": quality if quality else "medium",
 		}
+		return f'{wave_url}/{source}/{model}', data
+
+	def _post(self, url: str, data: dict, tag: str):
 		try:
-			url = f'{wave_url}/{source}/{model}'
-			response = requests.post(url, json=data, headers=headers)
+			response = self._http.post(
+				url, json=data, headers=self._headers(),
+				timeout=(WAVE_CONNECT_TIMEOUT_S, WAVE_TIMEOUT_S),
+			)
 			response.raise_for_status()
 			return response.json()
 		except Exception as e:
@@ -299,9 +288,40 @@ class WaveApi:
 				body = response.text[:400] if 'response' in locals() else ""
 			except Exception:
 				pass
-			print(f"t2i Request Err: {e} body={body!r}")
+			print(f"{tag}Request Err: {e} body={body!r}")
 			return None
 
+	# Create Video ID
+	def create(self, param: AiModelReq):
+		url, data = self._create_request(param)
+		return self._post(url, data, "")
+
+	# Create X402 Video ID
+	def x402create(self, source: str, model: str, prompt: str, duration: int, size: str):
+		url, data = self._x402_request(source, model, prompt, duration, size)
+		return self._post(url, data, "")
+
+	# Create X402 Video ID — image-to-video variant.
+	#
+	# Used by Canvas multi-shot chaining: the last frame of shot N becomes
+	# the first frame of shot N+1, so character + scene continuity carries
+	# across cuts. Currently wired for HappyHorse 1.0 (others may follow).
+	def x402create_i2v(self, source: str, model: str, prompt: str,
+					   duration: int, size: str, image_url: str):
+		url, data = self._i2v_request(source, model, prompt, duration, size, image_url)
+		return self._post(url, data, "i2v ")
+
+	# Create X402 Image ID — text-to-image variant.
+	#
+	# Used by Canvas imagegen blocks. Same poll endpoint as t2v, just
+	# different request body shape per WaveSpeed image-gen schema.
+	def x402create_t2i(self, source: str, model: str, prompt: str,
+					   aspect_ratio: str = "16:9",
+					   resolution: str = "1k",
+					   quality: str = "medium"):
+		url, data = self._t2i_request(source, model, prompt, aspect_ratio, resolution, quality)
+		return self._post(url, data, "t2i ")
+
 	# Get Video By Video ID
 	def get_prediction_result(self, requestId: str):
 		url = f"{wave_url}/predictions/{requestId}/result"
@@ -309,12 +329,14 @@ class WaveApi:
 			"Authorization": f"Bearer {wave_key}"
 		}
 		try:
-			response = requests.get(url, headers=headers)
+			response = self._http.get(
+				url, headers=headers, timeout=(WAVE_CONNECT_TIMEOUT_S, WAVE_TIMEOUT_S),
+			)
 			response.raise_for_status()
 			return {
 				"success": True,
 				"data": response.json()
-			}	
+			}
 		except requests.exceptions.HTTPError as e:
 			return {
 				"success": False,
@@ -326,42 +348,32 @@ class WaveApi:
 			return {
 				"success": False,
 				"error": f"Err: {str(e)}"
-      }
+			}
 
-	# Get the model price
+	# Get the model price. Pure lookup: the x402 gate only writes a
+	# PayTable row once the facilitator has verified a payment, so an
+	# unpaid 402 challenge costs no DB round trip.
 	def calc_model_price(self, model: str, duration: int, size: str, messageid: str):
 		# Defensive: callers occasionally pass None for size/duration when
 		# the request didn't include those query params. The substring
 		# match below would AttributeError on None and 500 the request.
 		size = size if size is not None else ""
 		duration = duration if duration is not None else ""
-		amount_dict = amounts.get(model)
-		amount = "$0.02"
-		if amount_dict is not None:
+		amount = DEFAULT_PRICE
+		tiers = amounts.get(model)
+		if tiers is not None:
 			# "*" acts as an explicit wildcard: it matches any `size` value.
 			# Without this branch, `size.find("*")` returns -1 for sizes like
 			# "16:9" that don't contain a literal asterisk, causing every
 			# wildcard-priced model (8/10) to silently fall back to $0.02 —
 			# a 100x+ undercharge per call. Literal keys (e.g. "480", "720")
 			# continue to match via substring.
-			matched_tier = None
-			if "*" in amount_dict:
-				matched_tier = amount_dict["*"]
+			if "*" in tiers:
+				size_tier = "*"
 			else:
-				for key in amount_dict:
-					if size.find(key) != -1:
-						matched_tier = amount_dict[key]
-						break
-
-			if matched_tier is not None:
-				price = matched_tier.get(str(duration))
-				if price is not None:
-					amount = f"${price}"
-
-			pay = PayTableInstall.get_by_messageid(messageid)
-			if pay is None:
-				PayTableInstall.insert_pay("", model, size, duration, amount, messageid, "", False, True)
-			return {
+				size_tier = next((key for key in tiers if size.find(key) != -1), None)
+			amount = PRICE_TABLE.get((model, size_tier, str(duration)), DEFAULT_PRICE)
+		return {
         "amount": amount,
         "messageid": messageid
     }
@@ -384,6 +396,100 @@ class WaveApi:
 			return {"text": text, "image": image}
 		else:
 			return {"text": content, "image": None}
-			
+
+
+class AsyncWaveApi(WaveApi):
+	"""asyncio-native WaveSpeed client.
+
+	Same request shapes and return contract as WaveApi (dict or None for
+	the create calls, {"success": ...} for polls), but every call goes
+	through one shared aiohttp session so TLS connections to WaveSpeed
+	are kept alive and reused instead of re-handshaking per request.
+	The session is built lazily on first use (it must be created inside
+	the running loop) and closed from main.lifespan on shutdown.
+	"""
+
+	def __init__(self):
+		self._session = None
+
+	def _get_session(self):
+		if self._session is None or self._session.closed:
+			connector = aiohttp.TCPConnector(
+				limit=WAVE_POOL_LIMIT,
+				limit_per_host=WAVE_POOL_PER_HOST,
+				keepalive_timeout=WAVE_KEEPALIVE_S,
+				ttl_dns_cache=300,
+			)
+			self._session = aiohttp.ClientSession(
+				connector=connector,
+				timeout=aiohttp.ClientTimeout(
+					total=WAVE_TIMEOUT_S,
+					sock_connect=WAVE_CONNECT_TIMEOUT_S,
+				),
+			)
+		return self._session
+
+	async def close(self):
+		if self._session is not None and not self._session.closed:
+			await self._session.close()
+		self._session = None
+
+	async def _post(self, url: str, data: dict, tag: str):
+		body = ""
+		try:
+			async with self._get_session().post(url, json=data, headers=self._headers()) as response:
+				text = await response.text()
+				body = text[:400]
+				response.raise_for_status()
+				return json.loads(text)
+		except Exception as e:
+			print(f"{tag}Request Err: {e} body={body!r}")
+			return None
+
+	async def create(self, param: AiModelReq):
+		url, data = self._create_request(param)
+		return await self._post(url, data, "")
+
+	async def x402create(self, source: str, model: str, prompt: str, duration: int, size: str):
+		url, data = self._x402_request(source, model, prompt, duration, size)
+		return await self._post(url, data, "")
+
+	async def x402create_i2v(self, source: str, model: str, prompt: str,
+							 duration: int, size: str, image_url: str):
+		url, data = self._i2v_request(source, model, prompt, duration, size, image_url)
+		return await self._post(url, data, "i2v ")
+
+	async def x402create_t2i(self, source: str, model: str, prompt: str,
+							 aspect_ratio: str = "16:9",
+							 resolution: str = "1k",
+							 quality: str = "medium"):
+		url, data = self._t2i_request(source, model, prompt, aspect_ratio, resolution, quality)
+		return await self._post(url, data, "t2i ")
+
+	async def get_prediction_result(self, requestId: str):
+		url = f"{wave_url}/predictions/{requestId}/result"
+		headers = {
+			"Authorization": f"Bearer {wave_key}"
+		}
+		try:
+			async with self._get_session().get(url, headers=headers) as response:
+				if response.status >= 400:
+					return {
+						"success": False,
+						"error": f"HTTP Err: {response.status} {response.reason}",
+						"status_code": response.status,
+						"response_text": await response.text()
+					}
+				return {
+					"success": True,
+					"data": await response.json(content_type=None)
+				}
+		except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+			return {
+				"success": False,
+				"error": f"Err: {str(e)}"
+			}
+
 
 WaveApiInstance = WaveApi()
+AsyncWaveApiInstance = AsyncWaveApi()
@@ -110,7 +110,7 @@ app.include_router(canvas.router, prefix="/canvas", tags=["canvas"])
 app.include_router(director.router, prefix="/director", tags=["director"])
 
 
-from apps.redis.redis_client import RedisClientInstance
+from apps.redis.redis_client import AsyncRedisClientInstance
 
 STATUS_CACHE_KEY = "webui:status"
 STATUS_CACHE_TTL = 60  # seconds
@@ -119,7 +119,7 @@ STATUS_CACHE_TTL = 60  # seconds
 @app.get("/")
 async def get_status():
     # Try Redis first; fall through on any cache miss / error.
-    cached = RedisClientInstance.get_value_by_key(STATUS_CACHE_KEY)
+    cached = await AsyncRedisClientInstance.get_value_by_key(STATUS_CACHE_KEY)
     if cached is not None:
         return cached
 
@@ -129,7 +129,7 @@ async def get_status():
         "default_models": app.state.config.DEFAULT_MODELS,
         "default_prompt_suggestions": app.state.config.DEFAULT_PROMPT_SUGGESTIONS,
     }
-    RedisClientInstance.add_key_value(STATUS_CACHE_KEY, payload, ttl=STATUS_CACHE_TTL)
+    await AsyncRedisClientInstance.add_key_value(STATUS_CACHE_KEY, payload, ttl=STATUS_CACHE_TTL)
     return payload
 
 
@@ -0,0 +1,47 @@
+from peewee import Model, CharField, BigIntegerField
+from apps.web.internal.db import DB
+from typing import Optional
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+# Last fully processed block per chain scanner, so a restart resumes
+# where the previous process stopped instead of at "latest".
+class ChainCursor(Model):
+    name = CharField(unique=True)
+    block = BigIntegerField()
+    updated_at = BigIntegerField()
+
+    class Meta:
+        database = DB
+        table_name = "chain_cursor"
+
+
+class ChainCursorTable:
+    def __init__(self, db):
+        self.db = db
+        self.db.create_tables([ChainCursor])
+
+    # get last processed block, None if this scanner never ran
+    def get_block(self, name: str) -> Optional[int]:
+        try:
+            return ChainCursor.get(ChainCursor.name == name).block
+        except Exception:
+            return None
+
+    # save last processed block
+    def set_block(self, name: str, block: int) -> bool:
+        try:
+            now = int(time.time())
+            res = ChainCursor.update(block=block, updated_at=now).where(ChainCursor.name == name).execute()
+            if res == 0:
+                ChainCursor.create(name=name, block=block, updated_at=now)
+            return True
+        except Exception as e:
+            log.error(f"set_block: {e}")
+            return False
+
+
+ChainCursorInstance = ChainCursorTable(DB)
@@ -1,4 +1,80 @@
 from pydantic import BaseModel
+from peewee import Model, CharField, BigIntegerField
+from apps.web.internal.db import DB
+from playhouse.shortcuts import model_to_dict
+from typing import Optional
+import time
+import uuid
+
+import logging
+log = logging.getLogger(__name__)
 
 class UploadBase(BaseModel):
-  data: str
\ No newline at end of file
+  data: str
+
+
+class PresignUploadForm(BaseModel):
+  content_type: str
+  size: int
+
+
+class CompleteUploadForm(BaseModel):
+  key: str
+
+
+# Objects uploaded straight to OSS via a presigned policy, registered on
+# /upload/complete once we've checked what actually landed.
+class UploadedFile(Model):
+  id = CharField(unique=True)
+  user_id = CharField(index=True)
+  key = CharField(unique=True)
+  url = CharField()
+  content_type = CharField()
+  size = BigIntegerField()
+  created_at = BigIntegerField()
+
+  class Meta:
+    database = DB
+    table_name = "uploaded_file"
+
+
+class UploadedFileModel(BaseModel):
+  id: str
+  user_id: str
+  key: str
+  url: str
+  content_type: str
+  size: int
+  created_at: int
+
+
+class UploadedFileTable:
+  def __init__(self, db):
+    self.db = db
+    self.db.create_tables([UploadedFile])
+
+  def insert_upload(self, user_id: str, key: str, url: str, content_type: str, size: int) -> Optional[UploadedFileModel]:
+    try:
+      upload = UploadedFileModel(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        key=key,
+        url=url,
+        content_type=content_type,
+        size=size,
+        created_at=int(time.time()),
+      )
+      UploadedFile.create(**upload.model_dump())
+      return upload
+    except Exception as e:
+      log.error(f"insert_upload: {e}")
+      return None
+
+  def get_by_key(self, key: str) -> Optional[UploadedFileModel]:
+    try:
+      return UploadedFileModel(**model_to_dict(UploadedFile.get(UploadedFile.key == key)))
+    except Exception:
+      return None
+
+
+UploadedFilesInstance = UploadedFileTable(DB)
@@ -2,7 +2,7 @@ from peewee import Model, CharField, IntegerField, BigIntegerField
 from apps.web.internal.db import DB
 from pydantic import BaseModel
 from playhouse.shortcuts import model_to_dict
-from typing import Optional
+from typing import Dict, List, Optional, Set, Tuple
 import uuid
 import time
 
@@ -180,4 +180,40 @@ class PayTable:
             return pay_model
         except Exception:
             return None
+
+    # tx hashes among `hashes` already used for a successful payment
+    def used_hashes(self, hashes: List[str]) -> Set[str]:
+        try:
+            if not hashes:
+                return set()
+            rows = Pay.select(Pay.hash).where(Pay.hash.in_(hashes), Pay.status == True)
+            return {row.hash for row in rows}
+        except Exception as e:
+            log.error(f"used_hashes: {e}")
+            return set()
+
+    # pending currpay rows for many addresses, keyed by lower-cased address
+    def get_currpay_by_addresses(self, addresses: List[str]) -> Dict[str, PayModel]:
+        try:
+            if not addresses:
+                return {}
+            rows = Pay.select().where(
+                Pay.wallet_addr.in_(addresses), Pay.status == False, Pay.currpay == True
+            )
+            return {row.wallet_addr.lower(): PayModel(**model_to_dict(row)) for row in rows}
+        except Exception as e:
+            log.error(f"get_currpay_by_addresses: {e}")
+            return {}
+
+    # set hash + paid status for many rows in one transaction
+    def update_hash_status_bulk(self, updates: List[Tuple[str, str]]) -> bool:
+        try:
+            with self.db.atomic():
+                for id, hash in updates:
+                    Pay.update(status=True, currpay=True, hash=hash).where(Pay.id == id).execute()
+            return True
+        except Exception as e:
+            log.error(f"update_hash_status_bulk: {e}")
+            return False
+
 PayTableInstall = PayTable(DB)
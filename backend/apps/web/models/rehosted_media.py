@@ -0,0 +1,141 @@
+from peewee import Model, CharField, BigIntegerField, IntegerField, TextField
+from pydantic import BaseModel
+from playhouse.shortcuts import model_to_dict
+from apps.web.internal.db import DB
+from typing import Dict, List, Optional
+import hashlib
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+REHOST_PENDING = "pending"
+REHOST_DONE = "done"
+REHOST_FAILED = "failed"
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+# Vendor output URL -> copy of the same bytes in our OSS bucket. Keyed by
+# a hash of the source URL (signed vendor URLs are too long to index).
+class RehostedMedia(Model):
+    source_hash = CharField(unique=True)
+    source_url = TextField()
+    status = CharField(index=True)
+    content_sha256 = CharField(null=True, index=True)
+    key = CharField(null=True)
+    url = CharField(null=True)
+    size = BigIntegerField(default=0)
+    attempts = IntegerField(default=0)
+    error = TextField(null=True)
+    created_at = BigIntegerField()
+    updated_at = BigIntegerField()
+
+    class Meta:
+        database = DB
+        table_name = "rehosted_media"
+
+
+class RehostedMediaModel(BaseModel):
+    source_hash: str
+    source_url: str
+    status: str
+    content_sha256: Optional[str] = None
+    key: Optional[str] = None
+    url: Optional[str] = None
+    size: int = 0
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: int
+    updated_at: int
+
+
+class RehostedMediaTable:
+    def __init__(self, db):
+        self.db = db
+        self.db.create_tables([RehostedMedia])
+
+    # record a source to copy; no-op if it is already known
+    def add_pending(self, source_url: str) -> bool:
+        try:
+            now = int(time.time())
+            RehostedMedia.insert(
+                source_hash=url_hash(source_url), source_url=source_url,
+                status=REHOST_PENDING, created_at=now, updated_at=now,
+            ).on_conflict_ignore().execute()
+            return True
+        except Exception as e:
+            log.error(f"add_pending: {e}")
+            return False
+
+    def get_by_source(self, source_url: str) -> Optional[RehostedMediaModel]:
+        try:
+            row = RehostedMedia.get(RehostedMedia.source_hash == url_hash(source_url))
+            return RehostedMediaModel(**model_to_dict(row))
+        except Exception:
+            return None
+
+    # stable URL per source for every finished copy among `source_urls`
+    def get_done_urls(self, source_urls: List[str]) -> Dict[str, str]:
+        if not source_urls:
+            return {}
+        by_hash = {url_hash(u): u for u in source_urls}
+        try:
+            rows = RehostedMedia.select(RehostedMedia.source_hash, RehostedMedia.url).where(
+                (RehostedMedia.source_hash.in_(list(by_hash))) & (RehostedMedia.status == REHOST_DONE)
+            )
+            return {by_hash[r.source_hash]: r.url for r in rows}
+        except Exception as e:
+            log.error(f"get_done_urls: {e}")
+            return {}
+
+    # an existing copy of the same bytes, for dedup across source URLs
+    def get_done_by_content(self, content_sha256: str) -> Optional[RehostedMediaModel]:
+        try:
+            row = RehostedMedia.select().where(
+                (RehostedMedia.content_sha256 == content_sha256) & (RehostedMedia.status == REHOST_DONE)
+            ).first()
+            return RehostedMediaModel(**model_to_dict(row)) if row else None
+        except Exception:
+            return None
+
+    def mark_done(self, source_url: str, content_sha256: str, key: str, url: str, size: int) -> bool:
+        try:
+            RehostedMedia.update(
+                status=REHOST_DONE, content_sha256=content_sha256, key=key, url=url,
+                size=size, error=None, updated_at=int(time.time()),
+            ).where(RehostedMedia.source_hash == url_hash(source_url)).execute()
+            return True
+        except Exception as e:
+            log.error(f"mark_done: {e}")
+            return False
+
+    def mark_failed(self, source_url: str, error: str, max_attempts: int) -> bool:
+        try:
+            row = RehostedMedia.get(RehostedMedia.source_hash == url_hash(source_url))
+            row.attempts += 1
+            row.status = REHOST_FAILED if row.attempts >= max_attempts else REHOST_PENDING
+            row.error = error[:1000]
+            row.updated_at = int(time.time())
+            row.save()
+            return True
+        except Exception as e:
+            log.error(f"mark_failed: {e}")
+            return False
+
+    # pending sources untouched for `idle_s`, oldest first
+    def list_pending(self, idle_s: int, limit: int = 50) -> List[str]:
+        try:
+            rows = RehostedMedia.select(RehostedMedia.source_url).where(
+                (RehostedMedia.status == REHOST_PENDING)
+                & (RehostedMedia.updated_at < int(time.time()) - idle_s)
+            ).order_by(RehostedMedia.updated_at).limit(limit)
+            return [r.source_url for r in rows]
+        except Exception as e:
+            log.error(f"list_pending: {e}")
+            return []
+
+
+RehostedMediaInstance = RehostedMediaTable(DB)
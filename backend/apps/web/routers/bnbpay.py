@@ -1,9 +1,8 @@
 from fastapi import APIRouter, Request, Depends
-from web3 import Web3
 import os
-import asyncio
 
 from apps.web.models.pay import PayTableInstall
+from apps.web.util.chainrpc import ReceiptServiceInstance, find_transfer, receipt_ok, to_wei
 from utils.utils import get_current_user
 import logging
 
@@ -24,13 +23,8 @@ DLCP_RECEIVE_ADDRESS = os.getenv("DLCP_RECEIVE_ADDRESS", "0xeAc67D1B54730FF65D32
 # DLCP contract address on DBC Chain (18 decimals)
 DLCP_CONTRACT_ADDRESS = "0x9b09b4B7a748079DAd5c280dCf66428e48E38Cd6"
 
-w3 = Web3(Web3.HTTPProvider(BNB_RPC))
-w3_dbc = Web3(Web3.HTTPProvider(DBC_RPC))
 
-TOKEN_DECIMALS = 18
-
-
-def verify_transfer_log(w3_instance, tx_receipt, sender_address, receive_address,
+def verify_transfer_log(tx_receipt, sender_address, receive_address,
                         expected_contract, expected_amount_str, unit_multiplier=1):
     """Verify ERC20 Transfer event in transaction receipt.
 
@@ -43,46 +37,17 @@ def verify_transfer_log(w3_instance, tx_receipt, sender_address, receive_address
     USDT-denominated number ("0.75") but the actual on-chain DLP transfer
     is 1000× that (1 USDT = 1000 DLP).
     """
-    if tx_receipt.status != 1:
+    if not receipt_ok(tx_receipt):
         return False
 
-    # Parse expected amount to wei (18 decimals)
-    try:
-        expected_amount_float = float(expected_amount_str) * unit_multiplier
-        expected_amount_wei = int(expected_amount_float * (10 ** TOKEN_DECIMALS))
-    except (ValueError, TypeError):
+    expected_amount_wei = to_wei(expected_amount_str, unit_multiplier)
+    if expected_amount_wei is None:
         return False
 
-    for log in tx_receipt["logs"]:
-        event_signature_hash = w3_instance.keccak(
-            text="Transfer(address,address,uint256)"
-        ).hex()
-        if log["topics"][0].hex() == event_signature_hash:
-            from_address_hex = log["topics"][1].hex()[24:]
-            to_address_hex = log["topics"][2].hex()[24:]
-            from_address = w3_instance.to_checksum_address("0x" + from_address_hex)
-            to_address = w3_instance.to_checksum_address("0x" + to_address_hex)
-            if (
-                sender_address.lower() == from_address.lower()
-                and receive_address.lower() == to_address.lower()
-            ):
-                # Verify token contract address
-                log_contract = log["address"]
-                if log_contract.lower() != expected_contract.lower():
-                    continue
-
-                # Verify transferred amount from log data
-                try:
-                    actual_amount_wei = int(log["data"].hex(), 16)
-                except (ValueError, AttributeError):
-                    try:
-                        actual_amount_wei = int(log["data"], 16)
-                    except (ValueError, TypeError):
-                        continue
-
-                if actual_amount_wei >= expected_amount_wei:
-                    return True
-    return False
+    return find_transfer(
+        tx_receipt, receive_address, sender=sender_address,
+        token=expected_contract, min_wei=expected_amount_wei,
+    ) is not None
 
 
 @router.post("/check")
@@ -121,26 +86,27 @@ async def bnbcheck(request: Request, user=Depends(get_current_user)):
 
         # Choose chain and contract based on pay_type
         if pay_type == "points":
-            w3_chain = w3_dbc
+            rpc_url = DBC_RPC
             receive_addr = DLCP_RECEIVE_ADDRESS
             expected_contract = DLCP_CONTRACT_ADDRESS
         else:
-            w3_chain = w3
+            rpc_url = BNB_RPC
             receive_addr = USDT_TRAN_ADDRESS
             expected_contract = USDT_CONTRACT_ADDRESS
 
         try:
-            tx_receipt = await asyncio.to_thread(
-                w3_chain.eth.wait_for_transaction_receipt, hash, timeout=30
-            )
+            tx_receipt = await ReceiptServiceInstance.wait(rpc_url, hash, timeout=30)
         except Exception as e:
-            log.info(f"wait_for_transaction_receipt error: {e}")
+            log.info(f"receipt error: {e}")
+            return {"ok": False, "message": "check Failed"}
+        if tx_receipt is None:
+            log.info(f"receipt for {hash} not found within 30s")
             return {"ok": False, "message": "check Failed"}
 
         # Points-mode: amount column stores USDT-denominated value but the
         # on-chain DLP transfer is 1000× that, so scale before verifying.
         multiplier = 1000 if pay_type == "points" else 1
-        if verify_transfer_log(w3_chain, tx_receipt, address, receive_addr,
+        if verify_transfer_log(tx_receipt, address, receive_addr,
                                expected_contract, amount, unit_multiplier=multiplier):
             try:
                 if payinfo is None:
@@ -17,8 +17,13 @@ Two run modes:
           Idempotency / per-user rate limiting / pointpay charging are
           still on the v0.4 followup list — fine for owner-only MVP
           testing, gated by the admin role check.
+
+POST /canvas/jobs runs the same block on a background worker and
+returns a job id at once; see the "Background jobs" section below.
 """
 import asyncio
+import hashlib
+import json
 import logging
 import os
 import re
@@ -29,13 +34,21 @@ import uuid
 from datetime import datetime
 from urllib.parse import urlparse
 
-import requests
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import RedirectResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Any, Dict, List, Literal, Optional
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from apps.web.util.ffmpeg_pool import FfmpegPoolInstance, PRIORITY_ENCODE
+from apps.web.util.gencache import GenerationCacheInstance, content_hash, fingerprint
+from apps.web.util.inflight import Inflight, InflightTimeout
+from apps.web.util.jobqueue import JOB_FINAL, JobQueue
+from apps.web.util.postgen import PostGenInstance
+from apps.web.util.rehost import RehostInstance
+from apps.web.util.renditions import RENDITION_KINDS, RenditionError, RenditionInstance
+from apps.web.util.ledger import CreditLedger
 from utils.utils import get_current_user
 
 log = logging.getLogger(__name__)
@@ -74,7 +87,6 @@ VIDEOGEN_REGISTRY: Dict[str, Dict[str, str]] = {
 
 DEFAULT_VIDEOGEN_MODEL = "happyhorse-1.0"
 VIDEOGEN_POLL_TIMEOUT_S = 240.0
-VIDEOGEN_POLL_INTERVAL_S = 5.0
 
 # Image generation models. Keep slugs in sync with the frontend
 # Inspector dropdown so a config.model the user picked actually
@@ -90,7 +102,14 @@ IMAGEGEN_REGISTRY: Dict[str, Dict[str, str]] = {
 }
 DEFAULT_IMAGEGEN_MODEL = "gpt-image-2"
 IMAGEGEN_POLL_TIMEOUT_S = 90.0
-IMAGEGEN_POLL_INTERVAL_S = 3.0
+
+# Stitcher clip fetches: parallel downloads and a cap on total bytes
+# pulled for one stitch (8 clips x 40 MB fits comfortably).
+STITCH_DOWNLOAD_CONCURRENCY = int(os.getenv("STITCH_DOWNLOAD_CONCURRENCY", "4"))
+STITCH_MAX_TOTAL_BYTES = int(os.getenv("STITCH_MAX_TOTAL_BYTES", str(1024 ** 3)))
+# Kill limits for ffmpeg runs on the shared pool (apps/web/util/ffmpeg_pool).
+STITCH_FFMPEG_TIMEOUT_S = 600
+STITCH_POSTGEN_WAIT_S = float(os.getenv("STITCH_POSTGEN_WAIT_S", "60"))
 
 # Hostnames allowed as inputs.file_url for the imageref block. Anything
 # else is rejected before we make a server-side fetch (SSRF guard).
@@ -131,7 +150,15 @@ class CanvasRunBlockResponse(BaseModel):
     error: Optional[str] = None
     # Round-trip elapsed seconds so the frontend can show "took 4.2s".
     elapsed_s: float = 0.0
+    # "stub" / "real", "cached" for an Idempotency-Key replay, or
+    # "cache-hit" when an identical generation was served from the
+    # generation cache at no cost.
     mode: str = "stub"
+    # Optional per-phase breakdown (stitcher: download/encode/upload
+    # seconds plus per-clip bytes, attempts and cache hits).
+    timings: Optional[Dict[str, Any]] = None
+    # Video results: lazy poster / preview / hls links (see /renditions).
+    renditions: Optional[Dict[str, str]] = None
 
 
 @router.post("/run-block", response_model=CanvasRunBlockResponse)
@@ -154,47 +181,107 @@ async def run_block(
         corporate NAT users from each other.
       - Idempotency-Key header → Redis cache (15min TTL). Replays return
         the cached response with mode="cached" so a network retry can't
-        double-bill or double-generate.
+        double-bill or double-generate. A retry that arrives while the
+        original is still running waits for its result (CanvasInflight)
+        instead of starting a second generation.
       - Successful real-mode generations write a PayTable audit row so
         future billing reconciliation has a paper trail (currpay=False
         because Canvas doesn't yet flow through the x402 gate).
     """
     started = time.monotonic()
+    user_id = getattr(user, "id", None)
+
+    async def admit_and_execute():
+        mode, run_id_header, idem_key, cached, hold = await _admit_block(request, body, user)
+        if cached is not None:
+            cached["mode"] = "cached"
+            cached["elapsed_s"] = round(time.monotonic() - started, 3)
+            return CanvasRunBlockResponse(**cached)
+        return await _execute_block(
+            body, user_id, getattr(user, "role", None), mode, run_id_header, idem_key, started,
+            hold,
+        )
+
+    idem_key = (request.headers.get("idempotency-key") or "").strip()
+    return await _run_block_once(user_id, idem_key, started, admit_and_execute)
+
+
+# Single-flight per (user, Idempotency-Key): the idem cache only exists
+# once a block has finished, so a duplicate that arrives mid-generation
+# waits on the original here. Long enough for the slowest videogen poll.
+CANVAS_IDEM_WAIT_S = 900
+CanvasInflight = Inflight("canvas:inflight")
 
+
+async def _run_block_once(user_id, idem_key: str, started: float, admit_and_execute):
+    """Run admit_and_execute() at most once at a time per idempotency key.
+
+    Duplicates get the original's response (mode="cached" when it
+    succeeded) without being admitted, so they neither hold paid credit
+    nor start a generation. Without a key this is a plain call.
+    """
+    if not (user_id and idem_key):
+        return await admit_and_execute()
+
+    async def run():
+        return (await admit_and_execute()).model_dump()
+
+    try:
+        result, shared = await CanvasInflight.run(f"{user_id}:{idem_key}", run, CANVAS_IDEM_WAIT_S)
+    except InflightTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A request with this Idempotency-Key is still running; retry later.",
+        )
+    resp = CanvasRunBlockResponse(**result)
+    if shared:
+        if resp.status == "ok":
+            resp.mode = "cached"
+        resp.elapsed_s = round(time.monotonic() - started, 3)
+    return resp
+
+
+async def _admit_block(request: Request, body: CanvasRunBlockRequest, user,
+                       idem_key: Optional[str] = None):
+    """Request-side checks shared by run-block, jobs and run-graph.
+
+    Returns (mode, run_id, idem_key, cached_response_dict_or_None,
+    hold_id); raises 429 / 402 HTTPExceptions the same way for every
+    path. `idem_key` overrides the Idempotency-Key header (run-graph
+    derives one per node). A non-empty hold_id is a CanvasLedger
+    reservation that _execute_block must commit or release.
+    """
     # ----- Per-user rate limit (Redis sliding window) -----
     user_id = getattr(user, "id", None)
     if user_id:
-        from apps.redis.redis_client import RedisClientInstance
+        from apps.redis.redis_client import AsyncRedisClientInstance
         rate_key = f"canvas:ratelimit:user:{user_id}:{int(time.time()) // 60}"
         try:
-            r = RedisClientInstance.redis_client
-            if r is not None:
-                cnt = r.incr(rate_key)
-                if cnt == 1:
-                    r.expire(rate_key, 65)
-                if cnt > 60:
-                    raise HTTPException(
-                        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                        detail="Per-user rate limit: 60 requests/minute. Slow down.",
-                    )
+            # None when Redis is down/unconfigured: fail open.
+            cnt = await AsyncRedisClientInstance.incr_with_ttl(rate_key, 65)
+            if cnt is not None and cnt > 60:
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Per-user rate limit: 60 requests/minute. Slow down.",
+                )
         except HTTPException:
             raise
         except Exception as e:
             log.warning("canvas per-user rate-limit redis error: %s — failing open", e)
 
     # ----- Idempotency replay -----
-    idem_key = (request.headers.get("idempotency-key") or "").strip()
+    if idem_key is None:
+        idem_key = (request.headers.get("idempotency-key") or "").strip()
     if idem_key and user_id:
-        from apps.redis.redis_client import RedisClientInstance
+        from apps.redis.redis_client import AsyncRedisClientInstance
         cache_key = f"canvas:idem:{user_id}:{idem_key}"
-        cached = RedisClientInstance.get_value_by_key(cache_key)
+        cached = await AsyncRedisClientInstance.get_value_by_key(cache_key)
         if cached:
-            cached["mode"] = "cached"
-            cached["elapsed_s"] = round(time.monotonic() - started, 3)
-            return CanvasRunBlockResponse(**cached)
+            return CANVAS_RUN_MODE, "", idem_key, cached, ""
 
     # ----- Mode resolution: stub / real-admin / real-paid -----
     mode = CANVAS_RUN_MODE
+    hold = ""
     header_mode = (request.headers.get("x-canvas-mode") or "").lower().strip()
     run_id_header = (request.headers.get("x-canvas-run-id") or "").strip()
     if header_mode == "real":
@@ -205,9 +292,13 @@ async def run_block(
             # Non-admin real-mode requires a paid Redis bucket for this run.
             # Always recompute cost server-side from the canonical pricing
             # function — never trust client-supplied cost_cr (a malicious
-            # client could send 0 and dodge billing).
+            # client could send 0 and dodge billing). The cost is held
+            # atomically so concurrent blocks of one run can't overspend.
             block_cost = _canvas_block_cost(body.block_type, body.config or {})
-            ok, _remaining, err = _canvas_paid_check(user_id, run_id_header, block_cost)
+            hold = uuid.uuid4().hex
+            ok, _remaining, err = await CanvasLedger.reserve(
+                user_id, run_id_header, block_cost, hold,
+            )
             if not ok:
                 raise HTTPException(
                     status_code=status.HTTP_402_PAYMENT_REQUIRED,
@@ -217,22 +308,35 @@ async def run_block(
                     ),
                 )
             mode = "real"
+    return mode, run_id_header, idem_key, None, hold
+
+
+async def _execute_block(
+    body: CanvasRunBlockRequest,
+    user_id: Optional[str],
+    user_role: Optional[str],
+    mode: str,
+    run_id_header: str,
+    idem_key: str,
+    started: float,
+    hold: str = "",
+) -> CanvasRunBlockResponse:
+    """Run an admitted block, then settle billing, audit and idem cache."""
+    try:
+        if mode == "real":
+            resp = await _run_real(body, started)
+        else:
+            resp = await _run_stub(body, started)
+    except BaseException:
+        await CanvasLedger.release(user_id, run_id_header, hold)
+        raise
 
-    if mode == "real":
-        resp = await _run_real(body, started)
+    # Settle the paid-bucket hold taken at admission: charge what the
+    # block actually cost on success, hand it back otherwise.
+    if resp.status == "ok" and mode == "real" and resp.cost_cr > 0:
+        await CanvasLedger.commit(user_id, run_id_header, hold, resp.cost_cr)
     else:
-        resp = await _run_stub(body, started)
-
-    # On successful non-admin real-mode generation, decrement the paid
-    # bucket so the next block in the run can't over-spend.
-    if (
-        resp.status == "ok"
-        and mode == "real"
-        and run_id_header
-        and getattr(user, "role", None) != "admin"
-        and resp.cost_cr > 0
-    ):
-        _canvas_paid_consume(user_id, run_id_header, resp.cost_cr)
+        await CanvasLedger.release(user_id, run_id_header, hold)
 
     # ----- Audit row + idempotency cache for successful results -----
     if resp.status == "ok" and mode == "real" and resp.cost_cr > 0:
@@ -254,8 +358,8 @@ async def run_block(
 
     if idem_key and user_id and resp.status == "ok":
         try:
-            from apps.redis.redis_client import RedisClientInstance
-            RedisClientInstance.add_key_value(
+            from apps.redis.redis_client import AsyncRedisClientInstance
+            await AsyncRedisClientInstance.add_key_value(
                 f"canvas:idem:{user_id}:{idem_key}",
                 resp.model_dump(),
                 ttl=900,  # 15 min — long enough for retries, short enough to not stale-replay.
@@ -266,6 +370,373 @@ async def run_block(
     return resp
 
 
+# ===========================================================================
+# Background jobs
+# ===========================================================================
+#
+# POST /jobs takes the same body and headers as /run-block but returns a
+# job id immediately; a worker from CanvasJobQueue runs the block, so a
+# proxy timeout or closed tab no longer throws away a generation we are
+# already paying WaveSpeed for. With an Idempotency-Key the job id is
+# derived from (user, key) and resubmitting returns the same job. Jobs
+# submitted without one get a server-generated key, so a redelivered job
+# (worker died mid-run) still first checks the idem cache the original
+# run wrote, and at-least-once delivery doesn't double-generate.
+
+class CanvasJobResponse(BaseModel):
+    job_id: str
+    block_id: str
+    status: Literal["queued", "running", "done", "failed"]
+    result: Optional[CanvasRunBlockResponse] = None
+    error: Optional[str] = None
+    attempts: int = 0
+
+
+def _canvas_job_id(user_id: str, idem_key: str) -> Optional[str]:
+    if not (user_id and idem_key):
+        return None
+    return hashlib.sha256(f"{user_id}:{idem_key}".encode()).hexdigest()[:32]
+
+
+def _job_response(job: Dict[str, Any]) -> CanvasJobResponse:
+    return CanvasJobResponse(
+        job_id=job["id"],
+        block_id=(job.get("payload") or {}).get("body", {}).get("block_id", ""),
+        status=job["status"],
+        result=job.get("result"),
+        error=job.get("error"),
+        attempts=int(job.get("attempts") or 0),
+    )
+
+
+async def _run_block_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    p = job["payload"]
+    started = time.monotonic()
+    if p.get("idem_key") and p.get("user_id"):
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        cached = await AsyncRedisClientInstance.get_value_by_key(
+            f"canvas:idem:{p['user_id']}:{p['idem_key']}"
+        )
+        if cached:
+            cached["mode"] = "cached"
+            return cached
+    resp = await _execute_block(
+        CanvasRunBlockRequest(**p["body"]),
+        p.get("user_id"), p.get("user_role"), p["mode"],
+        p.get("run_id") or "", p.get("idem_key") or "", started,
+        p.get("hold") or "",
+    )
+    return resp.model_dump()
+
+
+CanvasJobQueue = JobQueue("canvas:jobs", _run_block_job)
+
+
+async def _get_own_job(job_id: str, user) -> Dict[str, Any]:
+    job = await CanvasJobQueue.get(job_id)
+    if job is None or job.get("user_id") != str(getattr(user, "id", "") or ""):
+        raise HTTPException(status_code=404, detail="job not found")
+    return job
+
+
+@router.post("/jobs", response_model=CanvasJobResponse, status_code=202)
+@limiter.limit("60/minute")
+async def submit_block_job(
+    request: Request,
+    body: CanvasRunBlockRequest,
+    user=Depends(get_current_user),
+):
+    """Queue a canvas block and return its job id without waiting.
+
+    Same admission as /run-block (rate limits, paid-bucket check,
+    Idempotency-Key replay). Poll GET /jobs/{id} or follow
+    GET /jobs/{id}/events for the result.
+    """
+    user_id = str(getattr(user, "id", "") or "")
+    mode, run_id_header, idem_key, cached, hold = await _admit_block(request, body, user)
+    if cached is not None:
+        cached["mode"] = "cached"
+    if not idem_key:
+        # Lets a redelivery replay this job's first result.
+        idem_key = f"job:{uuid.uuid4().hex}"
+    payload = {
+        "body": body.model_dump(),
+        "user_id": user_id,
+        "user_role": getattr(user, "role", None),
+        "mode": mode,
+        "run_id": run_id_header,
+        "idem_key": idem_key,
+        "hold": hold,
+    }
+    job = await CanvasJobQueue.submit(
+        payload, user_id=user_id, job_id=_canvas_job_id(user_id, idem_key), result=cached,
+    )
+    if hold and (job.get("payload") or {}).get("hold") != hold:
+        # Resubmission of an existing job: it runs on its own hold.
+        await CanvasLedger.release(user_id, run_id_header, hold)
+    return _job_response(job)
+
+
+@router.get("/jobs/{job_id}", response_model=CanvasJobResponse)
+async def get_block_job(job_id: str, user=Depends(get_current_user)):
+    return _job_response(await _get_own_job(job_id, user))
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_block_job(job_id: str, user=Depends(get_current_user)):
+    """SSE feed of job status changes; ends once the job is done/failed."""
+    job = await _get_own_job(job_id, user)
+
+    async def events():
+        current = job
+        last_status = None
+        deadline = time.monotonic() + 900
+        while time.monotonic() < deadline:
+            if current is not None and current["status"] != last_status:
+                last_status = current["status"]
+                yield f"data: {_job_response(current).model_dump_json()}\n\n"
+                if last_status in JOB_FINAL:
+                    break
+            await asyncio.sleep(1.0)
+            current = await CanvasJobQueue.get(job_id)
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ===========================================================================
+# Server-side graph execution
+# ===========================================================================
+#
+# POST /run-graph executes a saved workspace in one request instead of the
+# frontend's serial run-block walk. Blocks become runnable as soon as all
+# of their upstreams are ok, and up to `concurrency` run at once, so
+# independent videogen branches overlap and wall-clock time approaches
+# the longest path rather than the sum of all blocks. Input threading
+# mirrors gatherInputs() in src/lib/components/canvas/runner.ts and each
+# block goes through the same admission/execution as /run-block, with
+# Idempotency-Key `<run_id>:<node_id>` — the key the frontend runner
+# uses — so a re-run (from either path) replays finished blocks.
+
+CANVAS_GRAPH_CONCURRENCY = int(os.getenv("CANVAS_GRAPH_CONCURRENCY", "4"))
+CANVAS_GRAPH_MAX_CONCURRENCY = 8
+
+
+class CanvasRunGraphRequest(BaseModel):
+    workspace_id: str
+    # Max blocks in flight; defaults to CANVAS_GRAPH_CONCURRENCY.
+    concurrency: Optional[int] = None
+
+
+def _graph_topology(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]):
+    """Return (nodes_by_id, incoming, outgoing); ValueError on a cycle."""
+    nodes_by_id = {n["id"]: n for n in nodes if n.get("id")}
+    incoming: Dict[str, List[str]] = {nid: [] for nid in nodes_by_id}
+    outgoing: Dict[str, List[str]] = {nid: [] for nid in nodes_by_id}
+    for e in edges:
+        src, tgt = e.get("source"), e.get("target")
+        if src in nodes_by_id and tgt in nodes_by_id:
+            incoming[tgt].append(src)
+            outgoing[src].append(tgt)
+
+    in_degree = {nid: len(srcs) for nid, srcs in incoming.items()}
+    queue = [nid for nid, d in in_degree.items() if d == 0]
+    visited = 0
+    while queue:
+        nid = queue.pop()
+        visited += 1
+        for child in outgoing[nid]:
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                queue.append(child)
+    if visited != len(nodes_by_id):
+        raise ValueError(
+            "Canvas has a cycle. Stitcher must be the last block; remove the wire that forms a loop."
+        )
+    return nodes_by_id, incoming, outgoing
+
+
+def _graph_inputs(
+    node: Dict[str, Any],
+    sources: List[str],
+    results: Dict[str, CanvasRunBlockResponse],
+    nodes_by_id: Dict[str, Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Build one block's inputs from its ok upstream results (see runner.ts)."""
+    incoming = [
+        (nodes_by_id[sid], results[sid]) for sid in sources
+        if sid in results and results[sid].status == "ok"
+    ]
+    type_key = (node.get("data") or {}).get("typeKey")
+    inputs: Dict[str, Any] = {}
+    if type_key in ("imagegen", "videogen"):
+        for src, res in incoming:
+            if res.output_kind == "text" or (src.get("data") or {}).get("typeKey") == "prompt":
+                inputs["prompt"] = res.output_text or ""
+                break
+        for _src, res in incoming:
+            if res.output_kind == "image":
+                inputs["first_frame_url"] = res.output_url
+                break
+        if type_key == "videogen":
+            for src, res in incoming:
+                if res.output_kind == "video" and (src.get("data") or {}).get("typeKey") == "videogen":
+                    inputs["chain_from_video_url"] = res.output_url
+                    break
+    elif type_key == "stitcher":
+        inputs["clips"] = [res.output_url for _src, res in incoming if res.output_kind == "video"]
+    return inputs
+
+
+async def _run_graph_node(
+    request: Request, user, run_id: str, node: Dict[str, Any], inputs: Dict[str, Any],
+) -> CanvasRunBlockResponse:
+    started = time.monotonic()
+    data = node.get("data") or {}
+    try:
+        body = CanvasRunBlockRequest(
+            block_id=node["id"],
+            block_type=data.get("typeKey"),
+            config=data.get("config") or {},
+            inputs=inputs,
+        )
+        node_key = f"{run_id}:{node['id']}"
+
+        async def admit_and_execute():
+            mode, run_id_header, idem_key, cached, hold = await _admit_block(
+                request, body, user, idem_key=node_key,
+            )
+            if cached is not None:
+                cached["mode"] = "cached"
+                cached["elapsed_s"] = round(time.monotonic() - started, 3)
+                return CanvasRunBlockResponse(**cached)
+            return await _execute_block(
+                body, getattr(user, "id", None), getattr(user, "role", None),
+                mode, run_id_header, idem_key, started, hold,
+            )
+
+        return await _run_block_once(getattr(user, "id", None), node_key, started, admit_and_execute)
+    except HTTPException as e:
+        error = f"HTTP {e.status_code}: {e.detail}"
+    except Exception as e:
+        log.exception("canvas run-graph block %s crashed", node.get("id"))
+        error = f"run-graph error: {e}"
+    return CanvasRunBlockResponse(
+        block_id=node["id"], status="failed", error=error,
+        elapsed_s=round(time.monotonic() - started, 2),
+    )
+
+
+def _sse(payload: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@router.post("/run-graph")
+@limiter.limit("10/minute")
+async def run_graph(
+    request: Request,
+    body: CanvasRunGraphRequest,
+    user=Depends(get_current_user),
+):
+    """Run a saved workspace server-side, streaming progress over SSE.
+
+    Accepts the same X-Canvas-Mode / X-Canvas-Run-Id headers as
+    /run-block. Events:
+      {"event": "block", "block_id", "state": "running"}
+      {"event": "block", "block_id", "state": "ok"|"failed", "result": {...}}
+      {"event": "block", "block_id", "state": "skipped"}   (never ran)
+      {"event": "done", "total_elapsed_s", "total_cost_cr", "failed_at"}
+
+    Like the frontend runner, the first failure stops new blocks from
+    starting. Blocks already in flight are left to finish even if the
+    client disconnects, so their (paid) results land in the idem cache
+    and a retry with the same run id replays them.
+    """
+    from apps.web.models.canvas_workspace import CanvasWorkspaceInstall
+
+    ws = CanvasWorkspaceInstall.get_by_id(body.workspace_id, user.id)
+    if ws is None:
+        raise HTTPException(status_code=404, detail="workspace not found")
+    nodes = json.loads(ws.nodes or "[]")
+    edges = json.loads(ws.edges or "[]")
+    try:
+        nodes_by_id, incoming, outgoing = _graph_topology(nodes, edges)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    run_id = (request.headers.get("x-canvas-run-id") or "").strip() or uuid.uuid4().hex
+    concurrency = max(1, min(body.concurrency or CANVAS_GRAPH_CONCURRENCY,
+                             CANVAS_GRAPH_MAX_CONCURRENCY))
+
+    # Paid real-mode: per-block holds already stop parallel blocks from
+    # overrunning the bucket; this up-front check just avoids starting a
+    # graph whose later blocks would be refused.
+    header_mode = (request.headers.get("x-canvas-mode") or "").lower().strip()
+    if header_mode == "real" and getattr(user, "role", None) != "admin":
+        total_cost = sum(
+            _canvas_block_cost((n.get("data") or {}).get("typeKey") or "",
+                               (n.get("data") or {}).get("config") or {})
+            for n in nodes_by_id.values()
+        )
+        ok, _remaining, err = await CanvasLedger.check(user.id, run_id, total_cost)
+        if not ok:
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail=f"Canvas real-mode requires payment: {err}.",
+            )
+
+    async def events():
+        started = time.monotonic()
+        results: Dict[str, CanvasRunBlockResponse] = {}
+        waiting = {nid: len(srcs) for nid, srcs in incoming.items()}
+        # Keep the saved node order for ready blocks so runs are repeatable.
+        ready = [nid for nid in nodes_by_id if waiting[nid] == 0]
+        running: Dict[asyncio.Task, str] = {}
+        total_cost = 0
+        failed_at = None
+
+        while ready or running:
+            while ready and failed_at is None and len(running) < concurrency:
+                nid = ready.pop(0)
+                inputs = _graph_inputs(nodes_by_id[nid], incoming[nid], results, nodes_by_id)
+                task = asyncio.create_task(
+                    _run_graph_node(request, user, run_id, nodes_by_id[nid], inputs)
+                )
+                running[task] = nid
+                yield _sse({"event": "block", "block_id": nid, "state": "running"})
+            if not running:
+                break
+            done, _pending = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                nid = running.pop(task)
+                resp = task.result()
+                results[nid] = resp
+                total_cost += resp.cost_cr or 0
+                yield _sse({"event": "block", "block_id": nid, "state": resp.status,
+                            "result": resp.model_dump()})
+                if resp.status != "ok":
+                    failed_at = failed_at or nid
+                    continue
+                for child in outgoing[nid]:
+                    waiting[child] -= 1
+                    if waiting[child] == 0:
+                        ready.append(child)
+
+        for nid in nodes_by_id:
+            if nid not in results:
+                yield _sse({"event": "block", "block_id": nid, "state": "skipped"})
+        yield _sse({
+            "event": "done",
+            "run_id": run_id,
+            "total_elapsed_s": round(time.monotonic() - started, 2),
+            "total_cost_cr": total_cost,
+            "failed_at": failed_at,
+        })
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
 async def _run_stub(body: CanvasRunBlockRequest, started: float) -> CanvasRunBlockResponse:
     """Mock dispatch: pretends to run, returns a deterministic sample.
 
@@ -388,11 +859,11 @@ async def _run_real(body: CanvasRunBlockRequest, started: float) -> CanvasRunBlo
         if bt == "imageref":
             return await _real_imageref(body, started)
         if bt == "videogen":
-            return await _real_videogen(body, started)
+            return _with_renditions(await _real_videogen(body, started))
         if bt == "imagegen":
             return await _real_imagegen(body, started)
         if bt == "stitcher":
-            return await _real_stitcher(body, started)
+            return _with_renditions(await _real_stitcher(body, started))
         # voice not yet implemented for real mode — fall back.
         log.info("canvas real-mode fallback to stub for block_type=%s", bt)
         return await _run_stub(body, started)
@@ -407,6 +878,16 @@ async def _run_real(body: CanvasRunBlockRequest, started: float) -> CanvasRunBlo
         )
 
 
+def _with_renditions(resp: CanvasRunBlockResponse) -> CanvasRunBlockResponse:
+    """Attach preview links to a successful video result.
+
+    Nothing is encoded here; each rendition is built on its first GET.
+    """
+    if resp.status == "ok" and resp.output_kind == "video" and resp.output_url:
+        resp.renditions = RenditionInstance.links(resp.output_url)
+    return resp
+
+
 async def _real_imageref(body: CanvasRunBlockRequest, started: float) -> CanvasRunBlockResponse:
     """SSRF-checked URL pass-through.
 
@@ -445,65 +926,34 @@ async def _real_imageref(body: CanvasRunBlockRequest, started: float) -> CanvasR
 
 
 async def _extract_last_frame_to_oss(video_url: str) -> Optional[str]:
-    """Download a video, ffmpeg-extract the last frame, upload to OSS.
+    """Fetch a video's tail, ffmpeg-extract the last frame, upload to OSS.
 
     Used by multi-shot chaining: the last frame of the upstream videogen
     shot becomes the first frame of the next videogen, fed as `image=`
     to the i2v endpoint. Returns a public HTTPS URL on the OSS bucket
     or None on failure (caller decides whether to fall back to t2v).
     """
-    try:
-        # 1. Download the source video.
-        tmp = tempfile.mkdtemp(prefix="canvas_chain_")
-        src = os.path.join(tmp, "src.mp4")
-        r = await asyncio.to_thread(requests.get, video_url, timeout=60, stream=True)
-        r.raise_for_status()
-        with open(src, "wb") as f:
-            for chunk in r.iter_content(65536):
-                f.write(chunk)
-
-        # 2. Probe duration so we can seek to a frame that actually exists
-        #    (ffmpeg's `-sseof` is fragile across container variants).
-        probe_args = [
-            "ffprobe", "-v", "error", "-show_entries", "format=duration",
-            "-of", "default=noprint_wrappers=1:nokey=1", src,
-        ]
-        probe = await asyncio.create_subprocess_exec(
-            *probe_args,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        so, _se = await probe.communicate()
-        duration = float(so.decode().strip() or 0)
-        seek = max(0.0, duration - 0.1)
-
-        out_png = os.path.join(tmp, "last.png")
-        ff = await asyncio.create_subprocess_exec(
-            "ffmpeg", "-y", "-ss", f"{seek:.3f}", "-i", src,
-            "-vframes", "1", "-q:v", "2", "-update", "1", out_png,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-        )
-        await ff.communicate()
-        if ff.returncode != 0 or not os.path.exists(out_png) or os.path.getsize(out_png) == 0:
-            log.warning("last-frame extract failed for %s", video_url)
-            return None
+    from apps.web.util.mediacache import MediaCacheInstance
+    from apps.web.util.postgen import last_frame_from_file
+    from apps.web.util.tailframe import TailFetcherInstance
 
-        # 3. Upload to OSS with a clean key + Content-Type.
-        from apps.web.util.aliossutils import AliOSSUtil
-        oss_url_prefix = os.getenv("FILE_OSS_HK_URL", "")
-        date = datetime.utcnow().strftime("%Y/%m/%d")
-        key = f"canvas/refframes/{date}/lastframe_{uuid.uuid4().hex}.png"
-        with open(out_png, "rb") as f:
-            data = f.read()
-        bucket = AliOSSUtil._get_bucket()
-        result = await asyncio.to_thread(
-            bucket.put_object, key, data, {"Content-Type": "image/png"},
-        )
-        if result.status != 200:
-            log.warning("OSS put_object status=%s for last-frame", result.status)
-            return None
-        return f"{oss_url_prefix}{key}"
+    tmp = tempfile.mkdtemp(prefix="canvas_chain_")
+    try:
+        # 1. A clip already in the media cache costs nothing to read.
+        cached = MediaCacheInstance.peek(video_url)
+        if cached is None:
+            # Otherwise range-read just moov + the last GOP into a sparse
+            # file; None means the clip needs a full download.
+            tail = await TailFetcherInstance.fetch(video_url, tmp)
+            if tail is not None:
+                frame = await last_frame_from_file(tail.path, tmp, video_url, tail.duration)
+                if frame:
+                    return frame
+                log.info("tail-frame decode of %s failed; downloading whole clip", video_url[:120])
+        # Full download through the media cache; the stitcher reads the
+        # same clip later without downloading it again.
+        async with MediaCacheInstance.open(video_url) as src:
+            return await last_frame_from_file(src, tmp, video_url)
     except Exception as e:
         log.exception("last-frame extraction errored: %s", e)
         return None
@@ -515,17 +965,57 @@ async def _extract_last_frame_to_oss(video_url: str) -> Optional[str]:
             pass
 
 
+async def _gen_cache_key(kind: str, model_path: str, prompt: str, config: Dict[str, Any],
+                         ref_urls, clip_urls=(), **params) -> Optional[str]:
+    """Generation-cache fingerprint, or None if caching doesn't apply.
+
+    Off unless GEN_CACHE_ENABLED; a block can opt out with
+    `config.cache = false`. Reference media are hashed by content, and
+    a reference we can't fetch disables caching for that run. Chained
+    clips (`clip_urls`) are never downloaded for this: they use a
+    content hash we already have, else their URL.
+    """
+    if not GenerationCacheInstance.enabled or config.get("cache") is False:
+        return None
+    refs = []
+    for url in clip_urls:
+        if not url:
+            continue
+        digest = await content_hash(url, fetch=False)
+        refs.append(digest or "url:" + hashlib.sha256(url.encode()).hexdigest())
+    for url in ref_urls:
+        if not url:
+            continue
+        digest = await content_hash(url)
+        if digest is None:
+            return None
+        refs.append(digest)
+    return fingerprint(kind, model_path, prompt, seed=config.get("seed"), refs=refs, **params)
+
+
+async def _gen_cache_hit(body: CanvasRunBlockRequest, output_kind: str, hit: Dict[str, Any],
+                         started: float) -> CanvasRunBlockResponse:
+    # cost_cr=0: the paid-bucket hold is released, nothing is billed.
+    # The stored URL is the vendor's; prefer our OSS copy once it exists.
+    return CanvasRunBlockResponse(
+        block_id=body.block_id, status="ok", output_kind=output_kind,
+        output_url=await RehostInstance.resolve(hit["output_url"]), cost_cr=0,
+        elapsed_s=round(time.monotonic() - started, 2), mode="cache-hit",
+    )
+
+
 async def _real_videogen(body: CanvasRunBlockRequest, started: float) -> CanvasRunBlockResponse:
     """Call WaveAPI x402create + poll for prediction result.
 
     Reuses the same MODEL_REGISTRY entries as the existing /creator
-    standalone endpoints. Polls every 5s up to 4 minutes — wan-2.7
-    @720p typically returns in 30-60s. Returns the raw OSS-hosted MP4
-    URL straight from WaveSpeed; we don't re-host (yet) so make sure
-    the stitcher downloads in time before the URL expires (typically
-    ~24h, plenty for a single Run All).
+    standalone endpoints. Waits on the shared prediction poller for up
+    to 4 minutes — wan-2.7 @720p typically returns in 30-60s. Returns the raw OSS-hosted MP4
+    URL straight from WaveSpeed (expires after ~24h) and hands it to the
+    rehost worker, which copies it to our bucket; saved workspaces and
+    later cache hits switch to that copy (see apps/web/util/rehost).
     """
-    from apps.web.ai.wave import WaveApiInstance
+    from apps.web.ai.wave import AsyncWaveApiInstance
+    from apps.web.ai.poller import PredictionPollerInstance, parse_prediction
     config = body.config or {}
     inputs = body.inputs or {}
     prompt = (inputs.get("prompt") or config.get("text") or "").strip()
@@ -555,9 +1045,26 @@ async def _real_videogen(body: CanvasRunBlockRequest, started: float) -> CanvasR
     # other models.
     chain_url = inputs.get("chain_from_video_url") or ""
     image_url = inputs.get("first_frame_url") or ""
+
+    # Only i2v-capable models take the reference media into account.
+    i2v = "happyhorse" in cfg["model"]
+    fp = await _gen_cache_key("videogen", cfg["model"], prompt, config,
+                              (image_url,) if i2v else (), (chain_url,) if i2v else (),
+                              duration=duration, resolution=size)
+    if fp:
+        hit = await GenerationCacheInstance.get("videogen", fp)
+        if hit:
+            resp = await _gen_cache_hit(body, "video", hit, started)
+            PostGenInstance.submit(resp.output_url)
+            return resp
+
     if chain_url and "happyhorse" in cfg["model"]:
-        log.info("videogen chain: extracting last frame from %s", chain_url[:80])
-        extracted = await _extract_last_frame_to_oss(chain_url)
+        # Usually ready already: the upstream shot's post-gen job extracts
+        # it while this prompt is being assembled.
+        extracted = await PostGenInstance.last_frame(chain_url)
+        if not extracted:
+            log.info("videogen chain: extracting last frame from %s", chain_url[:80])
+            extracted = await _extract_last_frame_to_oss(chain_url)
         if extracted:
             image_url = extracted
         else:
@@ -565,13 +1072,12 @@ async def _real_videogen(body: CanvasRunBlockRequest, started: float) -> CanvasR
 
     # Kick off the generation.
     if image_url and "happyhorse" in cfg["model"]:
-        create_resp = await asyncio.to_thread(
-            WaveApiInstance.x402create_i2v,
+        create_resp = await AsyncWaveApiInstance.x402create_i2v(
             cfg["vendor"], cfg["model"], prompt, duration, size, image_url,
         )
     else:
-        create_resp = await asyncio.to_thread(
-            WaveApiInstance.x402create, cfg["vendor"], cfg["model"], prompt, duration, size
+        create_resp = await AsyncWaveApiInstance.x402create(
+            cfg["vendor"], cfg["model"], prompt, duration, size
         )
     if not create_resp or create_resp.get("code") != 200:
         return CanvasRunBlockResponse(
@@ -587,18 +1093,14 @@ async def _real_videogen(body: CanvasRunBlockRequest, started: float) -> CanvasR
             elapsed_s=round(time.monotonic() - started, 2), mode="real",
         )
 
-    # Poll.
-    deadline = time.monotonic() + VIDEOGEN_POLL_TIMEOUT_S
+    # Status comes from the shared poller, which polls each request id
+    # once per interval however many callers are waiting on it.
     last_status = "unknown"
-    while time.monotonic() < deadline:
-        await asyncio.sleep(VIDEOGEN_POLL_INTERVAL_S)
-        poll = await asyncio.to_thread(WaveApiInstance.get_prediction_result, request_id)
-        if not poll.get("success"):
+    async for poll in PredictionPollerInstance.watch(request_id, VIDEOGEN_POLL_TIMEOUT_S):
+        status, inner = parse_prediction(poll)
+        if not status:
             continue
-        data = poll.get("data") or {}
-        # WaveSpeed wraps the prediction inside another `data` field.
-        inner = data.get("data") if isinstance(data.get("data"), dict) else data
-        last_status = (inner.get("status") or "").lower()
+        last_status = status
         if last_status in ("completed", "succeeded", "success"):
             outputs = inner.get("outputs") or []
             output_url = outputs[0] if outputs else inner.get("output") or inner.get("output_url")
@@ -608,6 +1110,14 @@ async def _real_videogen(body: CanvasRunBlockRequest, started: float) -> CanvasR
                     error=f"videogen completed but no output_url; raw: {inner}",
                     elapsed_s=round(time.monotonic() - started, 2), mode="real",
                 )
+            if fp:
+                await GenerationCacheInstance.put(fp, {"output_url": output_url})
+            # Fetch, probe, last-frame and normalize in the background so
+            # the next chained shot and the stitcher find them ready.
+            PostGenInstance.submit(output_url)
+            # Copy it off the expiring vendor CDN; responses and saved
+            # workspaces switch to our URL once the copy exists.
+            RehostInstance.submit(output_url)
             return CanvasRunBlockResponse(
                 block_id=body.block_id, status="ok", output_kind="video",
                 output_url=output_url,
@@ -649,24 +1159,62 @@ async def _real_stitcher(body: CanvasRunBlockRequest, started: float) -> CanvasR
             elapsed_s=round(time.monotonic() - started, 2), mode="real",
         )
 
+    from contextlib import AsyncExitStack
+    from apps.web.util.mediacache import ByteBudget, MediaCacheInstance
+
     tmp = tempfile.mkdtemp(prefix="canvas_stitch_")
+    clip_stack = AsyncExitStack()
     try:
-        local_files: List[str] = []
-        for i, url in enumerate(clips):
-            path = os.path.join(tmp, f"clip{i:02d}.mp4")
-            try:
-                r = await asyncio.to_thread(requests.get, url, timeout=60, stream=True)
-                r.raise_for_status()
-                with open(path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=65536):
-                        f.write(chunk)
-                local_files.append(path)
-            except Exception as e:
+        # Clips come from the shared media cache (usually already there
+        # from post-gen prep or last-frame chaining) and stay pinned until
+        # we're done. The yuv420p/faststart copy made by post-gen is used
+        # when there is one, so the concat below can take the -c copy path.
+        # Misses download concurrently, bounded by the semaphore and a
+        # byte budget for the whole stitch.
+        download_t0 = time.monotonic()
+        sem = asyncio.Semaphore(STITCH_DOWNLOAD_CONCURRENCY)
+        budget = ByteBudget(STITCH_MAX_TOTAL_BYTES)
+        clip_stats: List[Dict[str, Any]] = [{"idx": i} for i in range(len(clips))]
+
+        async def _fetch_clip(i: int) -> str:
+            # A prep job still normalizing finishes sooner than our own
+            # re-encode of every clip would.
+            await PostGenInstance.wait(clips[i], STITCH_POSTGEN_WAIT_S)
+            prepared = PostGenInstance.prepared(clips[i])
+            if prepared:
+                path = await clip_stack.enter_async_context(MediaCacheInstance.pin(prepared))
+                size = os.path.getsize(path)
+                budget.consume(size)
+                clip_stats[i].update(cached=True, normalized=True, bytes=size, seconds=0.0, attempts=0)
+                return path
+            async with sem:
+                return await clip_stack.enter_async_context(
+                    MediaCacheInstance.open(clips[i], budget=budget, stats=clip_stats[i])
+                )
+
+        fetched = await asyncio.gather(
+            *(_fetch_clip(i) for i in range(len(clips))), return_exceptions=True,
+        )
+        timings: Dict[str, Any] = {
+            "download_s": round(time.monotonic() - download_t0, 2),
+            "clips": clip_stats,
+        }
+        for i, res in enumerate(fetched):
+            if isinstance(res, BaseException):
                 return CanvasRunBlockResponse(
                     block_id=body.block_id, status="failed",
-                    error=f"stitcher: failed to download clip {i} ({url}): {e}",
+                    error=f"stitcher: failed to download clip {i} ({clips[i]}): {res}",
                     elapsed_s=round(time.monotonic() - started, 2), mode="real",
+                    timings=timings,
                 )
+        local_files: List[str] = list(fetched)
+        encode_t0 = time.monotonic()
+
+        # One ffprobe per clip (cached by content hash, so clips already
+        # probed for last-frame chaining are free) drives every decision
+        # below: xfade offsets, audio presence, copy vs re-encode.
+        from apps.web.util.mediaprobe import MediaProbeInstance
+        infos = await asyncio.gather(*(MediaProbeInstance.probe(p) for p in local_files))
 
         list_path = os.path.join(tmp, "list.txt")
         with open(list_path, "w") as f:
@@ -675,34 +1223,22 @@ async def _real_stitcher(body: CanvasRunBlockRequest, started: float) -> CanvasR
         out_path = os.path.join(tmp, "stitched.mp4")
 
         async def _ffmpeg(args: List[str]) -> tuple[int, bytes, bytes]:
-            proc = await asyncio.create_subprocess_exec(
-                *args,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE,
+            return await FfmpegPoolInstance.run(
+                args, priority=PRIORITY_ENCODE, timeout=STITCH_FFMPEG_TIMEOUT_S, kind="stitch",
             )
-            so, se = await proc.communicate()
-            return proc.returncode or 0, so, se
 
         transition = ((body.config or {}).get("transitions") or "cut").lower()
         XFADE_DUR = 0.5
 
         if transition == "crossfade" and len(local_files) >= 2:
-            # Probe each clip's duration so we can build xfade offsets.
-            durations: List[float] = []
-            for p in local_files:
-                proc = await asyncio.create_subprocess_exec(
-                    "ffprobe", "-v", "error", "-show_entries", "format=duration",
-                    "-of", "default=noprint_wrappers=1:nokey=1", p,
-                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
-                )
-                so, _ = await proc.communicate()
-                try:
-                    durations.append(float(so.decode().strip()))
-                except (ValueError, AttributeError):
-                    durations.append(0.0)
+            durations: List[float] = [i.duration if i else 0.0 for i in infos]
             if any(d <= XFADE_DUR for d in durations):
                 # A clip too short for crossfade — silently downgrade to hard cut.
                 transition = "cut"
+            elif not all(i and i.has_audio for i in infos):
+                # The acrossfade chain needs an audio stream on every clip.
+                log.info("stitcher: clip without audio, using hard cut instead of crossfade")
+                transition = "cut"
             else:
                 # Build xfade + acrossfade filter graph.
                 v_chain: List[str] = []
@@ -746,17 +1282,13 @@ async def _real_stitcher(body: CanvasRunBlockRequest, started: float) -> CanvasR
             # which Telegram / mobile browsers / QuickTime refuse to play, so
             # we can't take the `-c copy` fast path on those sources — must
             # re-encode to yuv420p.
-            pix_fmts: List[str] = []
-            for p in local_files:
-                proc = await asyncio.create_subprocess_exec(
-                    "ffprobe", "-v", "error", "-select_streams", "v:0",
-                    "-show_entries", "stream=pix_fmt",
-                    "-of", "default=noprint_wrappers=1:nokey=1", p,
-                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
-                )
-                so, _ = await proc.communicate()
-                pix_fmts.append((so.decode() or "").strip())
+            pix_fmts: List[str] = [(i.pix_fmt or "") if i else "" for i in infos]
             needs_reencode = any(pf and pf != "yuv420p" for pf in pix_fmts)
+            # The concat demuxer with -c copy also needs matching codec and
+            # frame size; skip the doomed copy attempt when they differ.
+            shapes = {(i.video_codec, i.width, i.height) for i in infos if i}
+            if len(shapes) > 1:
+                needs_reencode = True
 
             rc = -1
             if not needs_reencode:
@@ -783,33 +1315,38 @@ async def _real_stitcher(body: CanvasRunBlockRequest, started: float) -> CanvasR
                         block_id=body.block_id, status="failed",
                         error=f"stitcher ffmpeg failed (rc={rc}): {se[:400].decode('utf-8', 'replace')}",
                         elapsed_s=round(time.monotonic() - started, 2), mode="real",
+                        timings=timings,
                     )
+        timings["encode_s"] = round(time.monotonic() - encode_t0, 2)
 
         # Upload to OSS.
-        from apps.web.util.aliossutils import AliOSSUtil
+        upload_t0 = time.monotonic()
+        from apps.web.util.ossupload import upload_file
         oss_url_prefix = os.getenv("FILE_OSS_HK_URL", "")
         date = datetime.utcnow().strftime("%Y/%m/%d")
         file_name = f"canvas/{date}/stitch_{uuid.uuid4().hex}.mp4"
-        with open(out_path, "rb") as f:
-            data = f.read()
-        bucket = AliOSSUtil._get_bucket()
-        result = await asyncio.to_thread(
-            bucket.put_object, file_name, data,
-            {"Content-Type": "video/mp4"},
-        )
-        if result.status != 200:
+        try:
+            await upload_file(out_path, file_name, "video/mp4")
+            upload_err = None
+        except Exception as e:
+            upload_err = str(e)
+        timings["upload_s"] = round(time.monotonic() - upload_t0, 2)
+        if upload_err is not None:
             return CanvasRunBlockResponse(
                 block_id=body.block_id, status="failed",
-                error=f"stitcher oss put_object status={result.status}",
+                error=f"stitcher oss upload failed: {upload_err}",
                 elapsed_s=round(time.monotonic() - started, 2), mode="real",
+                timings=timings,
             )
         return CanvasRunBlockResponse(
             block_id=body.block_id, status="ok", output_kind="video",
             output_url=f"{oss_url_prefix}{file_name}",
             cost_cr=0,
             elapsed_s=round(time.monotonic() - started, 2), mode="real",
+            timings=timings,
         )
     finally:
+        await clip_stack.aclose()
         # Best-effort cleanup; don't fail the response if rmtree fails.
         try:
             import shutil
@@ -825,7 +1362,8 @@ async def _real_imagegen(body: CanvasRunBlockRequest, started: float) -> CanvasR
     output_kind='image'. Idempotency / rate-limit / audit happen at
     the outer run_block layer, so this just wraps the WaveSpeed call.
     """
-    from apps.web.ai.wave import WaveApiInstance
+    from apps.web.ai.wave import AsyncWaveApiInstance
+    from apps.web.ai.poller import PredictionPollerInstance, parse_prediction
     config = body.config or {}
     inputs = body.inputs or {}
     prompt = (inputs.get("prompt") or config.get("text") or "").strip()
@@ -847,8 +1385,14 @@ async def _real_imagegen(body: CanvasRunBlockRequest, started: float) -> CanvasR
     resolution = config.get("resolution") or "1k"
     quality = config.get("quality") or "medium"
 
-    create_resp = await asyncio.to_thread(
-        WaveApiInstance.x402create_t2i,
+    fp = await _gen_cache_key("imagegen", cfg["model"], prompt, config, (),
+                              resolution=resolution, aspect=aspect, quality=quality)
+    if fp:
+        hit = await GenerationCacheInstance.get("imagegen", fp)
+        if hit:
+            return await _gen_cache_hit(body, "image", hit, started)
+
+    create_resp = await AsyncWaveApiInstance.x402create_t2i(
         cfg["vendor"], cfg["model"], prompt, aspect, resolution, quality,
     )
     if not create_resp or create_resp.get("code") != 200:
@@ -865,16 +1409,14 @@ async def _real_imagegen(body: CanvasRunBlockRequest, started: float) -> CanvasR
             elapsed_s=round(time.monotonic() - started, 2), mode="real",
         )
 
-    deadline = time.monotonic() + IMAGEGEN_POLL_TIMEOUT_S
+    # Status comes from the shared poller, which polls each request id
+    # once per interval however many callers are waiting on it.
     last_status = "unknown"
-    while time.monotonic() < deadline:
-        await asyncio.sleep(IMAGEGEN_POLL_INTERVAL_S)
-        poll = await asyncio.to_thread(WaveApiInstance.get_prediction_result, request_id)
-        if not poll.get("success"):
+    async for poll in PredictionPollerInstance.watch(request_id, IMAGEGEN_POLL_TIMEOUT_S):
+        status, inner = parse_prediction(poll)
+        if not status:
             continue
-        data = poll.get("data") or {}
-        inner = data.get("data") if isinstance(data.get("data"), dict) else data
-        last_status = (inner.get("status") or "").lower()
+        last_status = status
         if last_status in ("completed", "succeeded", "success"):
             outputs = inner.get("outputs") or []
             output_url = outputs[0] if outputs else inner.get("output") or inner.get("output_url")
@@ -884,6 +1426,9 @@ async def _real_imagegen(body: CanvasRunBlockRequest, started: float) -> CanvasR
                     error=f"imagegen completed but no output_url; raw: {inner}",
                     elapsed_s=round(time.monotonic() - started, 2), mode="real",
                 )
+            if fp:
+                await GenerationCacheInstance.put(fp, {"output_url": output_url})
+            RehostInstance.submit(output_url)
             return CanvasRunBlockResponse(
                 block_id=body.block_id, status="ok", output_kind="image",
                 output_url=output_url,
@@ -904,6 +1449,32 @@ async def _real_imagegen(body: CanvasRunBlockRequest, started: float) -> CanvasR
     )
 
 
+# ===========================================================================
+# Preview renditions
+# ===========================================================================
+#
+# Video results carry signed links to these endpoints (see
+# _with_renditions). No auth header, so they work as <img>/<video> src;
+# the signature limits them to URLs this server handed out.
+
+@router.get("/renditions/{kind}")
+@limiter.limit("120/minute")
+async def get_rendition(request: Request, kind: str, src: str, sig: str):
+    """Redirect to the `kind` rendition of `src`, building it on first use."""
+    if kind not in RENDITION_KINDS:
+        raise HTTPException(status_code=404, detail=f"unknown rendition {kind!r}")
+    if not RenditionInstance.verify(src, sig):
+        raise HTTPException(status_code=403, detail="bad rendition signature")
+    try:
+        url = await RenditionInstance.get(src, kind)
+    except RenditionError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        log.warning("rendition %s of %s failed: %s", kind, src[:120], e)
+        raise HTTPException(status_code=502, detail="rendition unavailable")
+    return RedirectResponse(url, status_code=302)
+
+
 # ===========================================================================
 # Workspace persistence (Canvas v0.4 batch 11)
 # ===========================================================================
@@ -935,7 +1506,8 @@ async def canvas_save(body: CanvasSaveRequest, user=Depends(get_current_user)):
     from apps.web.models.canvas_workspace import CanvasWorkspaceInstall
     import json as _json
 
-    nodes_json = _json.dumps(body.nodes or [])
+    # Store our OSS copies of vendor outputs rather than expiring links.
+    nodes_json = _json.dumps(await RehostInstance.rewrite(body.nodes or []))
     edges_json = _json.dumps(body.edges or [])
     viewport_json = _json.dumps(body.viewport) if body.viewport else None
 
@@ -991,7 +1563,7 @@ async def canvas_load(ws_id: str, user=Depends(get_current_user)):
     return CanvasLoadResponse(
         id=ws.id,
         name=ws.name,
-        nodes=_json.loads(ws.nodes or "[]"),
+        nodes=await RehostInstance.rewrite(_json.loads(ws.nodes or "[]")),
         edges=_json.loads(ws.edges or "[]"),
         viewport=_json.loads(ws.viewport) if ws.viewport else None,
         share_token=ws.share_token,
@@ -1019,7 +1591,7 @@ async def canvas_load_share(token: str):
     return CanvasLoadResponse(
         id=ws.id,
         name=ws.name,
-        nodes=_json.loads(ws.nodes or "[]"),
+        nodes=await RehostInstance.rewrite(_json.loads(ws.nodes or "[]")),
         edges=_json.loads(ws.edges or "[]"),
         viewport=_json.loads(ws.viewport) if ws.viewport else None,
         share_token=ws.share_token,
@@ -1102,8 +1674,9 @@ async def canvas_share(ws_id: str, body: CanvasShareRequest, user=Depends(get_cu
 #      with 1h TTL.
 #   4. /canvas/run-block requires that Redis flag for non-admin
 #      real-mode requests; the runner sends `X-Canvas-Run-Id: <runId>`
-#      on every block fetch in that run, and the backend checks the
-#      paid bucket has enough remaining credit before dispatching.
+#      on every block fetch in that run, and the backend holds the
+#      block's cost in the paid bucket (CanvasLedger) before dispatching,
+#      charging it on success and releasing it on failure.
 
 class CanvasChargeRequest(BaseModel):
     run_id: str
@@ -1127,13 +1700,12 @@ async def canvas_charge(
     user=Depends(get_current_user),
 ):
     from apps.web.routers.pointpay import (
+        DBC_RPC,
         DLCP_TOKEN_ADDRESS,
         DLCP_RECEIVE_ADDRESS,
-        TOKEN_DECIMALS,
-        w3_dbc,
     )
+    from apps.web.util.chainrpc import ReceiptServiceInstance, find_transfer, receipt_ok, to_wei
     from apps.web.models.pay import PayTableInstall
-    from apps.redis.redis_client import RedisClientInstance
 
     if not body.run_id or not body.hash or not body.address or not body.amount:
         raise HTTPException(status_code=400, detail="missing required fields")
@@ -1148,59 +1720,34 @@ async def canvas_charge(
         pass
 
     try:
-        tx_receipt = await asyncio.to_thread(
-            w3_dbc.eth.wait_for_transaction_receipt, body.hash, timeout=30,
-        )
+        tx_receipt = await ReceiptServiceInstance.wait(DBC_RPC, body.hash, timeout=30)
     except Exception as e:
-        log.info("canvas charge wait_for_transaction_receipt error: %s", e)
+        log.info("canvas charge receipt error: %s", e)
         return CanvasChargeResponse(
             ok=False, run_id=body.run_id, paid_amount="0",
             message=f"tx not confirmed: {e}",
         )
+    if tx_receipt is None:
+        return CanvasChargeResponse(
+            ok=False, run_id=body.run_id, paid_amount="0",
+            message="tx not confirmed: timed out waiting for receipt",
+        )
 
-    if tx_receipt.status != 1:
+    if not receipt_ok(tx_receipt):
         return CanvasChargeResponse(
             ok=False, run_id=body.run_id, paid_amount="0",
             message="tx failed on chain",
         )
 
-    try:
-        expected_wei = int(float(body.amount) * (10 ** TOKEN_DECIMALS))
-    except (ValueError, TypeError):
+    expected_wei = to_wei(body.amount)
+    if expected_wei is None:
         return CanvasChargeResponse(
             ok=False, run_id=body.run_id, paid_amount="0",
             message="invalid amount",
         )
 
-    transfer_sig = w3_dbc.keccak(text="Transfer(address,address,uint256)").hex()
-
-    matched = False
-    for evt in tx_receipt["logs"]:
-        if evt["topics"][0].hex() != transfer_sig:
-            continue
-        from_hex = evt["topics"][1].hex()[24:]
-        to_hex = evt["topics"][2].hex()[24:]
-        from_addr = w3_dbc.to_checksum_address("0x" + from_hex)
-        to_addr = w3_dbc.to_checksum_address("0x" + to_hex)
-        if from_addr.lower() != body.address.lower():
-            continue
-        if to_addr.lower() != DLCP_RECEIVE_ADDRESS.lower():
-            continue
-        if evt["address"].lower() != DLCP_TOKEN_ADDRESS.lower():
-            continue
-        try:
-            actual_wei = int(evt["data"].hex(), 16)
-        except (ValueError, AttributeError):
-            try:
-                actual_wei = int(evt["data"], 16)
-            except (ValueError, TypeError):
-                continue
-        if actual_wei < expected_wei:
-            continue
-        matched = True
-        break
-
-    if not matched:
+    if find_transfer(tx_receipt, DLCP_RECEIVE_ADDRESS, sender=body.address,
+                     token=DLCP_TOKEN_ADDRESS, min_wei=expected_wei) is None:
         return CanvasChargeResponse(
             ok=False, run_id=body.run_id, paid_amount="0",
             message="no matching DLP Transfer log",
@@ -1221,20 +1768,9 @@ async def canvas_charge(
     except Exception as e:
         log.warning("canvas charge audit insert failed: %s", e)
 
-    paid_key = f"canvas:paid:{user.id}:{body.run_id}"
-    try:
-        RedisClientInstance.add_key_value(
-            paid_key,
-            {
-                "amount_dlcp": body.amount,
-                "tx_hash": body.hash,
-                "wallet": body.address,
-                "spent_cr": 0,
-            },
-            ttl=3600,
-        )
-    except Exception as e:
-        log.warning("canvas charge redis flag write failed: %s", e)
+    if not await CanvasLedger.fund(user.id, body.run_id, body.amount,
+                                   tx_hash=body.hash, wallet=body.address):
+        log.warning("canvas charge redis flag write failed for run %s", body.run_id)
 
     return CanvasChargeResponse(
         ok=True, run_id=body.run_id, paid_amount=body.amount,
@@ -1308,43 +1844,9 @@ def _canvas_block_cost(block_type: str, config: Dict[str, Any]) -> int:
     return 0
 
 
-def _canvas_paid_check(user_id: str, run_id: str, block_cost_cr: int):
-    """Returns (ok: bool, remaining_dlcp: float, error_msg: str).
-
-    Convention: 1 cr = 1 DLP whole token = $0.001 USD.
-    `amount_dlcp` (Redis field name kept for back-compat) is a
-    decimal-string DLP count (e.g. "1500" for $1.50 worth). `spent_cr`
-    is in cr units, which equal DLP units one-to-one. So
-    `remaining = amount_dlcp - spent_cr` and a block of cost N cr
-    requires N DLP free in the bucket.
-    """
-    if not run_id or not user_id:
-        return (False, 0.0, "missing run_id or user")
-    from apps.redis.redis_client import RedisClientInstance
-    paid_key = f"canvas:paid:{user_id}:{run_id}"
-    paid = RedisClientInstance.get_value_by_key(paid_key)
-    if not paid:
-        return (False, 0.0, f"no payment for run_id={run_id} (POST /canvas/charge first)")
-    try:
-        remaining_dlcp = float(paid.get("amount_dlcp", "0")) - float(paid.get("spent_cr", 0))
-    except Exception:
-        return (False, 0.0, "corrupt payment record")
-    if remaining_dlcp + 1e-6 < float(block_cost_cr):
-        return (False, remaining_dlcp,
-                f"insufficient credits: need {block_cost_cr}, have {remaining_dlcp:.0f}")
-    return (True, remaining_dlcp, "")
-
-
-def _canvas_paid_consume(user_id: str, run_id: str, block_cost_cr: int) -> None:
-    if not run_id or not user_id or block_cost_cr <= 0:
-        return
-    from apps.redis.redis_client import RedisClientInstance
-    paid_key = f"canvas:paid:{user_id}:{run_id}"
-    paid = RedisClientInstance.get_value_by_key(paid_key)
-    if not paid:
-        return
-    paid["spent_cr"] = int(paid.get("spent_cr", 0)) + int(block_cost_cr)
-    try:
-        RedisClientInstance.add_key_value(paid_key, paid, ttl=3600)
-    except Exception as e:
-        log.warning("canvas spent_cr update failed: %s", e)
+# Paid buckets minted by /canvas/charge. Convention: 1 cr = 1 DLP whole
+# token = $0.001 USD. `amount_dlcp` (field name kept for back-compat) is
+# a decimal-string DLP count (e.g. "1500" for $1.50 worth); spent and
+# reserved credits are in cr, which equal DLP one-to-one, so a block of
+# cost N cr needs N DLP free in the bucket.
+CanvasLedger = CreditLedger("canvas:paid", ttl_s=3600, charge_path="/canvas/charge")
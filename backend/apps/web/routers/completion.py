@@ -1,19 +1,104 @@
 from fastapi import APIRouter
-from fastapi import Depends
+from fastapi import Depends, HTTPException
 from fastapi.responses import StreamingResponse
 from utils.utils import get_current_user
 from apps.web.models.aimodel import AiModelReq, AiResultReq
-from apps.web.ai.wave import WaveApiInstance
+from apps.web.ai.wave import AsyncWaveApiInstance
+from apps.web.ai.poller import PredictionPollerInstance, TERMINAL_FAILED, TERMINAL_OK, parse_prediction
 from apps.web.models.pay import PayTableInstall
-import time
+from apps.web.util.metrics import counter, gauge
+import asyncio
 import json
+import os
+import weakref
 
 router = APIRouter()
 
+# Upper bound on how long one SSE stream follows a prediction. Status
+# updates come from the shared poller, so this no longer maps to a fixed
+# number of upstream calls per viewer.
+STREAM_TIMEOUT_S = 600
+
+# Per-worker cap on open video SSE streams. Streams are cheap coroutines
+# now, but each still holds a socket and a poller subscription; past the
+# cap new viewers get a 503 with Retry-After and the frontend retries.
+MAX_STREAMS = int(os.getenv("COMPLETION_MAX_STREAMS", "500"))
+STREAM_RETRY_AFTER_S = 5
+
+_active_streams = 0
+STREAMS_ACTIVE = gauge(
+  "creator_completion_streams_active", "Open video status SSE streams in this worker")
+STREAMS_REJECTED = counter(
+  "creator_completion_streams_rejected_total", "Video status SSE streams refused at the cap")
+
+
+def _open_stream(gen):
+  """Admit one SSE stream under MAX_STREAMS and track it until it ends.
+
+  The slot is taken here, at admission, so a burst of requests can't all
+  pass the check before any body starts. It is given back in the body's
+  `finally`, which also runs when the client disconnects and the
+  response task is cancelled, or when a body that was never iterated is
+  garbage collected.
+  """
+  global _active_streams
+  if _active_streams >= MAX_STREAMS:
+    STREAMS_REJECTED.inc()
+    raise HTTPException(
+      503,
+      detail="too many open video streams, retry shortly",
+      headers={"Retry-After": str(STREAM_RETRY_AFTER_S)},
+    )
+  _active_streams += 1
+  STREAMS_ACTIVE.inc()
+  released = False
+
+  def release():
+    global _active_streams
+    nonlocal released
+    if not released:
+      released = True
+      _active_streams -= 1
+      STREAMS_ACTIVE.dec()
+
+  async def tracked():
+    try:
+      async for chunk in gen:
+        yield chunk
+    finally:
+      release()
+      await gen.aclose()
+
+  body = tracked()
+  weakref.finalize(body, release)
+  return StreamingResponse(body, media_type="text/event-stream")
+
+# failed requestId -> future of the replacement requestId. /video/result
+# re-creates a failed job; with several viewers on the same createId only
+# the first one may pay for the retry, the rest follow the new id.
+_recreated = {}
+
+
+async def _recreate_once(failed_id: str, param: AiModelReq):
+  fut = _recreated.get(failed_id)
+  if fut is None:
+    fut = asyncio.get_running_loop().create_future()
+    _recreated[failed_id] = fut
+    new_id = None
+    try:
+      result = await AsyncWaveApiInstance.create(param)
+      if result is not None and result.get('code') == 200:
+        new_id = result['data']['id']
+    finally:
+      fut.set_result(new_id)
+      asyncio.get_running_loop().call_later(STREAM_TIMEOUT_S, _recreated.pop, failed_id, None)
+  return await asyncio.shield(fut)
+
+
 @router.post("/completion/video")
 async def completion_video(param: AiModelReq, user=Depends(get_current_user)):
-  def event_generator():
-    pay = PayTableInstall.get_by_messageid(param.messageid)
+  async def event_generator():
+    pay = await asyncio.to_thread(PayTableInstall.get_by_messageid, param.messageid)
     if pay is None:
       yield f"data: {json.dumps({'success': False, 'message': 'unknown messageid', 'status': 'error'})}\n\n"
       return
@@ -30,71 +115,65 @@ async def completion_video(param: AiModelReq, user=Depends(get_current_user)):
       }
       yield f"data: {json.dumps(data)}\n\n"
 
-      result = WaveApiInstance.create(param)
+      result = await AsyncWaveApiInstance.create(param)
       if result is not None and result.get('code') == 200:
         requestId = result['data']['id']
-        timeout = 0
-        while True:
-          timeout += 1
-          if timeout > 600:
+        finished = False
+        async for result in PredictionPollerInstance.watch(requestId, STREAM_TIMEOUT_S):
+          if not result.get('success'):
+            continue
+          status, inner_data = parse_prediction(result)
+          status = status or 'unknown'
+          if status in TERMINAL_OK:
+            data = {
+              "success": True,
+              "message": inner_data.get('message', 'success'),
+              "status": status,
+              "limit": {"use": 2, "total": 10},
+              "paystatus": True,
+              "paymoney": pay.amount,
+              "createId": requestId,
+              "videos": inner_data.get('outputs', [])
+            }
+            yield f"data: {json.dumps(data)}\n\n"
+            finished = True
+          elif status in TERMINAL_FAILED:
+            data = {
+              "success": True,
+              "message": inner_data.get('message', 'success'),
+              "status": status,
+              "limit": {"use": 2, "total": 10},
+              "paystatus": True,
+              "paymoney": pay.amount,
+              "createId": requestId,
+              "videos": "queryfailed"
+            }
+            yield f"data: {json.dumps(data)}\n\n"
+            finished = True
+          else:
             data = {
               "success": True,
-              "message": "timeout",
-              "status": "timeout",
+              "message": inner_data.get('message', 'success'),
+              "status": status,
               "limit": {"use": 2, "total": 10},
               "paystatus": True,
               "paymoney": pay.amount,
               "createId": requestId,
-              "value": "timeout"
+              "videos": "videoloading"
             }
             yield f"data: {json.dumps(data)}\n\n"
-            break
-          result = WaveApiInstance.get_prediction_result(requestId)
-          if result.get('success'):
-            outer_data = result.get('data', {})
-            inner_data = outer_data.get('data', {})
-            status = inner_data.get('status', 'unknown')
-            if status == 'completed':
-              data = {
-                "success": True,
-                "message": inner_data.get('message', 'success'),
-                "status": status,
-                "limit": {"use": 2, "total": 10},
-                "paystatus": True,
-                "paymoney": pay.amount,
-                "createId": requestId,
-                "videos": inner_data.get('outputs', [])
-              }
-              yield f"data: {json.dumps(data)}\n\n"
-              break
-            elif status == 'failed':
-              data = {
-                "success": True,
-                "message": inner_data.get('message', 'success'),
-                "status": status,
-                "limit": {"use": 2, "total": 10},
-                "paystatus": True,
-                "paymoney": pay.amount,
-                "createId": requestId,
-                "videos": "queryfailed"
-              }
-              yield f"data: {json.dumps(data)}\n\n"
-              break
-            else:
-              data = {
-                "success": True,
-                "message": inner_data.get('message', 'success'),
-                "status": status,
-                "limit": {"use": 2, "total": 10},
-                "paystatus": True,
-                "paymoney": pay.amount,
-                "createId": requestId,
-                "videos": "videoloading"
-              }
-              yield f"data: {json.dumps(data)}\n\n"
-
-          # stop 1s
-          time.sleep(1)  
+        if not finished:
+          data = {
+            "success": True,
+            "message": "timeout",
+            "status": "timeout",
+            "limit": {"use": 2, "total": 10},
+            "paystatus": True,
+            "paymoney": pay.amount,
+            "createId": requestId,
+            "value": "timeout"
+          }
+          yield f"data: {json.dumps(data)}\n\n"
       else:
         data = {
           "success": True,
@@ -107,35 +186,26 @@ async def completion_video(param: AiModelReq, user=Depends(get_current_user)):
           "videos": "createdfailed"
         }
         yield f"data: {json.dumps(data)}\n\n"
-    
+
     yield f"data: [DONE]\n\n"
 
-  return StreamingResponse(event_generator(), media_type="text/event-stream")
+  return _open_stream(event_generator())
 
 @router.post("/video/result")
 async def completion_video(param: AiModelReq, user=Depends(get_current_user)):
-  def event_generator():
-    failednum = 0
-    timeout = 0
-    while True:
-      timeout += 1
-      if timeout > 600:
-        data = {
-          "success": True,
-          "message": "timeout",
-          "status": "timeout",
-          "limit": {"use": 2, "total": 10},
-          "createId": param.requestId,
-          "value": "timeout"
-        }
-        yield f"data: {json.dumps(data)}\n\n"
-        break
-      result = WaveApiInstance.get_prediction_result(param.requestId)
-      if result.get('success'):
-        outer_data = result.get('data', {})
-        inner_data = outer_data.get('data', {})
-        status = inner_data.get('status', 'unknown')
-        if status == 'completed':
+  async def event_generator():
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + STREAM_TIMEOUT_S
+    finished = False
+    recreated = False
+    while not finished and loop.time() < deadline:
+      failed_inner = None
+      async for result in PredictionPollerInstance.watch(param.requestId, deadline - loop.time()):
+        if not result.get('success'):
+          continue
+        status, inner_data = parse_prediction(result)
+        status = status or 'unknown'
+        if status in TERMINAL_OK:
           data = {
             "success": True,
             "message": inner_data.get('message', 'success'),
@@ -144,34 +214,10 @@ async def completion_video(param: AiModelReq, user=Depends(get_current_user)):
             "videos": inner_data.get('outputs', [])
           }
           yield f"data: {json.dumps(data)}\n\n"
-          break
-        elif status == 'failed':
-          failednum += 1
-          if failednum == 3:
-            result = WaveApiInstance.create(param)
-            if result is not None and result.get('code') == 200:
-              param.requestId = result['data']['id']
-          if failednum <= 3:
-            data = {
-              "success": True,
-              "message": inner_data.get('message', 'success'),
-              "status": "processing",
-              "createId": param.requestId,
-              "videos": "videoloading"
-            }
-            yield f"data: {json.dumps(data)}\n\n"
-          else:
-            data = {
-              "success": True,
-              "message": inner_data.get('message', 'success'),
-              "status": status,
-              "createId": param.requestId,
-              "videos": "queryfailed"
-            }
-            yield f"data: {json.dumps(data)}\n\n"
-            break
+          finished = True
+        elif status in TERMINAL_FAILED:
+          failed_inner = inner_data
         else:
-          failednum = 0
           data = {
             "success": True,
             "message": inner_data.get('message', 'success'),
@@ -180,70 +226,103 @@ async def completion_video(param: AiModelReq, user=Depends(get_current_user)):
             "videos": "videoloading"
           }
           yield f"data: {json.dumps(data)}\n\n"
-      # stop 0.5s
-      time.sleep(0.5)
-    
+      if finished or failed_inner is None:
+        break
+
+      # The job failed upstream: re-create it once per stream (shared
+      # across viewers) and keep following the replacement id. If the
+      # replacement fails too, give up rather than pay for another.
+      new_id = None if recreated else await _recreate_once(param.requestId, param)
+      recreated = True
+      if new_id is None:
+        data = {
+          "success": True,
+          "message": failed_inner.get('message', 'success'),
+          "status": "failed",
+          "createId": param.requestId,
+          "videos": "queryfailed"
+        }
+        yield f"data: {json.dumps(data)}\n\n"
+        finished = True
+        break
+      param.requestId = new_id
+      data = {
+        "success": True,
+        "message": failed_inner.get('message', 'success'),
+        "status": "processing",
+        "createId": param.requestId,
+        "videos": "videoloading"
+      }
+      yield f"data: {json.dumps(data)}\n\n"
+
+    if not finished:
+      data = {
+        "success": True,
+        "message": "timeout",
+        "status": "timeout",
+        "limit": {"use": 2, "total": 10},
+        "createId": param.requestId,
+        "value": "timeout"
+      }
+      yield f"data: {json.dumps(data)}\n\n"
+
     # finish send
     yield f"data: [DONE]\n\n"
 
-  return StreamingResponse(event_generator(), media_type="text/event-stream")
+  return _open_stream(event_generator())
 
 
 @router.post("/video/x402/result")
 async def completion_video(param: AiResultReq):
-  def event_generator():
-    timeout = 0
-    while True:
-      timeout += 1
-      if timeout > 600:
+  async def event_generator():
+    finished = False
+    async for result in PredictionPollerInstance.watch(param.requestId, STREAM_TIMEOUT_S):
+      if not result.get('success'):
+        continue
+      status, inner_data = parse_prediction(result)
+      status = status or 'unknown'
+      if status in TERMINAL_OK:
         data = {
           "success": True,
-          "message": "timeout",
-          "status": "timeout",
-          "limit": {"use": 2, "total": 10},
+          "message": inner_data.get('message', 'success'),
+          "status": status,
           "createId": param.requestId,
-          "value": "timeout"
+          "videos": inner_data.get('outputs', [])
         }
         yield f"data: {json.dumps(data)}\n\n"
-        break
-      result = WaveApiInstance.get_prediction_result(param.requestId)
-      if result.get('success'):
-        outer_data = result.get('data', {})
-        inner_data = outer_data.get('data', {})
-        status = inner_data.get('status', 'unknown')
-        if status == 'completed':
-          data = {
-            "success": True,
-            "message": inner_data.get('message', 'success'),
-            "status": status,
-            "createId": param.requestId,
-            "videos": inner_data.get('outputs', [])
-          }
-          yield f"data: {json.dumps(data)}\n\n"
-          break
-        elif status == 'failed':
-          data = {
-            "success": True,
-            "message": inner_data.get('message', 'success'),
-            "status": status,
-            "createId": param.requestId,
-            "videos": "queryfailed"
-          }
-          yield f"data: {json.dumps(data)}\n\n"
-          break
-        else:
-          data = {
-            "success": True,
-            "message": inner_data.get('message', 'success'),
-            "status": status,
-            "createId": param.requestId,
-            "videos": "videoloading"
-          }
-          yield f"data: {json.dumps(data)}\n\n"
-      # stop 1s
-      time.sleep(0.2)
-    
+        finished = True
+      elif status in TERMINAL_FAILED:
+        data = {
+          "success": True,
+          "message": inner_data.get('message', 'success'),
+          "status": status,
+          "createId": param.requestId,
+          "videos": "queryfailed"
+        }
+        yield f"data: {json.dumps(data)}\n\n"
+        finished = True
+      else:
+        data = {
+          "success": True,
+          "message": inner_data.get('message', 'success'),
+          "status": status,
+          "createId": param.requestId,
+          "videos": "videoloading"
+        }
+        yield f"data: {json.dumps(data)}\n\n"
+
+    if not finished:
+      data = {
+        "success": True,
+        "message": "timeout",
+        "status": "timeout",
+        "limit": {"use": 2, "total": 10},
+        "createId": param.requestId,
+        "value": "timeout"
+      }
+      yield f"data: {json.dumps(data)}\n\n"
+
     # finish send
     yield f"data: [DONE]\n\n"
 
-  return StreamingResponse(event_generator(), media_type="text/event-stream")
+  return _open_stream(event_generator())
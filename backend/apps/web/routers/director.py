@@ -13,7 +13,8 @@ Three endpoints under /director:
 * POST /run    — SSE stream. Drives the storyboard end-to-end via
                  canvas internals (_real_videogen + i2v chain +
                  _real_stitcher). Per-shot progress events; drains
-                 the paid bucket per shot.
+                 the paid bucket per shot. `schedule="parallel"` runs
+                 independent scenes concurrently.
 
 Day 2 ships /charge + /run with the SSE wiring.
 """
@@ -31,6 +32,7 @@ from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
+from apps.web.util.ledger import CreditLedger
 from utils.utils import get_current_user
 
 log = logging.getLogger(__name__)
@@ -173,8 +175,8 @@ class DirectorChargeResponse(BaseModel):
 PAID_BUCKET_TTL_S = 3600
 
 
-def _director_paid_key(user_id: str, run_id: str) -> str:
-    return f"director:paid:{user_id}:{run_id}"
+DirectorLedger = CreditLedger("director:paid", ttl_s=PAID_BUCKET_TTL_S,
+                              charge_path="/director/charge")
 
 
 @router.post("/charge", response_model=DirectorChargeResponse)
@@ -183,13 +185,12 @@ async def director_charge(
     user=Depends(get_current_user),
 ):
     from apps.web.routers.pointpay import (
+        DBC_RPC,
         DLCP_TOKEN_ADDRESS,
         DLCP_RECEIVE_ADDRESS,
-        TOKEN_DECIMALS,
-        w3_dbc,
     )
+    from apps.web.util.chainrpc import ReceiptServiceInstance, find_transfer, receipt_ok, to_wei
     from apps.web.models.pay import PayTableInstall
-    from apps.redis.redis_client import RedisClientInstance
 
     if not body.run_id or not body.hash or not body.address or not body.amount:
         raise HTTPException(status_code=400, detail="missing required fields")
@@ -204,59 +205,34 @@ async def director_charge(
         pass
 
     try:
-        tx_receipt = await asyncio.to_thread(
-            w3_dbc.eth.wait_for_transaction_receipt, body.hash, timeout=30,
-        )
+        tx_receipt = await ReceiptServiceInstance.wait(DBC_RPC, body.hash, timeout=30)
     except Exception as e:
-        log.info("director charge wait_for_transaction_receipt error: %s", e)
+        log.info("director charge receipt error: %s", e)
         return DirectorChargeResponse(
             ok=False, run_id=body.run_id, paid_amount="0",
             message=f"tx not confirmed: {e}",
         )
+    if tx_receipt is None:
+        return DirectorChargeResponse(
+            ok=False, run_id=body.run_id, paid_amount="0",
+            message="tx not confirmed: timed out waiting for receipt",
+        )
 
-    if tx_receipt.status != 1:
+    if not receipt_ok(tx_receipt):
         return DirectorChargeResponse(
             ok=False, run_id=body.run_id, paid_amount="0",
             message="tx failed on chain",
         )
 
-    try:
-        expected_wei = int(float(body.amount) * (10 ** TOKEN_DECIMALS))
-    except (ValueError, TypeError):
+    expected_wei = to_wei(body.amount)
+    if expected_wei is None:
         return DirectorChargeResponse(
             ok=False, run_id=body.run_id, paid_amount="0",
             message="invalid amount",
         )
 
-    transfer_sig = w3_dbc.keccak(text="Transfer(address,address,uint256)").hex()
-
-    matched = False
-    for evt in tx_receipt["logs"]:
-        if evt["topics"][0].hex() != transfer_sig:
-            continue
-        from_hex = evt["topics"][1].hex()[24:]
-        to_hex = evt["topics"][2].hex()[24:]
-        from_addr = w3_dbc.to_checksum_address("0x" + from_hex)
-        to_addr = w3_dbc.to_checksum_address("0x" + to_hex)
-        if from_addr.lower() != body.address.lower():
-            continue
-        if to_addr.lower() != DLCP_RECEIVE_ADDRESS.lower():
-            continue
-        if evt["address"].lower() != DLCP_TOKEN_ADDRESS.lower():
-            continue
-        try:
-            actual_wei = int(evt["data"].hex(), 16)
-        except (ValueError, AttributeError):
-            try:
-                actual_wei = int(evt["data"], 16)
-            except (ValueError, TypeError):
-                continue
-        if actual_wei < expected_wei:
-            continue
-        matched = True
-        break
-
-    if not matched:
+    if find_transfer(tx_receipt, DLCP_RECEIVE_ADDRESS, sender=body.address,
+                     token=DLCP_TOKEN_ADDRESS, min_wei=expected_wei) is None:
         return DirectorChargeResponse(
             ok=False, run_id=body.run_id, paid_amount="0",
             message="no matching DLP Transfer log",
@@ -277,19 +253,9 @@ async def director_charge(
     except Exception as e:
         log.warning("director charge audit insert failed: %s", e)
 
-    try:
-        RedisClientInstance.add_key_value(
-            _director_paid_key(user.id, body.run_id),
-            {
-                "amount_dlcp": body.amount,
-                "tx_hash": body.hash,
-                "wallet": body.address,
-                "spent_cr": 0,
-            },
-            ttl=PAID_BUCKET_TTL_S,
-        )
-    except Exception as e:
-        log.warning("director charge redis flag write failed: %s", e)
+    if not await DirectorLedger.fund(user.id, body.run_id, body.amount,
+                                     tx_hash=body.hash, wallet=body.address):
+        log.warning("director charge redis flag write failed for run %s", body.run_id)
 
     return DirectorChargeResponse(
         ok=True, run_id=body.run_id, paid_amount=body.amount,
@@ -307,41 +273,77 @@ class DirectorRunRequest(BaseModel):
     run_id: str
     storyboard: DirectorStoryboard
     transitions: Literal["cut", "crossfade"] = "crossfade"
+    # "serial": every shot chains (last-frame i2v) from the one before it,
+    #           one shot at a time — the original behaviour.
+    # "parallel": shots only chain within a scene; the first shot of each
+    #           scene is plain t2v, so scenes generate concurrently.
+    schedule: Literal["serial", "parallel"] = "serial"
 
 
-def _director_paid_check(user_id: str, run_id: str, block_cost_cr: int):
-    """Returns (ok, remaining, err)."""
-    from apps.redis.redis_client import RedisClientInstance
-    if not user_id or not run_id:
-        return (False, 0.0, "missing user or run_id")
-    paid = RedisClientInstance.get_value_by_key(
-        _director_paid_key(user_id, run_id)
-    )
-    if not paid:
-        return (False, 0.0, f"no payment for run_id={run_id} (POST /director/charge first)")
-    try:
-        remaining = float(paid.get("amount_dlcp", "0")) - float(paid.get("spent_cr", 0))
-    except Exception:
-        return (False, 0.0, "corrupt payment record")
-    if remaining + 1e-6 < float(block_cost_cr):
-        return (False, remaining,
-                f"insufficient credits: need {block_cost_cr}, have {remaining:.0f}")
-    return (True, remaining, "")
-
-
-def _director_paid_consume(user_id: str, run_id: str, block_cost_cr: int) -> None:
-    from apps.redis.redis_client import RedisClientInstance
-    if not user_id or not run_id or block_cost_cr <= 0:
-        return
-    key = _director_paid_key(user_id, run_id)
-    paid = RedisClientInstance.get_value_by_key(key)
-    if not paid:
-        return
-    paid["spent_cr"] = int(paid.get("spent_cr", 0)) + int(block_cost_cr)
-    try:
-        RedisClientInstance.add_key_value(key, paid, ttl=PAID_BUCKET_TTL_S)
-    except Exception:
-        pass
+# Max shots in flight for schedule="parallel". Each one holds a WaveSpeed
+# job, so keep this near the account's concurrent-job allowance.
+DIRECTOR_SHOT_CONCURRENCY = int(os.getenv("DIRECTOR_SHOT_CONCURRENCY", "4"))
+
+
+def _shot_dependencies(shots: List[DirectorShot], schedule: str) -> Dict[int, Optional[int]]:
+    """Map shot idx -> idx of the shot it chains from (None = t2v start).
+
+    Serial chains every shot to its predecessor. Parallel only chains
+    consecutive shots of the same scene — a scene cut is a hard cut
+    anyway, so pixel continuity across it buys nothing.
+    """
+    deps: Dict[int, Optional[int]] = {}
+    prev: Optional[DirectorShot] = None
+    for shot in shots:
+        if prev is not None and (schedule == "serial" or prev.scene_idx == shot.scene_idx):
+            deps[shot.idx] = prev.idx
+        else:
+            deps[shot.idx] = None
+        prev = shot
+    return deps
+
+
+async def _schedule_shots(shots, deps, run_shot, concurrency: int):
+    """Run shots as their chain predecessor finishes, `concurrency` at a time.
+
+    `run_shot(shot, chain_url)` returns (output_url or None, error or
+    None). Yields ("running", shot, None) when a shot starts and
+    ("ok"|"failed", shot, url_or_error) when it finishes, in completion
+    order. After the first failure no new shots start; shots already in
+    flight (and already paid for) are allowed to finish.
+    """
+    children: Dict[int, List[DirectorShot]] = {s.idx: [] for s in shots}
+    ready: List[DirectorShot] = []
+    for shot in shots:
+        parent = deps.get(shot.idx)
+        if parent is None:
+            ready.append(shot)
+        else:
+            children[parent].append(shot)
+    urls: Dict[int, str] = {}
+    running: Dict[asyncio.Task, DirectorShot] = {}
+    failed = False
+
+    while ready or running:
+        while ready and not failed and len(running) < concurrency:
+            shot = ready.pop(0)
+            chain_url = urls.get(deps.get(shot.idx))
+            running[asyncio.create_task(run_shot(shot, chain_url))] = shot
+            yield "running", shot, None
+        if not running:
+            break
+        done, _pending = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        # Report in storyboard order when several finish in the same tick.
+        for task in sorted(done, key=lambda t: running[t].idx):
+            shot = running.pop(task)
+            url, error = task.result()
+            if url:
+                urls[shot.idx] = url
+                ready.extend(children[shot.idx])
+                yield "ok", shot, url
+            else:
+                failed = True
+                yield "failed", shot, error
 
 
 def _build_shot_prompt(shot: DirectorShot, characters: List[DirectorCharacter]) -> str:
@@ -375,13 +377,17 @@ async def director_run(
 ):
     """Orchestrates the storyboard. Streams SSE progress.
 
-    Event shapes (data: <json>\\n\\n):
+    Event shapes (data: <json>\\n\\n). With schedule="parallel",
+    `shot` events of different scenes interleave and may arrive out of
+    idx order; the stitch still follows storyboard order.
       { "type": "start",   "shot_count": int }
       { "type": "shot",    "idx": int, "status": "running"|"ok"|"failed",
-                            "url"?: str, "elapsed_s"?: float, "error"?: str }
+                            "url"?: str, "renditions"?: {kind: url},
+                            "elapsed_s"?: float, "error"?: str }
       { "type": "stitch",  "status": "running"|"ok"|"failed",
-                            "url"?: str, "error"?: str }
-      { "type": "done",    "final_url": str, "total_elapsed_s": float }
+                            "url"?: str, "renditions"?: {kind: url}, "error"?: str }
+      { "type": "done",    "final_url": str, "renditions": {kind: url},
+                            "total_elapsed_s": float }
       { "type": "error",   "message": str }
     """
     if not body.run_id or not body.storyboard or not body.storyboard.shots:
@@ -400,73 +406,101 @@ async def director_run(
         _real_videogen,
         _real_stitcher,
     )
+    from apps.web.util.renditions import RenditionInstance
 
     storyboard = body.storyboard
     shots = list(storyboard.shots)
     characters = list(storyboard.characters)
 
+    deps = _shot_dependencies(shots, body.schedule)
+    concurrency = 1 if body.schedule == "serial" else max(1, DIRECTOR_SHOT_CONCURRENCY)
+    shot_elapsed: Dict[int, float] = {}
+
+    async def run_shot(shot: DirectorShot, chain_url: Optional[str]):
+        shot_cost = _happyhorse_cost_cr(int(shot.duration_s))
+        hold = uuid.uuid4().hex
+        ok, _remaining, err = await DirectorLedger.reserve(user_id, body.run_id, shot_cost, hold)
+        if not ok:
+            return None, err
+
+        block_id = f"director-{body.run_id}-{shot.idx}"
+        prompt = _build_shot_prompt(shot, characters)
+        inputs: Dict[str, Any] = {"prompt": prompt}
+        if chain_url:
+            # _real_videogen knows to extract the last frame and
+            # route to the i2v endpoint when this is present.
+            inputs["chain_from_video_url"] = chain_url
+
+        req = CanvasRunBlockRequest(
+            block_id=block_id,
+            block_type="videogen",
+            config={
+                "model": shot.model or "happyhorse-1.0",
+                "duration": int(shot.duration_s),
+                "resolution": "720p",
+            },
+            inputs=inputs,
+        )
+        started = time.monotonic()
+        try:
+            resp = await _real_videogen(req, started)
+        except asyncio.CancelledError:
+            await DirectorLedger.release(user_id, body.run_id, hold)
+            raise
+        except Exception as e:
+            await DirectorLedger.release(user_id, body.run_id, hold)
+            log.warning("director videogen crash shot=%s: %s", shot.idx, e)
+            return None, f"crash: {e}"
+        finally:
+            shot_elapsed[shot.idx] = round(time.monotonic() - started, 2)
+        if resp.status != "ok" or not resp.output_url:
+            await DirectorLedger.release(user_id, body.run_id, hold)
+            return None, resp.error or "no output_url"
+        if resp.mode == "cache-hit":
+            # Identical shot served from the generation cache: free.
+            await DirectorLedger.release(user_id, body.run_id, hold)
+        else:
+            await DirectorLedger.commit(user_id, body.run_id, hold, shot_cost)
+        return resp.output_url, None
+
     async def stream():
         t0 = time.monotonic()
         yield f"data: {json.dumps({'type': 'start', 'shot_count': len(shots)})}\n\n"
-        clip_urls: List[str] = []
-        chain_url: Optional[str] = None  # carries lf of previous shot for i2v
 
-        for shot in shots:
-            shot_cost = _happyhorse_cost_cr(int(shot.duration_s))
-            ok, _remaining, err = _director_paid_check(
-                user_id, body.run_id, shot_cost
-            )
+        # Per-shot holds keep parallel shots from overspending; checking
+        # the whole storyboard up front just avoids generating scenes
+        # that could never be stitched into a finished film.
+        if body.schedule == "parallel":
+            total_cost = sum(_happyhorse_cost_cr(int(s.duration_s)) for s in shots)
+            ok, _remaining, err = await DirectorLedger.check(user_id, body.run_id, total_cost)
             if not ok:
-                yield f"data: {json.dumps({'type': 'shot', 'idx': shot.idx, 'status': 'failed', 'error': err})}\n\n"
                 yield f"data: {json.dumps({'type': 'error', 'message': err})}\n\n"
                 return
 
-            yield f"data: {json.dumps({'type': 'shot', 'idx': shot.idx, 'status': 'running'})}\n\n"
-
-            block_id = f"director-{body.run_id}-{shot.idx}"
-            prompt = _build_shot_prompt(shot, characters)
-            inputs: Dict[str, Any] = {"prompt": prompt}
-            if chain_url:
-                # _real_videogen knows to extract the last frame and
-                # route to the i2v endpoint when this is present.
-                inputs["chain_from_video_url"] = chain_url
-
-            req = CanvasRunBlockRequest(
-                block_id=block_id,
-                block_type="videogen",
-                config={
-                    "model": shot.model or "happyhorse-1.0",
-                    "duration": int(shot.duration_s),
-                    "resolution": "720p",
-                },
-                inputs=inputs,
-            )
-            started = time.monotonic()
-            try:
-                resp = await _real_videogen(req, started)
-            except Exception as e:
-                log.warning("director videogen crash shot=%s: %s", shot.idx, e)
-                yield f"data: {json.dumps({'type': 'shot', 'idx': shot.idx, 'status': 'failed', 'error': f'crash: {e}'})}\n\n"
-                yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-                return
-
-            elapsed = round(time.monotonic() - started, 2)
-            if resp.status != "ok" or not resp.output_url:
-                yield f"data: {json.dumps({'type': 'shot', 'idx': shot.idx, 'status': 'failed', 'error': resp.error or 'no output_url', 'elapsed_s': elapsed})}\n\n"
-                yield f"data: {json.dumps({'type': 'error', 'message': resp.error or 'shot failed'})}\n\n"
-                return
-
-            _director_paid_consume(user_id, body.run_id, shot_cost)
-            clip_urls.append(resp.output_url)
-            chain_url = resp.output_url
-
-            yield f"data: {json.dumps({'type': 'shot', 'idx': shot.idx, 'status': 'ok', 'url': resp.output_url, 'elapsed_s': elapsed})}\n\n"
+        clip_by_idx: Dict[int, str] = {}
+        error: Optional[str] = None
+        async for state, shot, detail in _schedule_shots(shots, deps, run_shot, concurrency):
+            if state == "running":
+                yield f"data: {json.dumps({'type': 'shot', 'idx': shot.idx, 'status': 'running'})}\n\n"
+            elif state == "ok":
+                clip_by_idx[shot.idx] = detail
+                yield f"data: {json.dumps({'type': 'shot', 'idx': shot.idx, 'status': 'ok', 'url': detail, 'renditions': RenditionInstance.links(detail), 'elapsed_s': shot_elapsed[shot.idx]})}\n\n"
+            else:
+                error = error or detail
+                evt = {'type': 'shot', 'idx': shot.idx, 'status': 'failed', 'error': detail}
+                if shot.idx in shot_elapsed:
+                    evt['elapsed_s'] = shot_elapsed[shot.idx]
+                yield f"data: {json.dumps(evt)}\n\n"
+        if error is not None:
+            yield f"data: {json.dumps({'type': 'error', 'message': error})}\n\n"
+            return
+        clip_urls = [clip_by_idx[s.idx] for s in shots]
 
         # ----- Stitch -----
         if len(clip_urls) == 1:
             # Single shot — no stitch needed.
             total_elapsed = round(time.monotonic() - t0, 2)
-            yield f"data: {json.dumps({'type': 'done', 'final_url': clip_urls[0], 'total_elapsed_s': total_elapsed})}\n\n"
+            yield f"data: {json.dumps({'type': 'done', 'final_url': clip_urls[0], 'renditions': RenditionInstance.links(clip_urls[0]), 'total_elapsed_s': total_elapsed})}\n\n"
             return
 
         yield f"data: {json.dumps({'type': 'stitch', 'status': 'running'})}\n\n"
@@ -491,7 +525,9 @@ async def director_run(
             return
 
         total_elapsed = round(time.monotonic() - t0, 2)
-        yield f"data: {json.dumps({'type': 'stitch', 'status': 'ok', 'url': stitched.output_url})}\n\n"
-        yield f"data: {json.dumps({'type': 'done', 'final_url': stitched.output_url, 'total_elapsed_s': total_elapsed})}\n\n"
+        # Same lazy poster / preview / hls links a canvas video block gets.
+        renditions = RenditionInstance.links(stitched.output_url)
+        yield f"data: {json.dumps({'type': 'stitch', 'status': 'ok', 'url': stitched.output_url, 'renditions': renditions})}\n\n"
+        yield f"data: {json.dumps({'type': 'done', 'final_url': stitched.output_url, 'renditions': renditions, 'total_elapsed_s': total_elapsed})}\n\n"
 
     return StreamingResponse(stream(), media_type="text/event-stream")
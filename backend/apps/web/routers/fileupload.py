@@ -1,9 +1,21 @@
+import asyncio
 import base64
+import datetime
 import logging
+import os
 import re
-from fastapi import APIRouter, HTTPException, status
+import tempfile
+import uuid
+from typing import Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from apps.web.util.aliossutils import AliOSSUtil
-from apps.web.models.fileupload import UploadBase
+from apps.web.models.fileupload import (
+    UploadBase,
+    PresignUploadForm,
+    CompleteUploadForm,
+    UploadedFilesInstance,
+)
+from utils.utils import get_current_user
 
 log = logging.getLogger(__name__)
 
@@ -12,6 +24,8 @@ router = APIRouter()
 # Size limit: 20 MB (raw file size; base64-encoded payload is ~4/3 larger)
 MAX_FILE_BYTES = 20 * 1024 * 1024
 MAX_BASE64_CHARS = int(MAX_FILE_BYTES * 4 / 3) + 1024  # rough upper bound
+# Multipart framing (boundaries, part headers) on top of the file itself.
+MAX_MULTIPART_OVERHEAD = 64 * 1024
 
 # Whitelisted MIME types for uploads
 ALLOWED_MIME_PREFIXES = (
@@ -25,8 +39,276 @@ ALLOWED_MIME_PREFIXES = (
     "audio/ogg",
 )
 
-# Extract MIME type from a data URL: data:<mime>;base64,<payload>
-_DATA_URL_RE = re.compile(r"^data:([\w+.\-/]+);base64,(.+)$", re.DOTALL)
+# Extension used for presigned upload keys, per allowed MIME type.
+_MIME_EXT = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/gif": "gif",
+    "audio/wav": "wav",
+    "audio/mpeg": "mp3",
+    "audio/mp3": "mp3",
+    "audio/ogg": "ogg",
+}
+
+# Presigned POST policies are only good for this long.
+PRESIGN_TTL_S = int(os.getenv("UPLOAD_PRESIGN_TTL_S", "300"))
+
+# Header of a data URL: data:<mime>;base64
+_DATA_URL_HEAD_RE = re.compile(r"^data:([\w+.\-/]+);base64$")
+
+# Bytes needed to recognise every type below.
+SNIFF_BYTES = 12
+
+
+def sniff_mime(head: bytes) -> Optional[Tuple[str, str]]:
+    """(mime, extension) from a file's leading bytes, for the allowed types."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg", "jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png", "png"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif", "gif"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    if head.startswith(b"RIFF") and head[8:12] == b"WAVE":
+        return "audio/wav", "wav"
+    if head.startswith(b"OggS"):
+        return "audio/ogg", "ogg"
+    if head.startswith(b"ID3") or head[:2] in (b"\xff\xfb", b"\xff\xf3", b"\xff\xf2"):
+        return "audio/mpeg", "mp3"
+    return None
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Upload too large (max {MAX_FILE_BYTES // (1024 * 1024)} MB)",
+    )
+
+
+class _UploadSink:
+    """Spools an upload to a temp file, checking type and size as it goes."""
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(prefix="upload_")
+        self._f = os.fdopen(fd, "wb")
+        self._head = b""
+        self.size = 0
+        self.mime: Optional[Tuple[str, str]] = None
+
+    def write(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.size > MAX_FILE_BYTES:
+            raise _too_large()
+        if self.mime is None and len(self._head) < SNIFF_BYTES:
+            self._head += chunk[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._check_type()
+        self._f.write(chunk)
+
+    def _check_type(self) -> None:
+        self.mime = sniff_mime(self._head)
+        if self.mime is None:
+            raise HTTPException(
+                status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="Unrecognised or disallowed file type",
+            )
+
+    def finish(self) -> Tuple[str, str]:
+        self._f.close()
+        if self.size == 0:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Empty upload")
+        if self.mime is None:
+            self._check_type()
+        return self.mime
+
+    def close(self) -> None:
+        self._f.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+async def _read_multipart(request: Request, content_type: str, sink: _UploadSink) -> None:
+    """Feed the `file` field of a multipart body into `sink`, chunk by chunk."""
+    from python_multipart.multipart import MultipartParser, parse_options_header
+
+    _ctype, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Missing multipart boundary")
+
+    state = {"field": b"", "value": b"", "disposition": b"", "in_file": False, "seen": False}
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        if state["field"].lower() == b"content-disposition":
+            state["disposition"] = state["value"]
+        state["field"] = state["value"] = b""
+
+    def on_headers_finished():
+        _disp, opts = parse_options_header(state["disposition"])
+        state["in_file"] = opts.get(b"name") == b"file" and not state["seen"]
+        state["disposition"] = b""
+
+    def on_part_data(data, start, end):
+        if state["in_file"]:
+            sink.write(data[start:end])
+
+    def on_part_end():
+        if state["in_file"]:
+            state["seen"] = True
+        state["in_file"] = False
+
+    parser = MultipartParser(
+        boundary,
+        {
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        },
+        max_size=MAX_FILE_BYTES + MAX_MULTIPART_OVERHEAD,
+    )
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except HTTPException:
+        raise
+    except Exception as e:
+        if sink.size > MAX_FILE_BYTES or "max_size" in str(e):
+            raise _too_large()
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=f"Malformed multipart body: {e}")
+    if not state["seen"]:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Missing `file` field")
+
+
+@router.post("/file")
+async def upload_file_stream(request: Request):
+    """Binary upload: a raw body or a multipart `file` field.
+
+    The body is never held in memory: it is spooled to a temp file in
+    request-sized chunks, the type is taken from its magic bytes (not the
+    client's Content-Type), MAX_FILE_BYTES is enforced as bytes arrive,
+    and the file is then streamed to OSS.
+    """
+    try:
+        declared = int(request.headers.get("content-length") or 0)
+    except ValueError:
+        declared = 0
+    if declared > MAX_FILE_BYTES + MAX_MULTIPART_OVERHEAD:
+        raise _too_large()
+
+    content_type = request.headers.get("content-type", "")
+    sink = _UploadSink()
+    try:
+        if content_type.startswith("multipart/form-data"):
+            await _read_multipart(request, content_type, sink)
+        else:
+            async for chunk in request.stream():
+                sink.write(chunk)
+        mime, ext = sink.finish()
+
+        from apps.web.util.aliossutils import oss_url
+        from apps.web.util.ossupload import upload_file
+        date = datetime.datetime.now().strftime("%Y/%m/%d")
+        key = f"{date}/upload_{uuid.uuid4()}.{ext}"
+        try:
+            await upload_file(sink.path, key, mime)
+        except Exception as e:
+            log.error("OSS upload error: %s", e)
+            raise HTTPException(status.HTTP_502_BAD_GATEWAY, detail="Upload to storage failed")
+        return f"{oss_url}{key}"
+    finally:
+        sink.close()
+
+
+@router.post("/presign")
+async def presign_upload(form: PresignUploadForm, user=Depends(get_current_user)):
+    """Signed OSS POST policy so the browser uploads directly to OSS.
+
+    The policy only allows this user's `uploads/<user>/<date>/` key, the
+    declared Content-Type and at most the declared size. The client
+    POSTs `fields` plus the file to `url`, then calls /upload/complete.
+    """
+    ext = _MIME_EXT.get(form.content_type)
+    if ext is None:
+        raise HTTPException(
+            status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Disallowed MIME type: {form.content_type}",
+        )
+    if form.size <= 0 or form.size > MAX_FILE_BYTES:
+        raise _too_large()
+
+    date = datetime.datetime.now().strftime("%Y/%m/%d")
+    key = f"uploads/{user.id}/{date}/{uuid.uuid4().hex}.{ext}"
+    try:
+        policy = AliOSSUtil.post_policy(key, form.content_type, form.size, PRESIGN_TTL_S)
+    except RuntimeError as e:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
+    return {"key": key, **policy}
+
+
+@router.post("/complete")
+async def complete_upload(form: CompleteUploadForm, user=Depends(get_current_user)):
+    """Register a presigned upload once it is in OSS; returns its public URL.
+
+    Only the first SNIFF_BYTES of the object are read back, to check its
+    real type; objects that fail the checks are deleted.
+    """
+    key = form.key
+    if not key.startswith(f"uploads/{user.id}/") or ".." in key:
+        raise HTTPException(status.HTTP_403_FORBIDDEN, detail="Not your upload")
+
+    existing = UploadedFilesInstance.get_by_key(key)
+    if existing is not None:
+        return {"key": key, "url": existing.url, "content_type": existing.content_type,
+                "size": existing.size}
+
+    from apps.web.util.aliossutils import oss_url
+    bucket = AliOSSUtil._get_bucket()
+    try:
+        meta = await asyncio.to_thread(bucket.head_object, key)
+    except Exception:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, detail="Upload not found")
+
+    def read_head():
+        return bucket.get_object(key, byte_range=(0, SNIFF_BYTES - 1)).read()
+
+    size = int(meta.content_length or 0)
+    reject = None
+    if size > MAX_FILE_BYTES:
+        reject = _too_large()
+    else:
+        sniffed = sniff_mime(await asyncio.to_thread(read_head))
+        declared = (meta.content_type or "").replace("audio/mp3", "audio/mpeg")
+        if sniffed is None or (declared and declared != sniffed[0]):
+            reject = HTTPException(
+                status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="Unrecognised or disallowed file type",
+            )
+    if reject is not None:
+        try:
+            await asyncio.to_thread(bucket.delete_object, key)
+        except Exception as e:
+            log.warning("delete of rejected upload %s failed: %s", key, e)
+        raise reject
+
+    url = f"{oss_url}{key}"
+    UploadedFilesInstance.insert_upload(user.id, key, url, sniffed[0], size)
+    return {"key": key, "url": url, "content_type": sniffed[0], "size": size}
 
 
 @router.post("/base")
@@ -35,36 +317,34 @@ async def upload_base64(upload: UploadBase):
 
     # 1. Reject obviously oversized strings before decoding (cheap).
     if len(payload) > MAX_BASE64_CHARS:
-        raise HTTPException(
-            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"Upload too large (max {MAX_FILE_BYTES // (1024 * 1024)} MB)",
-        )
+        raise _too_large()
 
-    # 2. If a data URL was sent, validate MIME and strip prefix.
-    m = _DATA_URL_RE.match(payload.strip())
+    # 2. If a data URL was sent, validate MIME and strip prefix. Only the
+    #    short header is matched, not the whole payload.
     mime = None
-    if m:
-        mime, b64_body = m.group(1), m.group(2)
-        if not any(mime.startswith(p) for p in ALLOWED_MIME_PREFIXES):
-            raise HTTPException(
-                status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-                detail=f"Disallowed MIME type: {mime}",
-            )
-    else:
-        b64_body = payload
+    b64_body = payload
+    if payload.startswith("data:"):
+        head, _sep, body = payload.partition(",")
+        m = _DATA_URL_HEAD_RE.match(head.strip())
+        if m:
+            mime, b64_body = m.group(1), body
+            if not any(mime.startswith(p) for p in ALLOWED_MIME_PREFIXES):
+                raise HTTPException(
+                    status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                    detail=f"Disallowed MIME type: {mime}",
+                )
 
     # 3. Decode and check actual byte size. Invalid base64 -> 400.
+    if b64_body[-1:].isspace():
+        b64_body = b64_body.rstrip()
     try:
         decoded = base64.b64decode(b64_body, validate=True)
     except Exception:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, detail="Invalid base64 payload")
 
     if len(decoded) > MAX_FILE_BYTES:
-        raise HTTPException(
-            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail=f"Upload too large (max {MAX_FILE_BYTES // (1024 * 1024)} MB)",
-        )
+        raise _too_large()
 
-    # 4. Pass through to OSS. Pass the original data string so behaviour is unchanged.
-    file_url = AliOSSUtil.upload_base64_to_oss(upload.data)
+    # 4. Upload the bytes decoded above (stored as before: audio/wav key).
+    file_url = await asyncio.to_thread(AliOSSUtil.upload_bytes_to_oss, decoded)
     return file_url
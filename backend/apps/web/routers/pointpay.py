@@ -4,6 +4,7 @@ import os
 import asyncio
 
 from apps.web.models.pay import PayTableInstall
+from apps.web.util.chainrpc import ReceiptServiceInstance, find_transfer, receipt_ok, to_wei
 from utils.utils import get_current_user
 import logging
 
@@ -97,70 +98,37 @@ async def pointcheck(request: Request, user=Depends(get_current_user)):
 
         # Phase 2: Verify DLCP transfer on DBC Chain
         try:
-            tx_receipt = await asyncio.to_thread(
-                w3_dbc.eth.wait_for_transaction_receipt, hash, timeout=30
-            )
+            tx_receipt = await ReceiptServiceInstance.wait(DBC_RPC, hash, timeout=30)
         except Exception as e:
-            log.info(f"pointpay wait_for_transaction_receipt error: {e}")
+            log.info(f"pointpay receipt error: {e}")
+            return {"ok": False, "message": "check Failed"}
+        if tx_receipt is None:
+            log.info(f"pointpay receipt for {hash} not found within 30s")
             return {"ok": False, "message": "check Failed"}
 
-        # Parse expected amount to wei (18 decimals)
-        try:
-            expected_amount_float = float(amount)
-            expected_amount_wei = int(expected_amount_float * (10 ** TOKEN_DECIMALS))
-        except (ValueError, TypeError):
+        expected_amount_wei = to_wei(amount)
+        if expected_amount_wei is None:
             return {"ok": False, "message": "check Failed"}
 
-        if tx_receipt.status == 1:
-            # Loop var is `evt` not `log` because shadowing the module-level
-            # `log` logger inside this function makes the earlier
-            # `log.info(...)` calls (lines ~67, ~122) raise
-            # UnboundLocalError as soon as Python sees this rebinding.
-            for evt in tx_receipt["logs"]:
-                event_signature_hash = w3_dbc.keccak(
-                    text="Transfer(address,address,uint256)"
-                ).hex()
-                if evt["topics"][0].hex() == event_signature_hash:
-                    from_address_hex = evt["topics"][1].hex()[24:]
-                    to_address_hex = evt["topics"][2].hex()[24:]
-                    from_address = w3_dbc.to_checksum_address("0x" + from_address_hex)
-                    to_address = w3_dbc.to_checksum_address("0x" + to_address_hex)
-
-                    # Verify: sender matches user, receiver matches our wallet
-                    if (
-                        address.lower() == from_address.lower()
-                        and DLCP_RECEIVE_ADDRESS.lower() == to_address.lower()
-                    ):
-                        # Verify token contract address
-                        evt_contract = evt["address"]
-                        if evt_contract.lower() != DLCP_TOKEN_ADDRESS.lower():
-                            continue
-
-                        # Verify transferred amount from log data
-                        try:
-                            actual_amount_wei = int(evt["data"].hex(), 16)
-                        except (ValueError, AttributeError):
-                            try:
-                                actual_amount_wei = int(evt["data"], 16)
-                            except (ValueError, TypeError):
-                                continue
-
-                        if actual_amount_wei < expected_amount_wei:
-                            continue
-
-                        try:
-                            if payinfo is None:
-                                PayTableInstall.insert_pay(
-                                    address, model, size, duration, amount,
-                                    messageid, hash, True, True,
-                                )
-                            else:
-                                PayTableInstall.update_hash_status(
-                                    payinfo.id, hash, True, True
-                                )
-                            return {"ok": True, "message": "check success"}
-                        except Exception as e:
-                            log.info(f"pointpay error:{e}")
-                            return {"ok": False, "message": "check Failed"}
+        # Verify: sender matches user, receiver matches our wallet, the
+        # token is DLCP and at least the expected amount moved.
+        if receipt_ok(tx_receipt) and find_transfer(
+            tx_receipt, DLCP_RECEIVE_ADDRESS, sender=address,
+            token=DLCP_TOKEN_ADDRESS, min_wei=expected_amount_wei,
+        ) is not None:
+            try:
+                if payinfo is None:
+                    PayTableInstall.insert_pay(
+                        address, model, size, duration, amount,
+                        messageid, hash, True, True,
+                    )
+                else:
+                    PayTableInstall.update_hash_status(
+                        payinfo.id, hash, True, True
+                    )
+                return {"ok": True, "message": "check success"}
+            except Exception as e:
+                log.info(f"pointpay error:{e}")
+                return {"ok": False, "message": "check Failed"}
 
         return {"ok": False, "message": "check Failed"}
@@ -32,15 +32,16 @@ from utils.misc import parse_duration, validate_email_format
 
 # --------钱包相关--------
 from web3 import Web3
+from apps.web.util.chainrpc import ReceiptServiceInstance, find_transfer, receipt_ok
 #w3 = Web3(Web3.HTTPProvider('https://rpc-testnet.dbcwallet.io'))  # 旧以太坊主网
-w3 = Web3(Web3.HTTPProvider('https://rpc1.dbcwallet.io')) # 新以太坊主网
+DBC_RPC = 'https://rpc1.dbcwallet.io' # 新以太坊主网
+w3 = Web3(Web3.HTTPProvider(DBC_RPC))
 #tranAddress = "0x75A877EAB8CbD11836E27A137f7d0856ab8b90f8" # 测试地址
 tranAddress="0x40Ff2BD3668B38B0dd0BD7F26Aa809239Fc9113a"
 
-binancew3 = Web3(Web3.HTTPProvider('https://bsc-dataseed.binance.org/')) # 币安以太坊主网
+BSC_RPC = 'https://bsc-dataseed.binance.org/' # 币安以太坊主网
 
 # from web3.auto import w3
-import asyncio
 
 log = logging.getLogger(__name__)
 log.setLevel(SRC_LOG_LEVELS["MODELS"])
@@ -279,44 +280,25 @@ async def openPro(form_data: UserRoleUpdateProForm, session_user=Depends(get_cur
             # get tran hash value
             tx_hash = form_data.tx
             # tx = w3.eth.get_transaction(tx_hash)
-            if form_data.binanceflag:
-                tx_receipt = await asyncio.to_thread(binancew3.eth.wait_for_transaction_receipt, tx_hash)
-            else:
-                tx_receipt = await asyncio.to_thread(w3.eth.wait_for_transaction_receipt, tx_hash)
-            # print("receipt", tx_receipt)
+            rpc_url = BSC_RPC if form_data.binanceflag else DBC_RPC
+            tx_receipt = await ReceiptServiceInstance.wait(rpc_url, tx_hash, timeout=120)
             log.info(f"receipt {tx_receipt}")
 
-            if tx_receipt.status == 1:
-                # Loop var is `evt` not `log` because shadowing the
-                # module-level `log` logger inside this function turns
-                # earlier `log.info(...)` calls into UnboundLocalError.
-                for evt in tx_receipt['logs']:
-                    # Parse the target address (Transfer event):
-                    # event Transfer(address indexed from, address indexed to, uint256 value);
-                    event_signature_hash = w3.keccak(text='Transfer(address,address,uint256)').hex()
-                    if evt['topics'][0].hex() == event_signature_hash:
-                        from_address_hex = evt['topics'][1].hex()
-                        to_address_hex = evt['topics'][2].hex()
-
-                        # Process the address
-                        from_address_hex = from_address_hex[26:]
-                        to_address_hex = to_address_hex[26:]
-
-                        from_address = w3.to_checksum_address('0x' + from_address_hex)
-                        to_address = w3.to_checksum_address('0x' + to_address_hex)
-
-                        log.info(f"From: {from_address}")
-                        log.info(f"To: {to_address}")
-
-                        if to_address == tranAddress:
-                            log.info("run update_user_vip")
-                            update_user_vip(session_user.id, tx_hash, form_data.vip, form_data.viptime)
-
-                            # get vip info
-                            viplist = VIPStatuses.get_vip_status_by_user_id(session_user.id)
-                            return {"ok": True, "data": viplist}
-                else:
-                    return {"ok": False, "data": []}
+            if receipt_ok(tx_receipt):
+                # Parse the target address (Transfer event):
+                # event Transfer(address indexed from, address indexed to, uint256 value);
+                transfer = find_transfer(tx_receipt, tranAddress)
+                if transfer is not None:
+                    log.info(f"From: {transfer.sender}")
+                    log.info(f"To: {transfer.receiver}")
+                    log.info("run update_user_vip")
+                    update_user_vip(session_user.id, tx_hash, form_data.vip, form_data.viptime)
+
+                    # get vip info
+                    viplist = VIPStatuses.get_vip_status_by_user_id(session_user.id)
+                    return {"ok": True, "data": viplist}
+            else:
+                return {"ok": False, "data": []}
 
         except Exception as e:
             log.info(f"============upgradeVip=========={e}")
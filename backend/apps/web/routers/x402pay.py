@@ -1,9 +1,10 @@
-from typing import Any, Dict
+import asyncio
+from typing import Any, Callable, Dict, Tuple
 from fastapi import APIRouter, Request
 from cdp.x402 import create_facilitator_config
 from x402.fastapi.middleware import require_payment
 from apps.web.models.pay import PayTableInstall
-from apps.web.ai.wave import WaveApiInstance
+from apps.web.ai.wave import WaveApiInstance, AsyncWaveApiInstance
 import uuid
 import os
 import logging
@@ -90,19 +91,65 @@ async def payment_middleware(request: Request, call_next):
 
     # Correct per-model pricing (fixes prior bug).
     result = calTotal(request, slug)
-    request.state.messageid = result["messageid"]
-
-    inner_middleware = require_payment(
-        path=path,
-        price=result["amount"],
-        pay_to_address=COINBASE_ADDRESS,
-        network="base",
-        facilitator_config=facilitator_config,
-    )
-    response = await inner_middleware(request, call_next)
+    messageid = result["messageid"]
+    request.state.messageid = messageid
+
+    async def record_and_call_next(req: Request):
+        # require_payment only gets here once the facilitator has
+        # verified X-PAYMENT; bare 402 challenges never touch the DB.
+        verify = getattr(req.state, "verify_response", None)
+        await asyncio.to_thread(
+            _record_verified_payment, req, slug, result["amount"], messageid,
+            getattr(verify, "payer", None) or "",
+        )
+        return await call_next(req)
+
+    response = await _payment_gate(path, result["amount"])(request, record_and_call_next)
+    if response.headers.get("X-PAYMENT-RESPONSE"):
+        # Settled on-chain.
+        await asyncio.to_thread(_mark_settled, messageid)
     return _no_cache(response)
 
 
+# require_payment() re-validates the price and builds a facilitator
+# client on every call. Prices come from wave.PRICE_TABLE, so there are
+# only a few dozen (path, price) pairs: build each gate once.
+_gates: Dict[Tuple[str, str], Callable] = {}
+
+
+def _payment_gate(path: str, amount: str) -> Callable:
+    gate = _gates.get((path, amount))
+    if gate is None:
+        gate = require_payment(
+            path=path,
+            price=amount,
+            pay_to_address=COINBASE_ADDRESS,
+            network="base",
+            facilitator_config=facilitator_config,
+        )
+        _gates[(path, amount)] = gate
+    return gate
+
+
+def _record_verified_payment(request: Request, slug: str, amount: str,
+                             messageid: str, payer: str) -> None:
+    size = request.query_params.get("size") or "720p"
+    duration = request.query_params.get("duration") or "5"
+    try:
+        PayTableInstall.insert_pay(
+            payer, slug, size, int(duration) if duration.isdigit() else 0,
+            amount, messageid, "", False, True,
+        )
+    except Exception as e:
+        log.warning(f"x402 pay record insert failed for {messageid}: {e}")
+
+
+def _mark_settled(messageid: str) -> None:
+    pay = PayTableInstall.get_by_messageid(messageid)
+    if pay is not None:
+        PayTableInstall.update_status(pay.id, True, True)
+
+
 def calTotal(request: Request, model: str):
     messageid = str(uuid.uuid4())
     # Default to the canonical pricing tier when the client omits
@@ -112,6 +159,7 @@ def calTotal(request: Request, model: str):
     # 500'd before payment-middleware could even run.
     size = request.query_params.get("size") or "720p"
     duration = request.query_params.get("duration") or "5"
+    # Pure in-memory lookup; see _record_verified_payment for the DB row.
     return WaveApiInstance.calc_model_price(model, duration, size, messageid)
 
 
@@ -124,7 +172,7 @@ def _make_creator_handler(slug: str):
         if pay is not None:
             PayTableInstall.update_status(pay.id, True, True)
 
-        result = WaveApiInstance.x402create(
+        result = await AsyncWaveApiInstance.x402create(
             cfg["vendor"], cfg["model"], prompt, duration, size
         )
 
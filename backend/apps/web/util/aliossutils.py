@@ -3,6 +3,9 @@ import os
 import datetime
 import uuid
 import base64
+import hashlib
+import hmac
+import json
 import logging
 
 log = logging.getLogger(__name__)
@@ -15,6 +18,8 @@ access_key_secret = os.getenv("FILE_ACCESS_KEY_SECRET")
 endpoint = os.getenv("FILE_HK_ENDPOINT")
 bucket_name = os.getenv("FILE_BUCKET_HK_NAME")
 oss_url = os.getenv("FILE_OSS_HK_URL")
+# Dev/smoke tests: store objects in this directory instead of Aliyun.
+local_dir = os.getenv("OSS_LOCAL_DIR")
 
 
 class AliOssUtils:
@@ -25,6 +30,9 @@ class AliOssUtils:
         self._bucket = None
 
     def _get_bucket(self):
+        if self._bucket is None and local_dir:
+            from apps.web.util.ossupload import LocalBucket
+            self._bucket = LocalBucket(local_dir)
         if self._bucket is None:
             if not (access_key_id and access_key_secret and endpoint and bucket_name):
                 raise RuntimeError(
@@ -38,17 +46,23 @@ class AliOssUtils:
 
     def upload_base64_to_oss(self, base64_str):
         try:
-            now = datetime.datetime.now()
-            formatted_date = now.strftime("%Y/%m/%d")
-            file_name = f"{formatted_date}/audio_{uuid.uuid4()}.wav"
-
             if "," in base64_str:
                 base64_str = base64_str.split(",")[1]
 
             audio_data = base64.b64decode(base64_str)
+        except Exception as e:
+            log.error("OSS upload error: %s", e)
+            return None
+        return self.upload_bytes_to_oss(audio_data)
+
+    def upload_bytes_to_oss(self, data, content_type="audio/wav", ext="wav"):
+        try:
+            now = datetime.datetime.now()
+            formatted_date = now.strftime("%Y/%m/%d")
+            file_name = f"{formatted_date}/audio_{uuid.uuid4()}.{ext}"
 
             result = self._get_bucket().put_object(
-                file_name, audio_data, headers={"Content-Type": "audio/wav"}
+                file_name, data, headers={"Content-Type": content_type}
             )
 
             if result.status == 200:
@@ -59,5 +73,41 @@ class AliOssUtils:
             log.error("OSS upload error: %s", e)
             return None
 
+    def post_policy(self, key, content_type, max_bytes, ttl_s):
+        """Form fields for a browser POST of exactly `key` straight to OSS.
+
+        The signed policy pins the key, the Content-Type and a
+        1..max_bytes size range, and expires after `ttl_s` seconds.
+        """
+        if not (access_key_id and access_key_secret and endpoint and bucket_name):
+            raise RuntimeError("presigned uploads need AliOSS credentials")
+        expires = datetime.datetime.utcnow() + datetime.timedelta(seconds=ttl_s)
+        policy = {
+            "expiration": expires.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "conditions": [
+                {"bucket": bucket_name},
+                ["eq", "$key", key],
+                ["eq", "$Content-Type", content_type],
+                ["content-length-range", 1, int(max_bytes)],
+            ],
+        }
+        policy_b64 = base64.b64encode(json.dumps(policy).encode()).decode()
+        signature = base64.b64encode(
+            hmac.new(access_key_secret.encode(), policy_b64.encode(), hashlib.sha1).digest()
+        ).decode()
+        host = endpoint.split("://")[-1].rstrip("/")
+        return {
+            "url": f"https://{bucket_name}.{host}",
+            "fields": {
+                "key": key,
+                "OSSAccessKeyId": access_key_id,
+                "policy": policy_b64,
+                "Signature": signature,
+                "Content-Type": content_type,
+                "success_action_status": "200",
+            },
+            "expires_at": int(expires.replace(tzinfo=datetime.timezone.utc).timestamp()),
+        }
+
 
 AliOSSUtil = AliOssUtils()
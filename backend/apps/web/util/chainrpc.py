@@ -0,0 +1,336 @@
+"""Async JSON-RPC pool and receipt verification for on-chain payments.
+
+The payment endpoints (canvas/director /charge, bnbpay and pointpay
+/check, users /pro) used to block a threadpool worker for up to 30 s
+each in web3's wait_for_transaction_receipt, so a burst of checkouts
+could exhaust the pool. They now await ReceiptServiceInstance instead:
+
+    receipt = await ReceiptServiceInstance.wait(rpc_url, tx_hash, timeout=30)
+    if receipt_ok(receipt) and find_transfer(receipt, receiver, sender=...,
+                                             token=..., min_wei=...):
+        ...
+
+Pending hashes are polled by one background loop, like the WaveSpeed
+prediction poller: every tick the due hashes for an RPC endpoint go out
+as a single batched eth_getTransactionReceipt request, however many
+callers are waiting. Each hash starts at RECEIPT_POLL_MIN_S and backs
+off by RECEIPT_POLL_BACKOFF up to RECEIPT_POLL_MAX_S while it isn't
+mined. New hashes wait RECEIPT_BATCH_WINDOW_S before their first poll so
+a burst of checkouts shares one request.
+
+Mined receipts are kept in a small LRU keyed by (endpoint, hash), so a
+client retrying /check doesn't go back to the node. Receipts are plain
+JSON-RPC dicts (hex strings), not web3 AttributeDicts.
+"""
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+from pydantic import BaseModel
+
+from apps.web.util.metrics import counter
+
+log = logging.getLogger(__name__)
+
+CHAIN_RPC_POOL_LIMIT = int(os.getenv("CHAIN_RPC_POOL_LIMIT", "32"))
+CHAIN_RPC_TIMEOUT_S = float(os.getenv("CHAIN_RPC_TIMEOUT_S", "15"))
+RECEIPT_POLL_MIN_S = float(os.getenv("RECEIPT_POLL_MIN_S", "1.0"))
+RECEIPT_POLL_MAX_S = float(os.getenv("RECEIPT_POLL_MAX_S", "4.0"))
+RECEIPT_POLL_BACKOFF = 1.5
+RECEIPT_BATCH_WINDOW_S = 0.05
+# Public nodes reject very large batches; split above this.
+RECEIPT_BATCH_SIZE = 50
+RECEIPT_CACHE_SIZE = 4096
+RECEIPT_WAIT_S = 30
+
+TOKEN_DECIMALS = 18
+# keccak("Transfer(address,address,uint256)")
+TRANSFER_TOPIC = "0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef"
+
+WAITS = counter("creator_receipt_waits_total", "Transaction receipt waits", ["result"])
+BATCHES = counter("creator_receipt_batches_total", "Batched eth_getTransactionReceipt calls", ["result"])
+
+
+class RpcError(Exception):
+    pass
+
+
+class Transfer(BaseModel):
+    token: str
+    sender: str
+    receiver: str
+    value: int
+
+
+def to_wei(amount: Any, multiplier: float = 1) -> Optional[int]:
+    """Decimal token amount (e.g. "0.75") to wei, or None if unparseable."""
+    try:
+        return int(float(amount) * multiplier * (10 ** TOKEN_DECIMALS))
+    except (ValueError, TypeError):
+        return None
+
+
+def receipt_ok(receipt: Optional[Dict[str, Any]]) -> bool:
+    if not receipt:
+        return False
+    try:
+        return int(receipt.get("status") or "0x0", 16) == 1
+    except (ValueError, TypeError):
+        return False
+
+
+def _topic_address(topic: str) -> str:
+    # Indexed addresses are left-padded to 32 bytes.
+    return "0x" + topic[-40:].lower()
+
+
+def address_topic(address: str) -> str:
+    """`address` as an indexed-topic filter value (eth_getLogs)."""
+    return "0x" + address.lower()[2:].rjust(64, "0")
+
+
+def parse_transfer_log(evt: Dict[str, Any]) -> Optional[Transfer]:
+    """An ERC20 Transfer from one raw log entry, addresses lower-cased."""
+    topics = evt.get("topics") or []
+    if len(topics) < 3 or str(topics[0]).lower() != TRANSFER_TOPIC:
+        return None
+    try:
+        value = int(evt.get("data") or "0x0", 16)
+    except (ValueError, TypeError):
+        return None
+    return Transfer(
+        token=str(evt.get("address") or "").lower(),
+        sender=_topic_address(topics[1]),
+        receiver=_topic_address(topics[2]),
+        value=value,
+    )
+
+
+def transfers(receipt: Dict[str, Any]) -> List[Transfer]:
+    """All ERC20 Transfer events in a receipt."""
+    out = []
+    for evt in receipt.get("logs") or []:
+        t = parse_transfer_log(evt)
+        if t is not None:
+            out.append(t)
+    return out
+
+
+def find_transfer(receipt: Dict[str, Any], receiver: str, sender: Optional[str] = None,
+                  token: Optional[str] = None, min_wei: int = 0) -> Optional[Transfer]:
+    """First Transfer to `receiver` matching the optional filters."""
+    for t in transfers(receipt):
+        if t.receiver != receiver.lower():
+            continue
+        if sender is not None and t.sender != sender.lower():
+            continue
+        if token is not None and t.token != token.lower():
+            continue
+        if t.value < min_wei:
+            continue
+        return t
+    return None
+
+
+class JsonRpcPool:
+    """One keep-alive aiohttp session shared by every RPC endpoint."""
+
+    def __init__(self):
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._ids = itertools.count(1)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=CHAIN_RPC_POOL_LIMIT,
+                limit_per_host=CHAIN_RPC_POOL_LIMIT,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=CHAIN_RPC_TIMEOUT_S),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def batch(self, url: str, calls: List[Tuple[str, list]]) -> List[Any]:
+        """Send `calls` as one JSON-RPC batch; returns results in order.
+
+        A call the node rejected comes back as an RpcError in its slot;
+        transport failures raise.
+        """
+        if not url:
+            raise RpcError("no RPC url configured")
+        ids = [next(self._ids) for _ in calls]
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in zip(ids, calls)
+        ]
+        async with self._get_session().post(url, json=payload) as resp:
+            resp.raise_for_status()
+            data = await resp.json(content_type=None)
+        if isinstance(data, dict):
+            # Some nodes answer a whole rejected batch with one error object.
+            raise RpcError(str(data.get("error") or data))
+        by_id = {item.get("id"): item for item in data if isinstance(item, dict)}
+        out = []
+        for i in ids:
+            item = by_id.get(i)
+            if item is None:
+                out.append(RpcError("missing response"))
+            elif item.get("error"):
+                out.append(RpcError(str(item["error"])))
+            else:
+                out.append(item.get("result"))
+        return out
+
+    async def call(self, url: str, method: str, params: list) -> Any:
+        result = (await self.batch(url, [(method, params)]))[0]
+        if isinstance(result, RpcError):
+            raise result
+        return result
+
+
+class _PendingReceipt:
+    __slots__ = ("url", "tx_hash", "waiters", "interval", "next_poll_at")
+
+    def __init__(self, url: str, tx_hash: str, now: float):
+        self.url = url
+        self.tx_hash = tx_hash
+        self.waiters: Set[asyncio.Future] = set()
+        self.interval = RECEIPT_POLL_MIN_S
+        self.next_poll_at = now + RECEIPT_BATCH_WINDOW_S
+
+
+class ReceiptService:
+    def __init__(self, rpc: Optional[JsonRpcPool] = None):
+        self.rpc = rpc or JsonRpcPool()
+        self._pending: Dict[Tuple[str, str], _PendingReceipt] = {}
+        self._cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def wait(self, url: str, tx_hash: str,
+                   timeout: float = RECEIPT_WAIT_S) -> Optional[Dict[str, Any]]:
+        """The mined receipt for `tx_hash`, or None after `timeout` seconds.
+
+        Raises RpcError if the node rejects the hash outright.
+        """
+        key = (url, (tx_hash or "").lower())
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            WAITS.labels("cached").inc()
+            return cached
+
+        job = self._pending.get(key)
+        if job is None:
+            job = _PendingReceipt(url, key[1], time.monotonic())
+            self._pending[key] = job
+        fut = asyncio.get_running_loop().create_future()
+        job.waiters.add(fut)
+        self._ensure_running()
+        try:
+            receipt = await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            WAITS.labels("timeout").inc()
+            return None
+        finally:
+            job.waiters.discard(fut)
+            if not job.waiters and self._pending.get(key) is job:
+                self._pending.pop(key, None)
+        WAITS.labels("mined").inc()
+        return receipt
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.rpc.close()
+
+    def _ensure_running(self) -> None:
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        else:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while self._pending:
+            now = time.monotonic()
+            due: Dict[str, List[_PendingReceipt]] = {}
+            for job in self._pending.values():
+                if job.next_poll_at <= now:
+                    due.setdefault(job.url, []).append(job)
+            batches = [
+                jobs[i:i + RECEIPT_BATCH_SIZE]
+                for jobs in due.values()
+                for i in range(0, len(jobs), RECEIPT_BATCH_SIZE)
+            ]
+            if batches:
+                await asyncio.gather(*(self._poll(jobs) for jobs in batches))
+            if not self._pending:
+                break
+            next_at = min(job.next_poll_at for job in self._pending.values())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), max(0.0, next_at - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, jobs: List[_PendingReceipt]) -> None:
+        url = jobs[0].url
+        try:
+            results = await self.rpc.batch(
+                url, [("eth_getTransactionReceipt", [job.tx_hash]) for job in jobs],
+            )
+            BATCHES.labels("ok").inc()
+        except Exception as e:
+            BATCHES.labels("error").inc()
+            log.warning("receipt batch of %d on %s failed: %s", len(jobs), url, e)
+            results = [None] * len(jobs)
+
+        now = time.monotonic()
+        for job, result in zip(jobs, results):
+            key = (job.url, job.tx_hash)
+            if isinstance(result, RpcError):
+                self._finish(key, job, exc=result)
+            elif isinstance(result, dict):
+                self._cache[key] = result
+                if len(self._cache) > RECEIPT_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+                self._finish(key, job, receipt=result)
+            else:
+                # Not mined yet (or the batch failed): back off.
+                job.interval = min(job.interval * RECEIPT_POLL_BACKOFF, RECEIPT_POLL_MAX_S)
+                job.next_poll_at = now + job.interval
+
+    def _finish(self, key, job: _PendingReceipt, receipt=None, exc=None) -> None:
+        if self._pending.get(key) is job:
+            self._pending.pop(key, None)
+        for fut in job.waiters:
+            if fut.done():
+                continue
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(receipt)
+
+
+ReceiptServiceInstance = ReceiptService()
@@ -0,0 +1,160 @@
+"""Shared, prioritised executor for ffmpeg subprocesses.
+
+Every ffmpeg run in the API process goes through FfmpegPoolInstance so
+that a burst of stitches can't oversubscribe the box:
+
+  - at most FFMPEG_MAX_CONCURRENT processes run at once (default: half
+    the CPUs, min 1 — libx264 already spreads one encode over several
+    cores);
+  - waiting jobs are served by priority, then FIFO, so quick last-frame
+    grabs (PRIORITY_FRAME) overtake queued full re-encodes
+    (PRIORITY_ENCODE), and both overtake speculative background work
+    (PRIORITY_BACKGROUND, see postgen);
+  - slots aren't preempted, so background jobs may hold at most
+    max_concurrent - 1 of them: a foreground job never waits for a
+    background run to finish (except on a single-slot pool, where
+    background work still gets the one slot when it is idle);
+  - each run has a timeout after which the process is killed, so a hung
+    ffmpeg can't hold a slot forever;
+  - queue depth, running jobs, run seconds and timeouts are exported
+    through apps.web.util.metrics.
+
+ffprobe calls are short and stay outside the pool (see mediaprobe).
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Tuple
+
+from apps.web.util.metrics import counter, gauge, histogram
+
+log = logging.getLogger(__name__)
+
+FFMPEG_MAX_CONCURRENT = int(
+    os.getenv("FFMPEG_MAX_CONCURRENT", str(max(1, (os.cpu_count() or 2) // 2)))
+)
+FFMPEG_DEFAULT_TIMEOUT_S = 600
+
+PRIORITY_FRAME = 0
+PRIORITY_ENCODE = 10
+PRIORITY_BACKGROUND = 20
+
+QUEUE_DEPTH = gauge("creator_ffmpeg_queue_depth", "ffmpeg jobs waiting for a slot")
+RUNNING = gauge("creator_ffmpeg_running", "ffmpeg processes currently running")
+RUN_SECONDS = histogram(
+    "creator_ffmpeg_run_seconds", "Wall time of ffmpeg runs", ["kind"],
+    buckets=(0.5, 1, 2, 5, 10, 20, 40, 80, 160, 320, 600),
+)
+WAIT_SECONDS = histogram(
+    "creator_ffmpeg_wait_seconds", "Time ffmpeg jobs spent queued", ["kind"],
+    buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+TIMEOUTS = counter("creator_ffmpeg_timeouts_total", "ffmpeg runs killed on timeout", ["kind"])
+
+
+class FfmpegPool:
+    def __init__(self, max_concurrent: int = FFMPEG_MAX_CONCURRENT):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_background = max(1, self.max_concurrent - 1)
+        self._active = 0
+        self._background = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _p, _s, fut in self._waiters if not fut.done())
+
+    def _can_start(self, priority: int) -> bool:
+        if self._active >= self.max_concurrent:
+            return False
+        return priority < PRIORITY_BACKGROUND or self._background < self.max_background
+
+    def _dispatch(self) -> None:
+        """Start waiters, best priority first, while slots allow."""
+        while self._waiters:
+            priority, _s, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            # Background jobs sort last, so a blocked head blocks the rest.
+            if not self._can_start(priority):
+                break
+            heapq.heappop(self._waiters)
+            self._active += 1
+            if priority >= PRIORITY_BACKGROUND:
+                self._background += 1
+            fut.set_result(None)
+        RUNNING.set(self._active)
+        QUEUE_DEPTH.set(self.queue_depth)
+
+    async def _acquire(self, priority: int) -> None:
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._dispatch()
+        try:
+            # _dispatch grants the slot by resolving the future, so the
+            # counters are already accounted for when this returns.
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Granted and cancelled in the same tick: pass it on.
+                self._release(priority)
+            raise
+        finally:
+            QUEUE_DEPTH.set(self.queue_depth)
+
+    def _release(self, priority: int) -> None:
+        self._active -= 1
+        if priority >= PRIORITY_BACKGROUND:
+            self._background -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_ENCODE, kind: str = "encode"):
+        t0 = time.monotonic()
+        await self._acquire(priority)
+        WAIT_SECONDS.labels(kind).observe(time.monotonic() - t0)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    async def run(self, args: List[str], priority: int = PRIORITY_ENCODE,
+                  timeout: float = FFMPEG_DEFAULT_TIMEOUT_S,
+                  kind: str = "encode") -> Tuple[int, bytes, bytes]:
+        """Run one ffmpeg command; returns (returncode, stdout, stderr).
+
+        A run that exceeds `timeout` is killed and reported as rc=-1 with
+        a "timed out" stderr, so callers' existing failure paths apply.
+        """
+        async with self.slot(priority, kind):
+            t0 = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            try:
+                so, se = await asyncio.wait_for(proc.communicate(), timeout)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                TIMEOUTS.labels(kind).inc()
+                log.warning("ffmpeg %s killed after %ss: %s", kind, timeout, " ".join(args[:6]))
+                return -1, b"", f"ffmpeg timed out after {timeout}s".encode()
+            except asyncio.CancelledError:
+                # Caller went away; don't leave an orphan encode running.
+                proc.kill()
+                await proc.wait()
+                raise
+            finally:
+                RUN_SECONDS.labels(kind).observe(time.monotonic() - t0)
+            return proc.returncode or 0, so, se
+
+
+FfmpegPoolInstance = FfmpegPool()
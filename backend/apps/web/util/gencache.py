@@ -0,0 +1,147 @@
+"""Opt-in result cache for paid generations (canvas videogen/imagegen).
+
+Re-running an unchanged block (Run All after editing one downstream
+prompt, a repeated director shot) used to pay WaveSpeed again for the
+same output. With GEN_CACHE_ENABLED=1 the generators first look up a
+fingerprint of everything that determines the output:
+
+    fingerprint(kind, model_path, prompt, duration, resolution, seed,
+                refs=[sha256 of each reference image / chained clip])
+
+and on a hit return the stored output URL instead of generating.
+Reference images are downloaded and hashed; a chained clip is never
+downloaded just for this (that would undo the range-read last-frame
+path), so it is identified by a content hash already known from the
+media cache or the rehost record, else by its URL.
+
+Entries live in Redis under `gencache:<fp>` with GEN_CACHE_TTL_S, and a
+`gencache:index` sorted set (score = insert time) caps the cache at
+GEN_CACHE_MAX_ENTRIES, evicting the oldest first. The stored URL is the
+one WaveSpeed returned; hits resolve it through the rehost mapping, so
+they return our OSS copy once it exists. Outputs whose copy never
+finished are only reachable through the vendor link, which is why the
+default TTL still stays under WaveSpeed's ~24h output lifetime. Without
+Redis every lookup is a miss.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from apps.web.util.metrics import counter
+
+log = logging.getLogger(__name__)
+
+GEN_CACHE_ENABLED = os.getenv("GEN_CACHE_ENABLED", "0") == "1"
+GEN_CACHE_TTL_S = int(os.getenv("GEN_CACHE_TTL_S", str(12 * 3600)))
+GEN_CACHE_MAX_ENTRIES = int(os.getenv("GEN_CACHE_MAX_ENTRIES", "50000"))
+
+LOOKUPS = counter(
+    "creator_gencache_lookups_total", "Generation cache lookups", ["kind", "result"],
+)
+
+# KEYS: index, entry. ARGV: value, ttl, now, max entries.
+_PUT = """
+redis.call('SET', KEYS[2], ARGV[1], 'EX', ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], KEYS[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', tonumber(ARGV[3]) - tonumber(ARGV[2]))
+local over = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[4])
+if over > 0 then
+  local old = redis.call('ZPOPMIN', KEYS[1], over)
+  for i = 1, #old, 2 do redis.call('DEL', old[i]) end
+end
+return 1
+"""
+
+
+def fingerprint(kind: str, model_path: str, prompt: str, duration: Any = None,
+                resolution: Any = None, seed: Any = None,
+                refs: Optional[List[str]] = None, **extra: Any) -> str:
+    """Canonical sha256 of a generation request.
+
+    `refs` are content hashes of reference media (not URLs), so the same
+    image uploaded twice still hits.
+    """
+    parts = {
+        "kind": kind,
+        "model": model_path,
+        "prompt": prompt.strip(),
+        "duration": str(duration or ""),
+        "resolution": str(resolution or "").lower(),
+        "seed": "" if seed is None else str(seed),
+        "refs": list(refs or []),
+    }
+    parts.update({k: str(v) for k, v in extra.items()})
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+async def content_hash(url: str, fetch: bool = True) -> Optional[str]:
+    """sha256 of the bytes behind `url`.
+
+    Free when the media cache holds the URL or the rehost worker has
+    recorded it; otherwise downloaded through the media cache, or None
+    when `fetch` is False or the download fails.
+    """
+    from apps.web.util.mediacache import MediaCacheInstance, content_sha256
+    from apps.web.util.rehost import RehostInstance
+    path = MediaCacheInstance.peek(url)
+    if path is not None:
+        return await asyncio.to_thread(content_sha256, path)
+    digest = await RehostInstance.content_sha(url)
+    if digest or not fetch:
+        return digest
+    try:
+        path = await MediaCacheInstance.fetch(url)
+    except Exception as e:
+        log.info("gencache: can't hash reference %s: %s", url[:80], e)
+        return None
+    return await asyncio.to_thread(content_sha256, path)
+
+
+class GenerationCache:
+    def __init__(self, prefix: str = "gencache"):
+        self.prefix = prefix
+        self._client = None
+        self._put = None
+
+    @property
+    def enabled(self) -> bool:
+        return GEN_CACHE_ENABLED
+
+    def _redis(self):
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        r = AsyncRedisClientInstance.redis_client
+        if r is not None and r is not self._client:
+            self._client = r
+            self._put = r.register_script(_PUT)
+        return r
+
+    async def get(self, kind: str, fp: str) -> Optional[Dict[str, Any]]:
+        r = self._redis()
+        if r is None:
+            return None
+        try:
+            raw = await r.get(f"{self.prefix}:{fp}")
+        except Exception as e:
+            log.warning("gencache get failed: %s", e)
+            return None
+        LOOKUPS.labels(kind, "hit" if raw else "miss").inc()
+        return json.loads(raw) if raw else None
+
+    async def put(self, fp: str, value: Dict[str, Any]) -> None:
+        if self._redis() is None:
+            return
+        try:
+            await self._put(
+                keys=[f"{self.prefix}:index", f"{self.prefix}:{fp}"],
+                args=[json.dumps(value), GEN_CACHE_TTL_S, int(time.time()), GEN_CACHE_MAX_ENTRIES],
+            )
+        except Exception as e:
+            log.warning("gencache put failed: %s", e)
+
+
+GenerationCacheInstance = GenerationCache()
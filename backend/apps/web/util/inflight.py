@@ -0,0 +1,183 @@
+"""Cross-process single-flight for idempotent requests.
+
+An idempotency cache only helps once the first request has finished; a
+retry that arrives while the original is still running misses it and
+does the work (and pays for it) a second time. Inflight closes that gap:
+
+    result, shared = await inflight.run(key, fn, timeout)
+
+The first caller for `key` takes a Redis lease (`<prefix>:lock:<key>`,
+SET NX with a heartbeat-refreshed TTL) and runs `fn()`. Later callers
+with the same key wait instead:
+
+  - in the same process they await the owner's future directly;
+  - elsewhere they poll the lease and `<prefix>:outcome:<key>` with
+    backoff until the owner publishes its result there.
+
+If the owner raises, or dies and its lease lapses, no outcome is
+published and one waiter takes over and runs `fn()` itself. Without
+Redis only the in-process path applies.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+INFLIGHT_LEASE_S = 30
+INFLIGHT_POLL_MIN_S = 0.2
+INFLIGHT_POLL_MAX_S = 2.0
+# Outcomes only need to outlive the slowest poll of a waiting duplicate;
+# later retries go through the caller's own result cache.
+INFLIGHT_OUTCOME_TTL_S = 60
+
+_UNLOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+_REFRESH = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+
+class InflightTimeout(Exception):
+    pass
+
+
+class Inflight:
+    def __init__(self, prefix: str, lease_s: int = INFLIGHT_LEASE_S):
+        self.prefix = prefix
+        self.lease_s = lease_s
+        self._local: Dict[str, asyncio.Future] = {}
+        self._client = None
+        self._unlock = None
+        self._refresh = None
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.prefix}:lock:{key}"
+
+    def _outcome_key(self, key: str) -> str:
+        return f"{self.prefix}:outcome:{key}"
+
+    def _redis(self):
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        r = AsyncRedisClientInstance.redis_client
+        if r is not None and r is not self._client:
+            self._client = r
+            self._unlock = r.register_script(_UNLOCK)
+            self._refresh = r.register_script(_REFRESH)
+        return r
+
+    async def run(self, key: str, fn: Callable[[], Awaitable[Dict[str, Any]]],
+                  timeout: float) -> Tuple[Dict[str, Any], bool]:
+        """Run `fn` once per `key`; returns (result, shared).
+
+        `shared` is True when the result came from another caller's run.
+        `fn` must return a JSON-serialisable dict. Raises InflightTimeout
+        if the owner is still running after `timeout` seconds.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            fut = self._local.get(key)
+            if fut is not None:
+                try:
+                    result = await asyncio.wait_for(
+                        asyncio.shield(fut), max(0.0, deadline - time.monotonic()),
+                    )
+                except asyncio.TimeoutError:
+                    raise InflightTimeout(key)
+                if result is not None:
+                    return result, True
+                continue  # owner failed; try to take over
+
+            token = uuid.uuid4().hex
+            if await self._acquire(key, token):
+                return await self._own(key, token, fn), False
+            result = await self._wait_remote(key, deadline)
+            if result is not None:
+                return result, True
+
+    async def _acquire(self, key: str, token: str) -> bool:
+        r = self._redis()
+        if r is None:
+            return True
+        try:
+            if not await r.set(self._lock_key(key), token, nx=True, ex=self.lease_s):
+                return False
+            # Drop a previous run's outcome so new waiters don't read it.
+            await r.delete(self._outcome_key(key))
+            return True
+        except Exception as e:
+            log.warning("inflight %s lock failed, running unguarded: %s", key, e)
+            return True
+
+    async def _own(self, key: str, token: str, fn) -> Dict[str, Any]:
+        fut = asyncio.get_running_loop().create_future()
+        self._local[key] = fut
+        heartbeat = asyncio.create_task(self._heartbeat(key, token))
+        try:
+            result = await fn()
+        except BaseException:
+            fut.set_result(None)
+            raise
+        else:
+            fut.set_result(result)
+            await self._publish(key, result)
+            return result
+        finally:
+            heartbeat.cancel()
+            self._local.pop(key, None)
+            await self._release(key, token)
+
+    async def _heartbeat(self, key: str, token: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            if self._redis() is None:
+                continue
+            try:
+                await self._refresh(keys=[self._lock_key(key)], args=[token, self.lease_s])
+            except Exception as e:
+                log.warning("inflight %s lease refresh failed: %s", key, e)
+
+    async def _publish(self, key: str, result: Dict[str, Any]) -> None:
+        r = self._redis()
+        if r is None:
+            return
+        try:
+            await r.set(self._outcome_key(key), json.dumps(result), ex=INFLIGHT_OUTCOME_TTL_S)
+        except Exception as e:
+            log.warning("inflight %s outcome write failed: %s", key, e)
+
+    async def _release(self, key: str, token: str) -> None:
+        if self._redis() is None:
+            return
+        try:
+            await self._unlock(keys=[self._lock_key(key)], args=[token])
+        except Exception as e:
+            log.warning("inflight %s unlock failed: %s", key, e)
+
+    async def _wait_remote(self, key: str, deadline: float) -> Optional[Dict[str, Any]]:
+        """Owner's outcome, or None once its lease is gone without one."""
+        r = self._redis()
+        delay = INFLIGHT_POLL_MIN_S
+        while True:
+            try:
+                # One MGET: the owner writes the outcome before it unlocks,
+                # so "no lock and no outcome" really means it gave up.
+                lock, outcome = await r.mget(self._lock_key(key), self._outcome_key(key))
+            except Exception as e:
+                log.warning("inflight %s poll failed: %s", key, e)
+                lock, outcome = "?", None
+            if outcome:
+                return json.loads(outcome)
+            if lock is None:
+                return None
+            if time.monotonic() + delay > deadline:
+                raise InflightTimeout(key)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, INFLIGHT_POLL_MAX_S)
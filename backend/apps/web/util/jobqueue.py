@@ -0,0 +1,314 @@
+"""Background job queue for long-running request work.
+
+A JobQueue pairs a storage backend with a pool of asyncio workers that
+run inside each API process. Callers submit a JSON-serialisable payload
+and get a job id back immediately; a worker later runs the queue's
+handler on it and stores the handler's result on the job record, where
+status endpoints can read it.
+
+Backends:
+  - RedisJobBackend: job records live under `{name}:job:{id}`, pending
+    ids in the `{name}:queue` list. Workers move ids atomically into
+    `{name}:processing` (BRPOPLPUSH) and hold a short lease key while
+    running. If a worker dies mid-job its lease lapses and the reaper
+    pushes the id back onto the queue, so delivery is at-least-once:
+    handlers must be idempotent (canvas checks its Idempotency-Key
+    result cache before generating anything).
+  - LocalJobBackend: in-process dict + asyncio.Queue. No crash recovery,
+    but no Redis either — used in dev and when Redis is unreachable.
+
+The backend is picked at start() from JOBQUEUE_BACKEND ("redis" /
+"local"); by default Redis is used whenever RedisClientInstance is
+connected. The Redis backend talks through the shared asyncio pool
+(AsyncRedisClientInstance), so workers never block the event loop.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+JOBQUEUE_BACKEND = os.getenv("JOBQUEUE_BACKEND", "").lower()
+JOB_WORKERS = int(os.getenv("JOBQUEUE_WORKERS", "4"))
+# A running job's lease is refreshed every LEASE_S / 3; a job whose lease
+# has lapsed for two reaper sweeps in a row is considered orphaned.
+JOB_LEASE_S = int(os.getenv("JOBQUEUE_LEASE_S", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOBQUEUE_MAX_ATTEMPTS", "3"))
+# Job records (and their results) are kept this long after the last update.
+JOB_TTL_S = int(os.getenv("JOBQUEUE_TTL_S", str(24 * 3600)))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_FINAL = (JOB_DONE, JOB_FAILED)
+
+
+class LocalJobBackend:
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._queue: Optional[asyncio.Queue] = None
+
+    def _q(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    async def put(self, job: Dict[str, Any]) -> bool:
+        if job["id"] in self._jobs:
+            return False
+        self._jobs[job["id"]] = job
+        if job["status"] == JOB_QUEUED:
+            self._q().put_nowait(job["id"])
+        return True
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def save(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = job
+
+    async def reserve(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self._q().get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def touch(self, job_id: str) -> None:
+        pass
+
+    async def ack(self, job_id: str) -> None:
+        pass
+
+    async def requeue_stale(self) -> int:
+        # Finished records expire like the Redis ones so the dict can't grow
+        # without bound in a long-lived dev process.
+        cutoff = time.time() - JOB_TTL_S
+        for job_id in [k for k, v in self._jobs.items()
+                       if v["status"] in JOB_FINAL and v["updated_at"] < cutoff]:
+            self._jobs.pop(job_id, None)
+        return 0
+
+
+class RedisJobBackend:
+    def __init__(self, name: str, redis_client):
+        self._r = redis_client
+        self._prefix = name
+        self._queue_key = f"{name}:queue"
+        self._processing_key = f"{name}:processing"
+        # Ids seen without a lease on the previous sweep. An id is only
+        # requeued when it is still lease-less on the next one, which
+        # covers the gap between BRPOPLPUSH and the first lease write.
+        self._suspects: set = set()
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self._prefix}:job:{job_id}"
+
+    def _lease_key(self, job_id: str) -> str:
+        return f"{self._prefix}:lease:{job_id}"
+
+    async def put(self, job: Dict[str, Any]) -> bool:
+        created = await self._r.set(self._job_key(job["id"]), json.dumps(job), nx=True, ex=JOB_TTL_S)
+        if created and job["status"] == JOB_QUEUED:
+            await self._r.lpush(self._queue_key, job["id"])
+        return bool(created)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self._r.get(self._job_key(job_id))
+        return json.loads(raw) if raw else None
+
+    async def save(self, job: Dict[str, Any]) -> None:
+        await self._r.set(self._job_key(job["id"]), json.dumps(job), ex=JOB_TTL_S)
+
+    async def reserve(self, timeout: float) -> Optional[str]:
+        # Blocking pop stays under the client's 2s socket_timeout.
+        job_id = await self._r.brpoplpush(self._queue_key, self._processing_key, timeout=1)
+        if job_id:
+            await self._r.set(self._lease_key(job_id), "1", ex=JOB_LEASE_S)
+        return job_id
+
+    async def touch(self, job_id: str) -> None:
+        await self._r.set(self._lease_key(job_id), "1", ex=JOB_LEASE_S)
+
+    async def ack(self, job_id: str) -> None:
+        async with self._r.pipeline(transaction=False) as pipe:
+            pipe.lrem(self._processing_key, 0, job_id)
+            pipe.delete(self._lease_key(job_id))
+            await pipe.execute()
+
+    async def requeue_stale(self) -> int:
+        requeued = 0
+        seen = set()
+        for job_id in await self._r.lrange(self._processing_key, 0, -1):
+            if await self._r.exists(self._lease_key(job_id)):
+                continue
+            seen.add(job_id)
+            if job_id not in self._suspects:
+                continue
+            # LREM first: if another API process already requeued it,
+            # the count is 0 and we leave it alone.
+            if await self._r.lrem(self._processing_key, 0, job_id):
+                await self._r.rpush(self._queue_key, job_id)
+                requeued += 1
+        self._suspects = seen
+        return requeued
+
+
+class JobQueue:
+    """Named queue + worker pool. `handler(job)` returns the result dict.
+
+    The handler's result is stored as-is; if it carries `status:
+    "failed"` the job is marked failed, otherwise done. Exceptions mark
+    the job failed without retry — only jobs orphaned by a dead worker
+    are redelivered.
+    """
+
+    def __init__(self, name: str, handler: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]):
+        self.name = name
+        self._handler = handler
+        self._backend = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            self._backend = self._make_backend()
+        return self._backend
+
+    def _make_backend(self):
+        if JOBQUEUE_BACKEND != "local":
+            from apps.redis.redis_client import AsyncRedisClientInstance
+            if AsyncRedisClientInstance.redis_client is not None:
+                return RedisJobBackend(self.name, AsyncRedisClientInstance.redis_client)
+            if JOBQUEUE_BACKEND == "redis":
+                log.warning("jobqueue %s: Redis unavailable, falling back to local backend", self.name)
+        return LocalJobBackend()
+
+    # ----- producer side -----
+
+    async def submit(self, payload: Dict[str, Any], user_id: str = "",
+                     job_id: Optional[str] = None,
+                     result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Enqueue a job and return its record.
+
+        A caller-chosen `job_id` makes submission idempotent: if the id
+        already exists the existing record is returned untouched. Passing
+        `result` stores an already-finished job (e.g. a cache replay).
+        """
+        now = time.time()
+        job = {
+            "id": job_id or uuid.uuid4().hex,
+            "status": JOB_QUEUED if result is None else JOB_DONE,
+            "user_id": user_id,
+            "payload": payload,
+            "result": result,
+            "error": None,
+            "attempts": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        if await self.backend.put(job):
+            return job
+        existing = await self.backend.get(job["id"])
+        return existing or job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.backend.get(job_id)
+
+    # ----- worker side -----
+
+    async def start(self, workers: int = JOB_WORKERS) -> None:
+        if self._tasks:
+            return
+        log.info("jobqueue %s: starting %d workers on %s", self.name, workers,
+                 type(self.backend).__name__)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    async def _worker(self, idx: int) -> None:
+        while True:
+            try:
+                job_id = await self.backend.reserve(1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("jobqueue %s worker %d reserve error: %s", self.name, idx, e)
+                await asyncio.sleep(1.0)
+                continue
+            if not job_id:
+                continue
+            try:
+                await self._run_one(job_id)
+            except asyncio.CancelledError:
+                # Shutdown mid-job: leave it in processing so the lease
+                # lapses and another process picks it up.
+                raise
+            except Exception:
+                log.exception("jobqueue %s worker %d crashed on job %s", self.name, idx, job_id)
+
+    async def _run_one(self, job_id: str) -> None:
+        job = await self.backend.get(job_id)
+        if job is None or job["status"] in JOB_FINAL:
+            await self.backend.ack(job_id)
+            return
+        job["attempts"] = int(job.get("attempts") or 0) + 1
+        if job["attempts"] > JOB_MAX_ATTEMPTS:
+            job.update(status=JOB_FAILED, error="max attempts exceeded", updated_at=time.time())
+            await self.backend.save(job)
+            await self.backend.ack(job_id)
+            return
+        job.update(status=JOB_RUNNING, updated_at=time.time())
+        await self.backend.save(job)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            result = await self._handler(job)
+            failed = isinstance(result, dict) and result.get("status") == "failed"
+            job.update(
+                status=JOB_FAILED if failed else JOB_DONE,
+                result=result,
+                error=(result or {}).get("error") if failed else None,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.exception("jobqueue %s job %s failed", self.name, job_id)
+            job.update(status=JOB_FAILED, error=str(e))
+        finally:
+            heartbeat.cancel()
+        job["updated_at"] = time.time()
+        await self.backend.save(job)
+        await self.backend.ack(job_id)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_S / 3)
+            try:
+                await self.backend.touch(job_id)
+            except Exception as e:
+                log.warning("jobqueue %s lease refresh for %s failed: %s", self.name, job_id, e)
+
+    async def _reaper(self) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_S)
+            try:
+                n = await self.backend.requeue_stale()
+                if n:
+                    log.warning("jobqueue %s: requeued %d orphaned jobs", self.name, n)
+            except Exception as e:
+                log.warning("jobqueue %s reaper error: %s", self.name, e)
@@ -0,0 +1,213 @@
+"""Leader election for singleton background loops.
+
+Every uvicorn worker in every pod runs main.lifespan, so a loop started
+there (the USDT pay listener, future pollers/sweepers/reconcilers) would
+run once per worker. Register such loops here instead:
+
+    LeaderInstance.register("bnbusdt-listener", listener.start_listening)
+    await LeaderInstance.start()      # in lifespan
+    await LeaderInstance.stop()       # on shutdown
+
+For each registered name, every process runs a small supervisor that
+tries to take the lease and only the holder runs the loop:
+
+  - with Redis, the lease is `leader:<name>` (SET NX EX LEADER_LEASE_S,
+    value = this process's token), renewed every LEADER_LEASE_S / 3 by a
+    compare-and-expire script. A holder that can't renew before its
+    lease would lapse cancels its loop first, so two holders don't
+    overlap;
+  - without Redis, an exclusive non-blocking flock on
+    `$DATA_DIR/leader-<name>.lock` elects one worker per host (the OS
+    drops the lock when the process dies).
+
+Non-holders retry every LEADER_RETRY_S, so a dead leader is replaced
+within LEADER_LEASE_S + LEADER_RETRY_S. If the loop itself crashes, the
+holder gives up the lease and a new election runs after LEADER_RETRY_S;
+a loop that returns normally is not restarted by that process.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from apps.web.util.metrics import gauge
+
+log = logging.getLogger(__name__)
+
+LEADER_LEASE_S = int(os.getenv("LEADER_LEASE_S", "15"))
+LEADER_RETRY_S = float(os.getenv("LEADER_RETRY_S", "5"))
+
+IS_LEADER = gauge("creator_leader", "1 while this process holds the named lease", ["name"])
+
+_RENEW = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class RedisLease:
+    def __init__(self, name: str, token: str, lease_s: int):
+        self.key = f"leader:{name}"
+        self.token = token
+        self.lease_s = lease_s
+        self._client = None
+        self._renew = None
+        self._release = None
+
+    def _redis(self):
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        r = AsyncRedisClientInstance.redis_client
+        if r is not None and r is not self._client:
+            self._client = r
+            self._renew = r.register_script(_RENEW)
+            self._release = r.register_script(_RELEASE)
+        return r
+
+    async def acquire(self) -> bool:
+        return bool(await self._redis().set(self.key, self.token, nx=True, ex=self.lease_s))
+
+    async def renew(self) -> bool:
+        self._redis()
+        return bool(await self._renew(keys=[self.key], args=[self.token, self.lease_s]))
+
+    async def release(self) -> None:
+        self._redis()
+        await self._release(keys=[self.key], args=[self.token])
+
+
+class FileLease:
+    def __init__(self, name: str):
+        from config import DATA_DIR
+        self.path = os.path.join(DATA_DIR, f"leader-{name}.lock")
+        self._fd: Optional[int] = None
+
+    async def acquire(self) -> bool:
+        import fcntl
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    async def renew(self) -> bool:
+        return self._fd is not None
+
+    async def release(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)  # closing the descriptor drops the flock
+            self._fd = None
+
+
+class LeaderElection:
+    def __init__(self, lease_s: int = LEADER_LEASE_S, retry_s: float = LEADER_RETRY_S):
+        self.lease_s = lease_s
+        self.retry_s = retry_s
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._loops: Dict[str, Callable[[], Awaitable[None]]] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._leading: Dict[str, bool] = {}
+
+    def register(self, name: str, fn: Callable[[], Awaitable[None]]) -> None:
+        """Run `fn()` in exactly one process once start() is called."""
+        self._loops[name] = fn
+
+    def is_leader(self, name: str) -> bool:
+        return self._leading.get(name, False)
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [
+            asyncio.create_task(self._supervise(name, fn)) for name, fn in self._loops.items()
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+
+    def _lease(self, name: str):
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        if AsyncRedisClientInstance.redis_client is not None:
+            return RedisLease(name, self.token, self.lease_s)
+        return FileLease(name)
+
+    async def _supervise(self, name: str, fn: Callable[[], Awaitable[None]]) -> None:
+        while True:
+            lease = self._lease(name)
+            try:
+                acquired = await lease.acquire()
+            except Exception as e:
+                log.warning("leader %s: acquire failed: %s", name, e)
+                acquired = False
+            if not acquired:
+                await asyncio.sleep(self.retry_s)
+                continue
+
+            log.info("leader %s: acquired by %s (%s)", name, self.token, type(lease).__name__)
+            self._leading[name] = True
+            IS_LEADER.labels(name).set(1)
+            try:
+                finished = await self._lead(name, fn, lease)
+            finally:
+                self._leading[name] = False
+                IS_LEADER.labels(name).set(0)
+                try:
+                    await lease.release()
+                except Exception as e:
+                    log.warning("leader %s: release failed: %s", name, e)
+            if finished:
+                return
+            await asyncio.sleep(self.retry_s)
+
+    async def _lead(self, name: str, fn, lease) -> bool:
+        """Run `fn` while the lease holds; True if it returned normally."""
+        task = asyncio.create_task(fn())
+        last_renewed = time.monotonic()
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=self.lease_s / 3)
+                if done:
+                    try:
+                        task.result()
+                    except Exception as e:
+                        log.error("leader %s: loop crashed: %s", name, e)
+                        return False
+                    log.info("leader %s: loop finished", name)
+                    return True
+                try:
+                    if not await lease.renew():
+                        log.warning("leader %s: lease lost, stopping loop", name)
+                        return False
+                    last_renewed = time.monotonic()
+                except Exception as e:
+                    log.warning("leader %s: renew failed: %s", name, e)
+                    if time.monotonic() - last_renewed + self.lease_s / 3 >= self.lease_s:
+                        # The lease lapses before the next renewal; step down.
+                        return False
+        finally:
+            if not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+
+
+LeaderInstance = LeaderElection()
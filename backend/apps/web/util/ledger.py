@@ -0,0 +1,193 @@
+"""Redis-side credit ledger for per-run paid buckets (canvas, director).
+
+A bucket is minted by a verified /charge and then drained block by
+block. Each bucket is one Redis hash:
+
+    <prefix>:<user_id>:<run_id>
+        amount_dlcp   credits bought (decimal string, 1 DLP = 1 cr)
+        spent_cr      credits charged for finished blocks
+        reserved_cr   credits held by blocks still running
+        hold:<id>     cost held by one running block
+        tx_hash, wallet
+
+Spending is two-phase so concurrent blocks of one run can't overspend:
+
+    ok, remaining, err = await ledger.reserve(user, run, cost, hold_id)
+    ... generate ...
+    await ledger.commit(user, run, hold_id, actual_cost)   # or release()
+
+reserve() checks `amount - spent - reserved >= cost` and records the
+hold in a single Lua call, so two blocks racing for the last credits
+can't both pass. Buckets written by the old JSON format are converted
+in place on first touch.
+
+A hold whose block never settles (process killed mid-generation) stays
+reserved until the bucket's TTL, i.e. it fails closed.
+"""
+import logging
+from typing import Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# Shared prelude: make sure KEYS[1] is a ledger hash and return
+# 1 (ready), -1 (no bucket) or -2 (unreadable).
+_LOAD = """
+local function load(key)
+  local t = redis.call('TYPE', key).ok
+  if t == 'none' then return -1 end
+  if t == 'string' then
+    local ok, p = pcall(cjson.decode, redis.call('GET', key))
+    if not ok or type(p) ~= 'table' or tonumber(p.amount_dlcp) == nil then return -2 end
+    local ttl = redis.call('PTTL', key)
+    redis.call('DEL', key)
+    redis.call('HSET', key,
+      'amount_dlcp', tostring(p.amount_dlcp),
+      'spent_cr', tostring(tonumber(p.spent_cr) or 0),
+      'reserved_cr', '0',
+      'tx_hash', tostring(p.tx_hash or ''),
+      'wallet', tostring(p.wallet or ''))
+    if ttl > 0 then redis.call('PEXPIRE', key, ttl) end
+  elseif t ~= 'hash' then
+    return -2
+  end
+  return 1
+end
+"""
+
+# ARGV: cost, hold id ('' = check only, nothing is held).
+# Returns {status, remaining-after-hold as string}.
+_RESERVE = _LOAD + """
+local st = load(KEYS[1])
+if st ~= 1 then return {st, '0'} end
+local v = redis.call('HMGET', KEYS[1], 'amount_dlcp', 'spent_cr', 'reserved_cr')
+local amount = tonumber(v[1])
+if amount == nil then return {-2, '0'} end
+local remaining = amount - (tonumber(v[2]) or 0) - (tonumber(v[3]) or 0)
+local cost = tonumber(ARGV[1]) or 0
+if ARGV[2] ~= '' and redis.call('HEXISTS', KEYS[1], 'hold:' .. ARGV[2]) == 1 then
+  return {1, tostring(remaining)}
+end
+if remaining + 1e-6 < cost then return {0, tostring(remaining)} end
+if ARGV[2] ~= '' and cost > 0 then
+  redis.call('HINCRBYFLOAT', KEYS[1], 'reserved_cr', cost)
+  redis.call('HSET', KEYS[1], 'hold:' .. ARGV[2], cost)
+end
+return {1, tostring(remaining - cost)}
+"""
+
+# ARGV: hold id, amount to charge ('' = the held amount, '0' = release).
+_SETTLE = _LOAD + """
+if load(KEYS[1]) ~= 1 then return '0' end
+local field = 'hold:' .. ARGV[1]
+local held = tonumber(redis.call('HGET', KEYS[1], field) or '0') or 0
+if held > 0 then
+  redis.call('HINCRBYFLOAT', KEYS[1], 'reserved_cr', -held)
+  redis.call('HDEL', KEYS[1], field)
+end
+local spend = tonumber(ARGV[2]) or held
+if spend > 0 then redis.call('HINCRBYFLOAT', KEYS[1], 'spent_cr', spend) end
+return tostring(spend)
+"""
+
+
+class CreditLedger:
+    def __init__(self, prefix: str, ttl_s: int, charge_path: str):
+        self.prefix = prefix
+        self.ttl_s = ttl_s
+        # Named in "no payment" errors so the client knows where to pay.
+        self.charge_path = charge_path
+        self._client = None
+        self._reserve = None
+        self._settle = None
+
+    def key(self, user_id: str, run_id: str) -> str:
+        return f"{self.prefix}:{user_id}:{run_id}"
+
+    def _scripts(self):
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        r = AsyncRedisClientInstance.redis_client
+        if r is not None and r is not self._client:
+            self._client = r
+            self._reserve = r.register_script(_RESERVE)
+            self._settle = r.register_script(_SETTLE)
+        return r
+
+    async def fund(self, user_id: str, run_id: str, amount: str,
+                   tx_hash: str = "", wallet: str = "") -> bool:
+        """(Re)mint the bucket for a verified payment."""
+        r = self._scripts()
+        if r is None:
+            return False
+        key = self.key(user_id, run_id)
+        try:
+            async with r.pipeline(transaction=True) as pipe:
+                pipe.delete(key)
+                pipe.hset(key, mapping={
+                    "amount_dlcp": str(amount),
+                    "spent_cr": "0",
+                    "reserved_cr": "0",
+                    "tx_hash": tx_hash or "",
+                    "wallet": wallet or "",
+                })
+                pipe.expire(key, int(self.ttl_s))
+                await pipe.execute()
+            return True
+        except Exception as e:
+            log.error("ledger fund %s failed: %s", key, e)
+            return False
+
+    async def reserve(self, user_id: str, run_id: str, cost_cr: int,
+                      hold_id: str) -> Tuple[bool, float, str]:
+        """Hold `cost_cr` for one block. Returns (ok, remaining, err).
+
+        Re-reserving an existing hold id is a no-op success.
+        """
+        return await self._reserve_or_check(user_id, run_id, cost_cr, hold_id)
+
+    async def check(self, user_id: str, run_id: str, cost_cr: int) -> Tuple[bool, float, str]:
+        """Like reserve() but holds nothing (up-front whole-run checks)."""
+        return await self._reserve_or_check(user_id, run_id, cost_cr, "")
+
+    async def commit(self, user_id: str, run_id: str, hold_id: str,
+                     cost_cr: Optional[int] = None) -> None:
+        """Charge a finished block, `cost_cr` or else what was held."""
+        await self._settle_hold(user_id, run_id, hold_id, "" if cost_cr is None else str(int(cost_cr)))
+
+    async def release(self, user_id: str, run_id: str, hold_id: str) -> None:
+        """Drop a hold without charging (block failed or was cancelled)."""
+        await self._settle_hold(user_id, run_id, hold_id, "0")
+
+    async def _reserve_or_check(self, user_id, run_id, cost_cr, hold_id):
+        if not user_id or not run_id:
+            return (False, 0.0, "missing run_id or user")
+        no_payment = f"no payment for run_id={run_id} (POST {self.charge_path} first)"
+        r = self._scripts()
+        if r is None:
+            return (False, 0.0, no_payment)
+        try:
+            status, remaining = await self._reserve(
+                keys=[self.key(user_id, run_id)], args=[int(cost_cr), hold_id],
+            )
+        except Exception as e:
+            log.error("ledger reserve %s failed: %s", self.key(user_id, run_id), e)
+            return (False, 0.0, no_payment)
+        remaining = float(remaining)
+        status = int(status)
+        if status == 1:
+            return (True, remaining, "")
+        if status == 0:
+            return (False, remaining,
+                    f"insufficient credits: need {cost_cr}, have {remaining:.0f}")
+        if status == -2:
+            return (False, 0.0, "corrupt payment record")
+        return (False, 0.0, no_payment)
+
+    async def _settle_hold(self, user_id, run_id, hold_id, spend: str) -> None:
+        if not user_id or not run_id or not hold_id:
+            return
+        if self._scripts() is None:
+            return
+        try:
+            await self._settle(keys=[self.key(user_id, run_id)], args=[hold_id, spend])
+        except Exception as e:
+            log.warning("ledger settle %s failed: %s", self.key(user_id, run_id), e)
@@ -0,0 +1,366 @@
+"""On-disk cache for downloaded media (WaveSpeed clips, reference frames).
+
+Canvas used to download every clip into a fresh tempdir per step, so in
+a director run clip N crossed the network once for last-frame
+extraction and again for stitching. Media steps now go through this
+cache instead:
+
+    async with MediaCacheInstance.open(url) as path:
+        ... run ffprobe / ffmpeg on `path` (read-only) ...
+
+Layout under MEDIA_CACHE_DIR (default $DATA_DIR/cache/media):
+  blobs/<sha256 of content><ext>   the bytes, content-addressed, so two
+                                   URLs serving the same file share one blob
+  urls/<sha256 of url>             the blob name for that URL
+
+Concurrent requests for one URL share a single download (single-flight).
+Downloads stream straight to disk over a pooled aiohttp session and are
+retried with exponential backoff on network errors and 5xx responses;
+a ByteBudget passed by the caller caps the total bytes a step may pull.
+Blobs are evicted least-recently-used once the cache exceeds
+MEDIA_CACHE_MAX_BYTES, and unconditionally after MEDIA_CACHE_TTL_S
+without use; a blob that is currently open is never evicted.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+
+from config import CACHE_DIR
+
+log = logging.getLogger(__name__)
+
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", os.path.join(CACHE_DIR, "media"))
+MEDIA_CACHE_MAX_BYTES = int(os.getenv("MEDIA_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+MEDIA_CACHE_TTL_S = int(os.getenv("MEDIA_CACHE_TTL_S", str(6 * 3600)))
+# Connect / per-read inactivity limit, not a cap on the whole transfer:
+# a large clip on a slow link may take longer as long as bytes keep coming.
+MEDIA_DOWNLOAD_TIMEOUT_S = 60
+MEDIA_CONNECT_TIMEOUT_S = 10
+MEDIA_DOWNLOAD_RETRIES = int(os.getenv("MEDIA_DOWNLOAD_RETRIES", "3"))
+MEDIA_DOWNLOAD_BACKOFF_S = 0.5
+
+_HEX64 = re.compile(r"^[0-9a-f]{64}")
+
+
+def _sha256(s: str) -> str:
+    return hashlib.sha256(s.encode()).hexdigest()
+
+
+def content_sha256(path: str) -> str:
+    """sha256 of a file's bytes; free for blobs, which are named by it."""
+    name = os.path.basename(path)
+    if _HEX64.match(name):
+        return name[:64]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaBudgetExceeded(Exception):
+    pass
+
+
+class ByteBudget:
+    """Upper bound on bytes one media step may download or open.
+
+    Shared by the concurrent fetches of a step; cache hits are charged
+    their file size, misses are charged as bytes arrive so an oversized
+    download is cut off mid-stream rather than after the fact.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+
+    def consume(self, n: int) -> None:
+        self.used += n
+        if self.used > self.limit:
+            raise MediaBudgetExceeded(f"media byte budget exceeded ({self.limit} bytes)")
+
+
+class _RetryableStatus(Exception):
+    pass
+
+
+class _DownloadAbandoned(Exception):
+    """The caller running a shared download was cancelled."""
+
+
+class MediaCache:
+    def __init__(self, root: str = MEDIA_CACHE_DIR):
+        self.root = root
+        self._blobs = os.path.join(root, "blobs")
+        self._urls = os.path.join(root, "urls")
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._pins: Dict[str, int] = {}
+        self._ready = False
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _ensure_dirs(self) -> None:
+        if not self._ready:
+            os.makedirs(self._blobs, exist_ok=True)
+            os.makedirs(self._urls, exist_ok=True)
+            self._ready = True
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300),
+            )
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # ----- public API -----
+
+    async def fetch(self, url: str, timeout: float = MEDIA_DOWNLOAD_TIMEOUT_S,
+                    budget: Optional[ByteBudget] = None,
+                    stats: Optional[Dict[str, Any]] = None) -> str:
+        """Return the local path of `url`'s bytes, downloading on a miss.
+
+        The path is only guaranteed to exist until the next eviction; use
+        `open()` to hold it for the duration of a media step. `timeout`
+        bounds each read, not the whole transfer. If `stats` is given it
+        is filled with cached / bytes / seconds / attempts.
+        """
+        self._ensure_dirs()
+        t0 = time.monotonic()
+        if stats is None:
+            stats = {}
+        stats.update(cached=True, bytes=0, seconds=0.0, attempts=0)
+        path = self._lookup(url)
+        if path is not None:
+            stats["bytes"] = os.path.getsize(path)
+            if budget is not None:
+                budget.consume(stats["bytes"])
+            return path
+
+        fut = self._inflight.get(url)
+        if fut is None:
+            fut = asyncio.get_running_loop().create_future()
+            self._inflight[url] = fut
+            stats["cached"] = False
+            try:
+                path = await self._download_with_retry(url, timeout, budget, stats)
+                stats["seconds"] = round(time.monotonic() - t0, 3)
+                fut.set_result(path)
+            except asyncio.CancelledError:
+                # Only the owner was cancelled; don't cancel the waiters
+                # with it, let them take the download over.
+                fut.set_exception(_DownloadAbandoned(url))
+                fut.exception()
+                raise
+            except Exception as e:
+                fut.set_exception(e)
+                # Consume it here so a miss with no other waiter doesn't
+                # log "exception was never retrieved".
+                fut.exception()
+                raise
+            finally:
+                self._inflight.pop(url, None)
+            await asyncio.to_thread(self._evict)
+            return path
+        # Someone else is downloading it; charge the finished size.
+        try:
+            path = await asyncio.shield(fut)
+        except _DownloadAbandoned:
+            return await self.fetch(url, timeout, budget, stats)
+        stats.update(bytes=os.path.getsize(path), seconds=round(time.monotonic() - t0, 3))
+        if budget is not None:
+            budget.consume(stats["bytes"])
+        return path
+
+    @asynccontextmanager
+    async def open(self, url: str, timeout: float = MEDIA_DOWNLOAD_TIMEOUT_S,
+                   budget: Optional[ByteBudget] = None,
+                   stats: Optional[Dict[str, Any]] = None):
+        path = await self.fetch(url, timeout, budget, stats)
+        async with self.pin(path):
+            yield path
+
+    @asynccontextmanager
+    async def pin(self, path: str):
+        """Keep a cached blob (from `fetch()` or `peek()`) from eviction."""
+        self._pins[path] = self._pins.get(path, 0) + 1
+        try:
+            yield path
+        finally:
+            left = self._pins.get(path, 1) - 1
+            if left:
+                self._pins[path] = left
+            else:
+                self._pins.pop(path, None)
+
+    def peek(self, url: str) -> Optional[str]:
+        """Local path if `url` is already cached, without downloading."""
+        self._ensure_dirs()
+        return self._lookup(url)
+
+    async def adopt(self, url: str, src: str) -> str:
+        """Move local file `src` into the cache as the bytes of `url`.
+
+        For derived media (normalized re-encodes) keyed by a synthetic
+        URL: `peek()` finds it afterwards, but `fetch()` can't re-create
+        it once evicted, so read such keys with `peek()` + `pin()`.
+        """
+        self._ensure_dirs()
+        path = await asyncio.to_thread(self._adopt, url, src)
+        await asyncio.to_thread(self._evict)
+        return path
+
+    # ----- internals -----
+
+    def _adopt(self, url: str, src: str) -> str:
+        digest = hashlib.sha256()
+        with open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        blob = f"{digest.hexdigest()}{os.path.splitext(src)[1][:8]}"
+        path = os.path.join(self._blobs, blob)
+        if os.path.exists(path):
+            self._remove(src)
+            os.utime(path)
+        else:
+            tmp = os.path.join(self._blobs, f".part-{uuid.uuid4().hex}")
+            # src may live on another filesystem (a tempdir), so copy then rename.
+            shutil.move(src, tmp)
+            os.replace(tmp, path)
+        ref_tmp = os.path.join(self._urls, f".part-{uuid.uuid4().hex}")
+        with open(ref_tmp, "w") as f:
+            f.write(blob)
+        os.replace(ref_tmp, os.path.join(self._urls, _sha256(url)))
+        return path
+
+    def _lookup(self, url: str) -> Optional[str]:
+        ref = os.path.join(self._urls, _sha256(url))
+        try:
+            with open(ref) as f:
+                blob = f.read().strip()
+        except OSError:
+            return None
+        path = os.path.join(self._blobs, blob)
+        try:
+            os.utime(path)  # mtime doubles as the LRU clock
+        except OSError:
+            return None
+        return path
+
+    async def _download_with_retry(self, url: str, timeout: float,
+                                   budget: Optional[ByteBudget],
+                                   stats: Dict[str, Any]) -> str:
+        attempt = 0
+        while True:
+            attempt += 1
+            stats["attempts"] = attempt
+            stats["bytes"] = 0
+            try:
+                return await self._download(url, timeout, budget, stats)
+            except (aiohttp.ClientError, asyncio.TimeoutError, _RetryableStatus) as e:
+                if attempt >= MEDIA_DOWNLOAD_RETRIES:
+                    raise
+                if budget is not None:
+                    # The partial body was discarded; don't charge it twice.
+                    budget.used -= stats["bytes"]
+                delay = MEDIA_DOWNLOAD_BACKOFF_S * (2 ** (attempt - 1))
+                log.info("media download %s failed (%s), retry %d in %.1fs", url, e, attempt, delay)
+                await asyncio.sleep(delay)
+
+    async def _download(self, url: str, timeout: float,
+                        budget: Optional[ByteBudget], stats: Dict[str, Any]) -> str:
+        ext = os.path.splitext(urlparse(url).path)[1][:8]
+        tmp = os.path.join(self._blobs, f".part-{uuid.uuid4().hex}")
+        digest = hashlib.sha256()
+        try:
+            async with self._get_session().get(
+                url, timeout=aiohttp.ClientTimeout(
+                    total=None, sock_connect=MEDIA_CONNECT_TIMEOUT_S, sock_read=timeout,
+                ),
+            ) as r:
+                if r.status >= 500:
+                    raise _RetryableStatus(f"HTTP {r.status}")
+                r.raise_for_status()
+                with open(tmp, "wb") as f:
+                    async for chunk in r.content.iter_chunked(256 * 1024):
+                        if budget is not None:
+                            budget.consume(len(chunk))
+                        digest.update(chunk)
+                        f.write(chunk)
+                        stats["bytes"] += len(chunk)
+            blob = f"{digest.hexdigest()}{ext}"
+            path = os.path.join(self._blobs, blob)
+            # Same bytes under another URL: keep the existing blob.
+            if os.path.exists(path):
+                os.remove(tmp)
+                os.utime(path)
+            else:
+                os.replace(tmp, path)
+        except BaseException:
+            self._remove(tmp)
+            raise
+        ref_tmp = os.path.join(self._urls, f".part-{uuid.uuid4().hex}")
+        with open(ref_tmp, "w") as f:
+            f.write(blob)
+        os.replace(ref_tmp, os.path.join(self._urls, _sha256(url)))
+        return path
+
+    def _evict(self) -> None:
+        now = time.time()
+        entries = []
+        total = 0
+        for name in os.listdir(self._blobs):
+            path = os.path.join(self._blobs, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if name.startswith(".part-"):
+                # Leftover from a crashed download.
+                if now - st.st_mtime > MEDIA_DOWNLOAD_TIMEOUT_S * 10:
+                    self._remove(path)
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if path in self._pins:
+                continue
+            if total <= MEDIA_CACHE_MAX_BYTES and now - mtime <= MEDIA_CACHE_TTL_S:
+                break
+            self._remove(path)
+            total -= size
+        # URL refs pointing at evicted blobs are dropped lazily by _lookup
+        # misses; prune the stale ones here too so the dir stays small.
+        for name in os.listdir(self._urls):
+            ref = os.path.join(self._urls, name)
+            try:
+                if now - os.stat(ref).st_mtime > MEDIA_CACHE_TTL_S:
+                    with open(ref) as f:
+                        if not os.path.exists(os.path.join(self._blobs, f.read().strip())):
+                            self._remove(ref)
+            except OSError:
+                continue
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+MediaCacheInstance = MediaCache()
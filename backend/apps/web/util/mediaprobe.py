@@ -0,0 +1,129 @@
+"""Single-pass ffprobe with a small in-process result cache.
+
+One `ffprobe -print_format json -show_format -show_streams` call yields
+everything the canvas media steps decide on (duration for xfade offsets
+and last-frame seeks, pix_fmt for copy-vs-reencode, audio presence for
+acrossfade), instead of a separate ffprobe subprocess per field.
+
+Results are cached by file content hash. Media-cache blobs are already
+named by their sha256, so for those the key is free; any other path is
+hashed once in a worker thread.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import OrderedDict
+from typing import Optional
+
+from pydantic import BaseModel
+
+log = logging.getLogger(__name__)
+
+PROBE_CACHE_SIZE = 1024
+PROBE_TIMEOUT_S = 30
+
+_HEX64 = re.compile(r"^[0-9a-f]{64}")
+
+
+class MediaInfo(BaseModel):
+    duration: float = 0.0
+    format_name: str = ""
+    video_codec: Optional[str] = None
+    pix_fmt: Optional[str] = None
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    has_audio: bool = False
+    audio_codec: Optional[str] = None
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    # ffprobe reports frame rates as "30000/1001".
+    try:
+        num, _, den = (rate or "0/1").partition("/")
+        return round(float(num) / float(den or 1), 3)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
+
+
+def _parse_probe(data: dict) -> MediaInfo:
+    fmt = data.get("format") or {}
+    streams = data.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None) or {}
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    try:
+        duration = float(fmt.get("duration") or video.get("duration") or 0)
+    except ValueError:
+        duration = 0.0
+    return MediaInfo(
+        duration=duration,
+        format_name=fmt.get("format_name") or "",
+        video_codec=video.get("codec_name"),
+        pix_fmt=video.get("pix_fmt"),
+        width=int(video.get("width") or 0),
+        height=int(video.get("height") or 0),
+        fps=_parse_rate(video.get("avg_frame_rate") or video.get("r_frame_rate")),
+        has_audio=audio is not None,
+        audio_codec=(audio or {}).get("codec_name"),
+    )
+
+
+def _hash_file(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class MediaProbe:
+    def __init__(self, max_entries: int = PROBE_CACHE_SIZE):
+        self._cache: "OrderedDict[str, MediaInfo]" = OrderedDict()
+        self._max = max_entries
+
+    async def _key(self, path: str) -> str:
+        m = _HEX64.match(os.path.basename(path))
+        if m:
+            return m.group(0)
+        return await asyncio.to_thread(_hash_file, path)
+
+    async def probe(self, path: str) -> Optional[MediaInfo]:
+        """MediaInfo for a local file, or None if ffprobe can't read it."""
+        key = await self._key(path)
+        info = self._cache.get(key)
+        if info is not None:
+            self._cache.move_to_end(key)
+            return info
+
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-print_format", "json",
+            "-show_format", "-show_streams", path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            so, se = await asyncio.wait_for(proc.communicate(), PROBE_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            log.warning("ffprobe timed out on %s", path)
+            return None
+        if proc.returncode != 0:
+            log.warning("ffprobe failed on %s: %s", path, se[:300].decode("utf-8", "replace"))
+            return None
+        try:
+            info = _parse_probe(json.loads(so.decode() or "{}"))
+        except ValueError as e:
+            log.warning("ffprobe output unparseable for %s: %s", path, e)
+            return None
+
+        self._cache[key] = info
+        if len(self._cache) > self._max:
+            self._cache.popitem(last=False)
+        return info
+
+
+MediaProbeInstance = MediaProbe()
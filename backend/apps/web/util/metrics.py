@@ -0,0 +1,62 @@
+"""Prometheus metric helpers.
+
+prometheus_client comes in with prometheus-fastapi-instrumentator, and
+anything registered here lands on the default registry that main.py
+exposes at /metrics. When the package is missing (local dev) the helpers
+hand back no-op metrics so call sites never need to check.
+"""
+import logging
+
+log = logging.getLogger(__name__)
+
+try:
+    import prometheus_client
+except ImportError:
+    prometheus_client = None
+    log.warning("prometheus_client not installed; app metrics are no-ops")
+
+_metrics = {}
+
+
+class _NoopMetric:
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+
+def _get_or_create(kind: str, name: str, documentation: str, labelnames=(), **kwargs):
+    # Routers are imported once per process, but guard against double
+    # registration anyway: prometheus_client raises on duplicate names.
+    metric = _metrics.get(name)
+    if metric is None:
+        if prometheus_client is None:
+            metric = _NoopMetric()
+        else:
+            cls = getattr(prometheus_client, kind)
+            metric = cls(name, documentation, labelnames=labelnames, **kwargs)
+        _metrics[name] = metric
+    return metric
+
+
+def gauge(name: str, documentation: str, labelnames=()):
+    return _get_or_create("Gauge", name, documentation, labelnames)
+
+
+def counter(name: str, documentation: str, labelnames=()):
+    return _get_or_create("Counter", name, documentation, labelnames)
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=None):
+    kwargs = {"buckets": buckets} if buckets else {}
+    return _get_or_create("Histogram", name, documentation, labelnames, **kwargs)
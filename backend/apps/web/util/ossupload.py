@@ -0,0 +1,233 @@
+"""Streaming file uploads to OSS.
+
+    await upload_file(path, key, "video/mp4", progress=on_progress)
+
+Files up to OSS_MULTIPART_THRESHOLD go up in one put_object_from_file,
+which oss2 streams from disk. Larger ones (stitched videos) use an OSS
+multipart upload:
+
+  - the file is cut into OSS_PART_SIZE parts, each read straight from
+    disk through oss2.SizedFileAdapter, so memory stays at about one
+    part buffer per in-flight request rather than the whole file;
+  - up to OSS_UPLOAD_CONCURRENCY parts are sent at once from worker
+    threads (oss2 is synchronous);
+  - a failed part is retried on its own up to OSS_PART_RETRIES times
+    with backoff; if it still fails the upload is aborted so OSS doesn't
+    keep the orphaned parts;
+  - `progress(done_bytes, total_bytes)` is called on the event loop as
+    parts complete.
+
+LocalBucket implements the handful of oss2.Bucket calls used here on a
+local directory. Set OSS_LOCAL_DIR to have AliOSSUtil use it instead of
+Aliyun (dev boxes, smoke tests).
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+from apps.web.util.metrics import counter, histogram
+
+log = logging.getLogger(__name__)
+
+OSS_PART_SIZE = int(os.getenv("OSS_PART_SIZE", str(8 * 1024 * 1024)))
+OSS_MULTIPART_THRESHOLD = int(os.getenv("OSS_MULTIPART_THRESHOLD", str(16 * 1024 * 1024)))
+OSS_UPLOAD_CONCURRENCY = int(os.getenv("OSS_UPLOAD_CONCURRENCY", "4"))
+OSS_PART_RETRIES = int(os.getenv("OSS_PART_RETRIES", "3"))
+OSS_PART_RETRY_BASE_S = 0.5
+
+UPLOAD_SECONDS = histogram(
+    "creator_oss_upload_seconds", "Wall time of OSS file uploads", ["mode"],
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 40, 80, 160),
+)
+PART_RETRIES = counter("creator_oss_part_retries_total", "OSS multipart part retries")
+
+Progress = Callable[[int, int], None]
+
+
+class OssUploadError(Exception):
+    pass
+
+
+def _upload_part(bucket, key: str, upload_id: str, part_number: int,
+                 path: str, offset: int, length: int):
+    import oss2
+    with open(path, "rb") as f:
+        f.seek(offset)
+        result = bucket.upload_part(key, upload_id, part_number, oss2.SizedFileAdapter(f, length))
+    return oss2.models.PartInfo(part_number, result.etag, size=length)
+
+
+async def upload_file(path: str, key: str, content_type: str, bucket=None,
+                      progress: Optional[Progress] = None,
+                      part_size: int = OSS_PART_SIZE) -> None:
+    """Upload a local file to `key`. Raises OssUploadError on failure."""
+    if bucket is None:
+        from apps.web.util.aliossutils import AliOSSUtil
+        bucket = AliOSSUtil._get_bucket()
+    headers = {"Content-Type": content_type}
+    total = os.path.getsize(path)
+    t0 = time.monotonic()
+
+    if total <= max(OSS_MULTIPART_THRESHOLD, part_size):
+        try:
+            result = await asyncio.to_thread(bucket.put_object_from_file, key, path, headers)
+        except Exception as e:
+            raise OssUploadError(f"put_object failed: {e}") from e
+        if result.status != 200:
+            raise OssUploadError(f"put_object status={result.status}")
+        UPLOAD_SECONDS.labels("single").observe(time.monotonic() - t0)
+        if progress:
+            progress(total, total)
+        return
+
+    init = await asyncio.to_thread(bucket.init_multipart_upload, key, headers)
+    upload_id = init.upload_id
+    sem = asyncio.Semaphore(max(1, OSS_UPLOAD_CONCURRENCY))
+    done = 0
+
+    async def send(part_number: int, offset: int, length: int):
+        nonlocal done
+        async with sem:
+            for attempt in range(OSS_PART_RETRIES + 1):
+                try:
+                    part = await asyncio.to_thread(
+                        _upload_part, bucket, key, upload_id, part_number, path, offset, length,
+                    )
+                    break
+                except Exception as e:
+                    if attempt == OSS_PART_RETRIES:
+                        raise OssUploadError(f"part {part_number} failed: {e}") from e
+                    PART_RETRIES.inc()
+                    log.info("oss part %d of %s failed (%s), retrying", part_number, key, e)
+                    await asyncio.sleep(OSS_PART_RETRY_BASE_S * (2 ** attempt))
+        done += length
+        if progress:
+            progress(done, total)
+        return part
+
+    offsets = range(0, total, part_size)
+    tasks = [
+        asyncio.create_task(send(i + 1, offset, min(part_size, total - offset)))
+        for i, offset in enumerate(offsets)
+    ]
+    try:
+        parts = await asyncio.gather(*tasks)
+        await asyncio.to_thread(bucket.complete_multipart_upload, key, upload_id, list(parts))
+    except BaseException as e:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.to_thread(bucket.abort_multipart_upload, key, upload_id)
+        except Exception as abort_err:
+            log.warning("oss abort of %s failed: %s", key, abort_err)
+        if isinstance(e, OssUploadError) or not isinstance(e, Exception):
+            raise
+        raise OssUploadError(f"multipart upload failed: {e}") from e
+    UPLOAD_SECONDS.labels("multipart").observe(time.monotonic() - t0)
+
+
+class _LocalResult:
+    def __init__(self, **fields):
+        self.status = 200
+        self.__dict__.update(fields)
+
+
+class LocalBucket:
+    """Directory-backed stand-in for the oss2.Bucket calls used above."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._uploads: Dict[str, str] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _write(self, key: str, src) -> str:
+        dst = self.path(key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        h = hashlib.md5()
+        with open(dst, "wb") as f:
+            while True:
+                # oss2.SizedFileAdapter signals EOF with "" rather than b"".
+                chunk = src.read(1024 * 1024)
+                if not chunk:
+                    break
+                h.update(chunk)
+                f.write(chunk)
+        return h.hexdigest()
+
+    def put_object(self, key, data, headers=None):
+        if isinstance(data, str):
+            data = data.encode()
+        if isinstance(data, bytes):
+            dst = self.path(key)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            with open(dst, "wb") as f:
+                f.write(data)
+            return _LocalResult(etag=hashlib.md5(data).hexdigest())
+        return _LocalResult(etag=self._write(key, data))
+
+    def head_object(self, key, headers=None, params=None):
+        size = os.path.getsize(self.path(key))  # FileNotFoundError ~ NoSuchKey
+        return _LocalResult(content_length=size, content_type=None)
+
+    def object_exists(self, key, headers=None):
+        return os.path.exists(self.path(key))
+
+    def get_object(self, key, byte_range=None, headers=None, progress_callback=None,
+                   process=None, params=None):
+        with open(self.path(key), "rb") as f:
+            if byte_range is None:
+                data = f.read()
+            else:
+                f.seek(byte_range[0])
+                data = f.read(byte_range[1] - byte_range[0] + 1)
+        return io.BytesIO(data)
+
+    def delete_object(self, key, params=None, headers=None):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+        return _LocalResult()
+
+    def put_object_from_file(self, key, filename, headers=None, progress_callback=None):
+        with open(filename, "rb") as f:
+            return _LocalResult(etag=self._write(key, f))
+
+    def init_multipart_upload(self, key, headers=None, params=None):
+        upload_id = uuid.uuid4().hex
+        self._uploads[upload_id] = os.path.join(self.root, ".multipart", upload_id)
+        os.makedirs(self._uploads[upload_id], exist_ok=True)
+        return _LocalResult(upload_id=upload_id)
+
+    def upload_part(self, key, upload_id, part_number, data, progress_callback=None, headers=None):
+        part_key = os.path.join(".multipart", upload_id, f"{part_number:05d}")
+        if isinstance(data, bytes):
+            return self.put_object(part_key, data)
+        return _LocalResult(etag=self._write(part_key, data))
+
+    def complete_multipart_upload(self, key, upload_id, parts: List, headers=None):
+        part_dir = self._uploads.pop(upload_id)
+        dst = self.path(key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        with open(dst, "wb") as out:
+            for part in sorted(parts, key=lambda p: p.part_number):
+                with open(os.path.join(part_dir, f"{part.part_number:05d}"), "rb") as f:
+                    shutil.copyfileobj(f, out)
+        shutil.rmtree(part_dir, ignore_errors=True)
+        return _LocalResult()
+
+    def abort_multipart_upload(self, key, upload_id, headers=None):
+        part_dir = self._uploads.pop(upload_id, None)
+        if part_dir:
+            shutil.rmtree(part_dir, ignore_errors=True)
+        return _LocalResult()
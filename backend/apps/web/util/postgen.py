@@ -0,0 +1,278 @@
+"""Eager post-generation work on finished videogen clips.
+
+Work on a clip used to start only when a downstream block needed it: the
+next chained shot extracted its last frame, the stitcher probed it and
+re-encoded HappyHorse's yuv444p output. Both sit on the critical path of
+a director run. When `_real_videogen` succeeds it now calls
+
+    PostGenInstance.submit(output_url)
+
+and a background job, overlapping the next shot's generation:
+
+  1. fetches the clip once into the media cache and probes it;
+  2. extracts the last frame, uploads it to OSS and publishes its URL
+     (in process and in Redis under `postgen:frame:<sha256(url)>`, so a
+     chain step on another worker finds it too);
+  3. if the clip isn't yuv420p, re-encodes it to yuv420p + faststart (or
+     just remuxes with faststart when only moov is at the end) and adopts
+     the result into the media cache under `normalized_key(url)`.
+
+Consumers use the artifacts when they exist and otherwise do the work
+themselves, exactly as before:
+
+  - `await last_frame(url)` waits up to POSTGEN_FRAME_WAIT_S for a
+    frame extraction this process has in flight, then checks Redis;
+  - `await wait(url)` lets the stitcher wait (bounded) for a pending
+    job, and `prepared(url)` is the cache path of the normalized clip.
+
+Only the normalize is speculative: it runs at PRIORITY_BACKGROUND, at
+most POSTGEN_CONCURRENCY at a time, and the ffmpeg pool keeps a slot
+free of background jobs, so it delays foreground stitches and frame
+grabs only on a single-slot pool. Fetching, probing and the last-frame
+grab aren't limited here, so one clip's frame never waits for another
+clip's normalize.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional
+
+from apps.web.util.ffmpeg_pool import FfmpegPoolInstance, PRIORITY_BACKGROUND, PRIORITY_FRAME
+from apps.web.util.metrics import counter
+
+log = logging.getLogger(__name__)
+
+POSTGEN_ENABLED = os.getenv("POSTGEN_ENABLED", "1") == "1"
+POSTGEN_CONCURRENCY = int(os.getenv("POSTGEN_CONCURRENCY", "2"))
+POSTGEN_FRAME_WAIT_S = float(os.getenv("POSTGEN_FRAME_WAIT_S", "30"))
+POSTGEN_TTL_S = int(os.getenv("POSTGEN_TTL_S", str(12 * 3600)))
+POSTGEN_MEMO_SIZE = 512
+POSTGEN_NORMALIZE_TIMEOUT_S = 600
+LAST_FRAME_FFMPEG_TIMEOUT_S = 60
+
+JOBS = counter("creator_postgen_jobs_total", "Post-generation clip jobs", ["result"])
+HITS = counter(
+    "creator_postgen_artifact_lookups_total", "Lookups of eagerly prepared artifacts",
+    ["artifact", "result"],
+)
+
+
+def normalized_key(url: str) -> str:
+    """Media-cache key of the yuv420p/faststart copy of `url`."""
+    return f"postgen:yuv420p:{url}"
+
+
+def _frame_key(url: str) -> str:
+    return f"postgen:frame:{hashlib.sha256(url.encode()).hexdigest()}"
+
+
+def _moov_first(path: str) -> bool:
+    """True if the MP4's moov box precedes mdat (faststart)."""
+    with open(path, "rb") as f:
+        pos = 0
+        while True:
+            f.seek(pos)
+            hdr = f.read(16)
+            if len(hdr) < 8:
+                return False
+            size, kind = struct.unpack(">I4s", hdr[:8])
+            if kind == b"moov":
+                return True
+            if kind == b"mdat":
+                return False
+            if size == 1 and len(hdr) == 16:
+                size = struct.unpack(">Q", hdr[8:16])[0]
+            if size < 8:
+                return False
+            pos += size
+
+
+async def last_frame_from_file(src: str, tmp: str, video_url: str,
+                               duration: Optional[float] = None) -> Optional[str]:
+    """Extract `src`'s last frame into `tmp` and upload it to OSS."""
+    # Probe duration so we can seek to a frame that actually exists
+    # (ffmpeg's `-sseof` is fragile across container variants).
+    if duration is None:
+        from apps.web.util.mediaprobe import MediaProbeInstance
+
+        info = await MediaProbeInstance.probe(src)
+        duration = info.duration if info else 0.0
+    seek = max(0.0, duration - 0.1)
+
+    out_png = os.path.join(tmp, "last.png")
+    # Single-frame grab: jumps the shared ffmpeg queue ahead of re-encodes.
+    rc, _so, _se = await FfmpegPoolInstance.run(
+        ["ffmpeg", "-y", "-ss", f"{seek:.3f}", "-i", src,
+         "-vframes", "1", "-q:v", "2", "-update", "1", out_png],
+        priority=PRIORITY_FRAME, timeout=LAST_FRAME_FFMPEG_TIMEOUT_S, kind="last_frame",
+    )
+    if rc != 0 or not os.path.exists(out_png) or os.path.getsize(out_png) == 0:
+        log.warning("last-frame extract failed for %s", video_url)
+        return None
+
+    # Upload to OSS with a clean key + Content-Type.
+    from apps.web.util.ossupload import upload_file
+    oss_url_prefix = os.getenv("FILE_OSS_HK_URL", "")
+    date = datetime.utcnow().strftime("%Y/%m/%d")
+    key = f"canvas/refframes/{date}/lastframe_{uuid.uuid4().hex}.png"
+    try:
+        await upload_file(out_png, key, "image/png")
+    except Exception as e:
+        log.warning("OSS upload failed for last-frame: %s", e)
+        return None
+    return f"{oss_url_prefix}{key}"
+
+
+class PostGenPipeline:
+    def __init__(self, concurrency: int = POSTGEN_CONCURRENCY):
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._jobs: Dict[str, asyncio.Task] = {}
+        # url -> future of the last-frame URL (None if extraction failed).
+        self._frames: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return POSTGEN_ENABLED
+
+    def submit(self, url: str) -> None:
+        """Start preparing `url` in the background (idempotent)."""
+        if not self.enabled or not url or url in self._jobs or url in self._frames:
+            return
+        loop = asyncio.get_running_loop()
+        self._frames[url] = loop.create_future()
+        while len(self._frames) > POSTGEN_MEMO_SIZE:
+            _old, fut = self._frames.popitem(last=False)
+            if not fut.done():
+                fut.cancel()
+        task = loop.create_task(self._run(url))
+        self._jobs[url] = task
+        task.add_done_callback(lambda _t: self._jobs.pop(url, None))
+
+    async def last_frame(self, url: str, timeout: float = POSTGEN_FRAME_WAIT_S) -> Optional[str]:
+        """Last-frame URL prepared for `url`, or None if there isn't one."""
+        fut = self._frames.get(url)
+        frame = None
+        if fut is not None:
+            try:
+                frame = await asyncio.wait_for(asyncio.shield(fut), timeout)
+            except asyncio.TimeoutError:
+                log.info("postgen: last frame of %s not ready after %.0fs", url[:80], timeout)
+            except asyncio.CancelledError:
+                if not fut.cancelled():  # we were cancelled, not the job
+                    raise
+        if frame is None:
+            frame = await self._load_frame(url)
+        HITS.labels("last_frame", "hit" if frame else "miss").inc()
+        return frame
+
+    async def wait(self, url: str, timeout: float) -> None:
+        """Wait up to `timeout` for a pending job on `url` to finish."""
+        task = self._jobs.get(url)
+        if task is not None:
+            await asyncio.wait({task}, timeout=timeout)
+
+    def prepared(self, url: str) -> Optional[str]:
+        """Media-cache path of the normalized clip, if one was made."""
+        from apps.web.util.mediacache import MediaCacheInstance
+        path = MediaCacheInstance.peek(normalized_key(url))
+        HITS.labels("normalized", "hit" if path else "miss").inc()
+        return path
+
+    async def close(self) -> None:
+        tasks = list(self._jobs.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ----- internals -----
+
+    async def _run(self, url: str) -> None:
+        frame_fut = self._frames.get(url)
+        try:
+            await self._prepare(url, frame_fut)
+            JOBS.labels("ok").inc()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            JOBS.labels("error").inc()
+            log.warning("postgen job for %s failed: %s", url[:80], e)
+        finally:
+            if frame_fut is not None and not frame_fut.done():
+                frame_fut.set_result(None)
+
+    async def _prepare(self, url: str, frame_fut: Optional[asyncio.Future]) -> None:
+        from apps.web.util.mediacache import MediaCacheInstance
+        from apps.web.util.mediaprobe import MediaProbeInstance
+
+        tmp = tempfile.mkdtemp(prefix="postgen_")
+        try:
+            async with MediaCacheInstance.open(url) as src:
+                info = await MediaProbeInstance.probe(src)
+                duration = info.duration if info else None
+
+                # The next chained shot is waiting on this, so it goes first.
+                frame = await last_frame_from_file(src, tmp, url, duration)
+                if frame_fut is not None and not frame_fut.done():
+                    frame_fut.set_result(frame)
+                if frame:
+                    await self._store_frame(url, frame)
+
+                if info is None or info.video_codec is None:
+                    return
+                needs_reencode = (info.pix_fmt or "yuv420p") != "yuv420p"
+                needs_remux = not await asyncio.to_thread(_moov_first, src)
+                if not needs_reencode and not needs_remux:
+                    return
+                out = os.path.join(tmp, "normalized.mp4")
+                if needs_reencode:
+                    args = [
+                        "ffmpeg", "-y", "-i", src,
+                        "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+                        "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+                        "-c:a", "aac", "-b:a", "128k", out,
+                    ]
+                else:
+                    args = ["ffmpeg", "-y", "-i", src, "-c", "copy", "-movflags", "+faststart", out]
+                async with self._sem:
+                    rc, _so, se = await FfmpegPoolInstance.run(
+                        args, priority=PRIORITY_BACKGROUND, timeout=POSTGEN_NORMALIZE_TIMEOUT_S,
+                        kind="postgen_normalize",
+                    )
+                if rc != 0 or not os.path.exists(out) or os.path.getsize(out) == 0:
+                    log.info("postgen: normalize of %s failed: %s", url[:80],
+                             se[:300].decode("utf-8", "replace") if se else "")
+                    return
+                await MediaCacheInstance.adopt(normalized_key(url), out)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    async def _store_frame(self, url: str, frame: str) -> None:
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        r = AsyncRedisClientInstance.redis_client
+        if r is None:
+            return
+        try:
+            await r.set(_frame_key(url), frame, ex=POSTGEN_TTL_S)
+        except Exception as e:
+            log.warning("postgen: storing last frame failed: %s", e)
+
+    async def _load_frame(self, url: str) -> Optional[str]:
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        r = AsyncRedisClientInstance.redis_client
+        if r is None:
+            return None
+        try:
+            return await r.get(_frame_key(url))
+        except Exception as e:
+            log.warning("postgen: loading last frame failed: %s", e)
+            return None
+
+
+PostGenInstance = PostGenPipeline()
@@ -0,0 +1,219 @@
+"""Copy vendor (WaveSpeed) outputs into our OSS bucket.
+
+Generated clips and images come back as vendor CDN URLs that expire
+after about a day and sit in another region, so every chain, stitch and
+playback fetched them cross-region, and saved workspaces broke once the
+links lapsed. When a generation succeeds the canvas now calls
+
+    RehostInstance.submit(output_url)
+
+which records the source in RehostedMedia (status pending) and copies it
+in the background:
+
+  - the bytes come through the media cache, which streams to disk and
+    names blobs by content sha256, so a clip the post-gen pipeline or a
+    chain step already fetched isn't downloaded again and memory stays
+    at one network chunk;
+  - the object key is `REHOST_PREFIX/<sha[:2]>/<sha><ext>`; when another
+    source already produced the same bytes its copy is reused and
+    nothing is uploaded (dedup by content hash);
+  - the upload goes through ossupload.upload_file (multipart from disk
+    for large files).
+
+`resolve(url)` / `rewrite(obj)` map source URLs to the stable ones:
+block responses (including generation-cache hits) and saved / loaded
+workspaces go through them, so clients switch to the same-region URL as
+soon as the copy exists. Copies lost to a restart or a failed attempt
+are retried by the leader's sweep loop, up to REHOST_MAX_ATTEMPTS.
+"""
+import asyncio
+import logging
+import mimetypes
+import os
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+from urllib.parse import urlparse
+
+from apps.web.util.metrics import counter
+
+log = logging.getLogger(__name__)
+
+REHOST_ENABLED = os.getenv("REHOST_ENABLED", "1") == "1"
+REHOST_PREFIX = os.getenv("REHOST_PREFIX", "media")
+REHOST_CONCURRENCY = int(os.getenv("REHOST_CONCURRENCY", "2"))
+REHOST_MAX_ATTEMPTS = int(os.getenv("REHOST_MAX_ATTEMPTS", "5"))
+REHOST_SWEEP_S = int(os.getenv("REHOST_SWEEP_S", "60"))
+# A pending row this old has no live task behind it.
+REHOST_STALE_S = 300
+REHOST_DOWNLOAD_TIMEOUT_S = 120
+REHOST_MEMO_SIZE = 4096
+
+JOBS = counter("creator_rehost_total", "Vendor outputs copied to OSS", ["result"])
+BYTES = counter("creator_rehost_bytes_total", "Bytes uploaded by the rehost worker")
+
+_REHOSTED_KEY = re.compile(rf"^{re.escape(REHOST_PREFIX)}/[0-9a-f]{{2}}/([0-9a-f]{{64}})")
+
+
+def _own_prefix() -> str:
+    return os.getenv("FILE_OSS_HK_URL", "")
+
+
+def _rehostable(url: Any) -> bool:
+    if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+        return False
+    own = _own_prefix()
+    return not (own and url.startswith(own))
+
+
+class RehostWorker:
+    def __init__(self, concurrency: int = REHOST_CONCURRENCY):
+        self._sem = asyncio.Semaphore(max(1, concurrency))
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._done: "OrderedDict[str, str]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return REHOST_ENABLED
+
+    def submit(self, url: str) -> None:
+        """Copy `url` to OSS in the background (idempotent)."""
+        if not self.enabled or not _rehostable(url) or url in self._tasks or url in self._done:
+            return
+        task = asyncio.get_running_loop().create_task(self._submit(url))
+        self._tasks[url] = task
+        task.add_done_callback(lambda _t: self._tasks.pop(url, None))
+
+    async def resolve(self, url: Optional[str]) -> Optional[str]:
+        """Stable OSS URL for `url` if it has been copied, else `url`."""
+        if not _rehostable(url):
+            return url
+        return (await self._lookup({url})).get(url, url)
+
+    async def content_sha(self, url: str) -> Optional[str]:
+        """Recorded content sha256 of a source or rehosted URL, if known."""
+        if not isinstance(url, str) or not url:
+            return None
+        own = _own_prefix()
+        if own and url.startswith(own):
+            m = _REHOSTED_KEY.match(url[len(own):])
+            return m.group(1) if m else None
+        if not _rehostable(url):
+            return None
+        from apps.web.models.rehosted_media import REHOST_DONE, RehostedMediaInstance
+        row = await asyncio.to_thread(RehostedMediaInstance.get_by_source, url)
+        return row.content_sha256 if row is not None and row.status == REHOST_DONE else None
+
+    async def rewrite(self, obj: Any) -> Any:
+        """Copy of a JSON value with every copied source URL replaced."""
+        urls: Set[str] = set()
+        _collect(obj, urls)
+        mapping = await self._lookup(urls) if urls else {}
+        return _replace(obj, mapping) if mapping else obj
+
+    async def sweep_forever(self) -> None:
+        """Retry pending copies; run on one worker via LeaderInstance."""
+        from apps.web.models.rehosted_media import RehostedMediaInstance
+        while True:
+            await asyncio.sleep(REHOST_SWEEP_S)
+            if not self.enabled:
+                continue
+            urls = await asyncio.to_thread(RehostedMediaInstance.list_pending, REHOST_STALE_S)
+            for url in urls:
+                if url not in self._tasks:
+                    await self._run(url)
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # ----- internals -----
+
+    async def _lookup(self, urls: Set[str]) -> Dict[str, str]:
+        from apps.web.models.rehosted_media import RehostedMediaInstance
+        found = {u: self._done[u] for u in urls if u in self._done}
+        missing = [u for u in urls if u not in found and _rehostable(u)]
+        if missing:
+            rows = await asyncio.to_thread(RehostedMediaInstance.get_done_urls, missing)
+            for src, dst in rows.items():
+                self._remember(src, dst)
+            found.update(rows)
+        return found
+
+    def _remember(self, src: str, dst: str) -> None:
+        self._done[src] = dst
+        self._done.move_to_end(src)
+        while len(self._done) > REHOST_MEMO_SIZE:
+            self._done.popitem(last=False)
+
+    async def _submit(self, url: str) -> None:
+        from apps.web.models.rehosted_media import REHOST_DONE, RehostedMediaInstance
+        row = await asyncio.to_thread(RehostedMediaInstance.get_by_source, url)
+        if row is not None and row.status == REHOST_DONE:
+            self._remember(url, row.url)
+            return
+        await asyncio.to_thread(RehostedMediaInstance.add_pending, url)
+        await self._run(url)
+
+    async def _run(self, url: str) -> None:
+        from apps.web.models.rehosted_media import RehostedMediaInstance
+        try:
+            async with self._sem:
+                dst = await self._copy(url)
+            self._remember(url, dst)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            JOBS.labels("error").inc()
+            log.warning("rehost of %s failed: %s", url[:120], e)
+            await asyncio.to_thread(RehostedMediaInstance.mark_failed, url, str(e), REHOST_MAX_ATTEMPTS)
+
+    async def _copy(self, url: str) -> str:
+        from apps.web.models.rehosted_media import RehostedMediaInstance
+        from apps.web.util.mediacache import MediaCacheInstance, content_sha256
+        from apps.web.util.ossupload import upload_file
+
+        async with MediaCacheInstance.open(url, timeout=REHOST_DOWNLOAD_TIMEOUT_S) as path:
+            sha = await asyncio.to_thread(content_sha256, path)
+            size = os.path.getsize(path)
+            existing = await asyncio.to_thread(RehostedMediaInstance.get_done_by_content, sha)
+            if existing is not None:
+                key, dst = existing.key, existing.url
+                JOBS.labels("dedup").inc()
+            else:
+                ext = os.path.splitext(urlparse(url).path)[1][:8].lower()
+                content_type = mimetypes.guess_type(f"x{ext}")[0] or "application/octet-stream"
+                key = f"{REHOST_PREFIX}/{sha[:2]}/{sha}{ext}"
+                await upload_file(path, key, content_type)
+                dst = f"{_own_prefix()}{key}"
+                JOBS.labels("copied").inc()
+                BYTES.inc(size)
+        await asyncio.to_thread(RehostedMediaInstance.mark_done, url, sha, key, dst, size)
+        log.info("rehosted %s -> %s", url[:120], key)
+        return dst
+
+
+def _collect(obj: Any, out: Set[str]) -> None:
+    if isinstance(obj, dict):
+        for v in obj.values():
+            _collect(v, out)
+    elif isinstance(obj, list):
+        for v in obj:
+            _collect(v, out)
+    elif _rehostable(obj):
+        out.add(obj)
+
+
+def _replace(obj: Any, mapping: Dict[str, str]) -> Any:
+    if isinstance(obj, dict):
+        return {k: _replace(v, mapping) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_replace(v, mapping) for v in obj]
+    if isinstance(obj, str):
+        return mapping.get(obj, obj)
+    return obj
+
+
+RehostInstance = RehostWorker()
@@ -0,0 +1,327 @@
+"""Lazily generated preview renditions of canvas videos.
+
+Canvas thumbnails and inline players used to load the full 720p/1080p
+master for every preview. Video block results now carry, next to
+`output_url`, a `renditions` map of links (see `links()`):
+
+    poster   JPEG frame, at most RENDITION_POSTER_WIDTH wide
+    preview  low-bitrate MP4 (RENDITION_PREVIEW_HEIGHT p, faststart)
+    hls      fMP4 HLS master playlist over HLS_LADDER rungs up to the
+             source height, segments RENDITION_HLS_SEGMENT_S long
+
+Each link points at GET /api/v1/canvas/renditions/{kind}, signed with an HMAC
+of the source URL so it can't be used to transcode arbitrary media. The
+first request for a kind:
+
+  1. fetches the source through the media cache and takes its content
+     sha256 (media-cache blobs are named by it);
+  2. builds the rendition with ffmpeg on the shared pool and uploads it
+     under `RENDITION_PREFIX/<sha>/` (HLS master playlist last, so its
+     presence means the ladder is complete);
+  3. records the object URL in Redis (`renditions:<sha>`, plus
+     `renditions:src:<sha256(url)>` -> sha so later requests skip the
+     fetch) and an in-process memo.
+
+Later requests redirect straight to the OSS object. Keys depend only on
+content, so a vendor URL and its rehosted copy share renditions, and a
+worker without the Redis record finds finished objects by checking the
+bucket. Concurrent requests for one rendition share a build within a
+process; two workers racing build the same bytes under the same key.
+"""
+import asyncio
+import hashlib
+import hmac
+import logging
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from apps.web.util.ffmpeg_pool import FfmpegPoolInstance, PRIORITY_ENCODE, PRIORITY_FRAME
+from apps.web.util.metrics import counter
+
+log = logging.getLogger(__name__)
+
+RENDITION_KINDS = ("poster", "preview", "hls")
+RENDITION_PREFIX = os.getenv("RENDITION_PREFIX", "renditions")
+RENDITION_LINK_BASE = os.getenv("RENDITION_LINK_BASE", "/creator/api/v1/canvas/renditions")
+RENDITION_TTL_S = int(os.getenv("RENDITION_TTL_S", str(30 * 24 * 3600)))
+RENDITION_POSTER_WIDTH = 640
+RENDITION_PREVIEW_HEIGHT = 360
+RENDITION_PREVIEW_BITRATE = "600k"
+RENDITION_HLS_SEGMENT_S = 4
+# (height, video bitrate, audio bitrate); rungs above the source height are skipped.
+HLS_LADDER: List[Tuple[int, str, str]] = [
+    (360, "800k", "96k"),
+    (540, "1500k", "128k"),
+    (720, "2800k", "128k"),
+    (1080, "5000k", "160k"),
+]
+RENDITION_FFMPEG_TIMEOUT_S = 600
+RENDITION_MEMO_SIZE = 2048
+
+REQUESTS = counter("creator_rendition_requests_total", "Rendition requests", ["kind", "result"])
+
+_OBJECTS = {
+    "poster": ("poster.jpg", "image/jpeg"),
+    "preview": ("preview.mp4", "video/mp4"),
+    "hls": ("hls/master.m3u8", "application/vnd.apple.mpegurl"),
+}
+_HLS_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+
+class RenditionError(Exception):
+    pass
+
+
+def _sign(src: str) -> str:
+    from config import WEBUI_SECRET_KEY
+    key = (WEBUI_SECRET_KEY or "").encode()
+    return hmac.new(key, src.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _own_prefix() -> str:
+    return os.getenv("FILE_OSS_HK_URL", "")
+
+
+class RenditionService:
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._sha: "OrderedDict[str, str]" = OrderedDict()    # source url -> content sha
+        self._urls: "OrderedDict[str, str]" = OrderedDict()   # "<sha>:<kind>" -> object url
+
+    def links(self, src: str) -> Dict[str, str]:
+        """Signed lazy links for every rendition of `src`."""
+        q = f"src={quote(src, safe='')}&sig={_sign(src)}"
+        return {kind: f"{RENDITION_LINK_BASE}/{kind}?{q}" for kind in RENDITION_KINDS}
+
+    def verify(self, src: str, sig: str) -> bool:
+        return bool(src) and hmac.compare_digest(_sign(src), sig or "")
+
+    async def get(self, src: str, kind: str) -> str:
+        """Object URL of `kind` for `src`, building it on first use."""
+        if kind not in RENDITION_KINDS:
+            raise RenditionError(f"unknown rendition {kind!r}")
+        sha = await self._known_sha(src)
+        if sha:
+            url = await self._known_url(sha, kind)
+            if url:
+                REQUESTS.labels(kind, "hit").inc()
+                return url
+
+        fut = self._inflight.get((src, kind))
+        if fut is not None:
+            return await asyncio.shield(fut)
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[(src, kind)] = fut
+        try:
+            url = await self._build(src, kind)
+            fut.set_result(url)
+            return url
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                fut.cancel()
+            else:
+                fut.set_exception(e)
+                fut.exception()  # retrieved by us; waiters re-raise it
+            raise
+        finally:
+            self._inflight.pop((src, kind), None)
+
+    # ----- lookups -----
+
+    @staticmethod
+    def _redis():
+        from apps.redis.redis_client import AsyncRedisClientInstance
+        return AsyncRedisClientInstance.redis_client
+
+    def _memo(self, memo: "OrderedDict[str, str]", key: str, value: str) -> None:
+        memo[key] = value
+        memo.move_to_end(key)
+        while len(memo) > RENDITION_MEMO_SIZE:
+            memo.popitem(last=False)
+
+    async def _known_sha(self, src: str) -> Optional[str]:
+        if src in self._sha:
+            return self._sha[src]
+        r = self._redis()
+        if r is None:
+            return None
+        try:
+            sha = await r.get(f"renditions:src:{hashlib.sha256(src.encode()).hexdigest()}")
+        except Exception as e:
+            log.warning("rendition src lookup failed: %s", e)
+            return None
+        if sha:
+            self._memo(self._sha, src, sha)
+        return sha
+
+    async def _known_url(self, sha: str, kind: str) -> Optional[str]:
+        memo_key = f"{sha}:{kind}"
+        if memo_key in self._urls:
+            return self._urls[memo_key]
+        r = self._redis()
+        url = None
+        if r is not None:
+            try:
+                url = await r.hget(f"renditions:{sha}", kind)
+            except Exception as e:
+                log.warning("rendition lookup failed: %s", e)
+        if url is None:
+            # Built by a worker whose Redis write we can't see (or no Redis).
+            from apps.web.util.aliossutils import AliOSSUtil
+            key = f"{RENDITION_PREFIX}/{sha}/{_OBJECTS[kind][0]}"
+            try:
+                exists = await asyncio.to_thread(AliOSSUtil._get_bucket().object_exists, key)
+            except Exception as e:
+                log.warning("rendition exists check failed: %s", e)
+                exists = False
+            if exists:
+                url = f"{_own_prefix()}{key}"
+        if url:
+            self._memo(self._urls, memo_key, url)
+        return url
+
+    async def _record(self, src: str, sha: str, kind: str, url: str) -> None:
+        self._memo(self._sha, src, sha)
+        self._memo(self._urls, f"{sha}:{kind}", url)
+        r = self._redis()
+        if r is None:
+            return
+        try:
+            src_key = f"renditions:src:{hashlib.sha256(src.encode()).hexdigest()}"
+            await r.set(src_key, sha, ex=RENDITION_TTL_S)
+            await r.hset(f"renditions:{sha}", kind, url)
+            await r.expire(f"renditions:{sha}", RENDITION_TTL_S)
+        except Exception as e:
+            log.warning("rendition record failed: %s", e)
+
+    # ----- building -----
+
+    async def _build(self, src: str, kind: str) -> str:
+        from apps.web.util.mediacache import MediaCacheInstance, content_sha256
+        from apps.web.util.mediaprobe import MediaProbeInstance
+        from apps.web.util.rehost import RehostInstance
+
+        tmp = tempfile.mkdtemp(prefix="rendition_")
+        try:
+            # Our OSS copy outlives the vendor link and is same-region.
+            fetch_url = await RehostInstance.resolve(src)
+            async with MediaCacheInstance.open(fetch_url) as path:
+                sha = await asyncio.to_thread(content_sha256, path)
+                self._memo(self._sha, src, sha)
+                url = await self._known_url(sha, kind)
+                if url:
+                    REQUESTS.labels(kind, "hit").inc()
+                    await self._record(src, sha, kind, url)
+                    return url
+                info = await MediaProbeInstance.probe(path)
+                if info is None or not info.video_codec:
+                    REQUESTS.labels(kind, "error").inc()
+                    raise RenditionError("source is not a readable video")
+                build = {"poster": self._poster, "preview": self._preview, "hls": self._hls}[kind]
+                await build(path, tmp, info)
+            url = await self._upload(tmp, sha, kind)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        REQUESTS.labels(kind, "built").inc()
+        await self._record(src, sha, kind, url)
+        return url
+
+    async def _ffmpeg(self, args: List[str], priority: int, kind: str) -> None:
+        rc, _so, se = await FfmpegPoolInstance.run(
+            args, priority=priority, timeout=RENDITION_FFMPEG_TIMEOUT_S, kind=f"rendition_{kind}",
+        )
+        if rc != 0:
+            REQUESTS.labels(kind, "error").inc()
+            raise RenditionError(
+                f"ffmpeg {kind} failed (rc={rc}): {se[:300].decode('utf-8', 'replace') if se else ''}"
+            )
+
+    async def _poster(self, path: str, tmp: str, info) -> None:
+        at = min(1.0, info.duration / 2) if info.duration else 0.0
+        await self._ffmpeg([
+            "ffmpeg", "-y", "-ss", f"{at:.3f}", "-i", path, "-vframes", "1",
+            "-vf", f"scale='min({RENDITION_POSTER_WIDTH},iw)':-2", "-q:v", "3",
+            os.path.join(tmp, "poster.jpg"),
+        ], PRIORITY_FRAME, "poster")
+
+    async def _preview(self, path: str, tmp: str, info) -> None:
+        audio = ["-c:a", "aac", "-b:a", "64k", "-ac", "1"] if info.has_audio else ["-an"]
+        await self._ffmpeg([
+            "ffmpeg", "-y", "-i", path,
+            "-vf", f"scale=-2:'min({RENDITION_PREVIEW_HEIGHT},ih)'",
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "30",
+            "-maxrate", RENDITION_PREVIEW_BITRATE, "-bufsize", "1200k",
+            "-pix_fmt", "yuv420p", "-movflags", "+faststart",
+            *audio, os.path.join(tmp, "preview.mp4"),
+        ], PRIORITY_ENCODE, "preview")
+
+    async def _hls(self, path: str, tmp: str, info) -> None:
+        rungs = [r for r in HLS_LADDER if not info.height or r[0] <= info.height] or HLS_LADDER[:1]
+        out = os.path.join(tmp, "hls")
+        os.makedirs(out)
+        split = f"[0:v]split={len(rungs)}" + "".join(f"[s{i}]" for i in range(len(rungs)))
+        scales = [f"[s{i}]scale=-2:{h}[v{i}]" for i, (h, _vb, _ab) in enumerate(rungs)]
+        args = ["ffmpeg", "-y", "-i", path, "-filter_complex", ";".join([split] + scales)]
+        stream_map = []
+        for i, (_h, vbr, abr) in enumerate(rungs):
+            args += ["-map", f"[v{i}]", f"-c:v:{i}", "libx264", f"-b:v:{i}", vbr,
+                     f"-maxrate:v:{i}", vbr, f"-bufsize:v:{i}", vbr]
+            if info.has_audio:
+                args += ["-map", "a:0", f"-c:a:{i}", "aac", f"-b:a:{i}", abr]
+                stream_map.append(f"v:{i},a:{i}")
+            else:
+                stream_map.append(f"v:{i}")
+        args += [
+            "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            # Keyframe on every segment boundary so all rungs switch cleanly.
+            "-force_key_frames", f"expr:gte(t,n_forced*{RENDITION_HLS_SEGMENT_S})",
+            "-f", "hls", "-hls_time", str(RENDITION_HLS_SEGMENT_S),
+            "-hls_playlist_type", "vod", "-hls_segment_type", "fmp4",
+            "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_segment_filename", os.path.join(out, "v%v", "seg_%03d.m4s"),
+            "-master_pl_name", "master.m3u8",
+            "-var_stream_map", " ".join(stream_map),
+            os.path.join(out, "v%v", "index.m3u8"),
+        ]
+        await self._ffmpeg(args, PRIORITY_ENCODE, "hls")
+
+    async def _upload(self, tmp: str, sha: str, kind: str) -> str:
+        from apps.web.util.ossupload import upload_file
+
+        name, content_type = _OBJECTS[kind]
+        base = f"{RENDITION_PREFIX}/{sha}"
+        if kind != "hls":
+            await upload_file(os.path.join(tmp, name), f"{base}/{name}", content_type)
+            return f"{_own_prefix()}{base}/{name}"
+
+        root = os.path.join(tmp, "hls")
+        files = []
+        for dirpath, _dirs, names in os.walk(root):
+            for n in names:
+                rel = os.path.relpath(os.path.join(dirpath, n), root)
+                if rel != "master.m3u8":
+                    files.append(rel)
+        if not os.path.exists(os.path.join(root, "master.m3u8")):
+            raise RenditionError("ffmpeg produced no HLS master playlist")
+        sem = asyncio.Semaphore(4)
+
+        async def put(rel: str) -> None:
+            ctype = _HLS_TYPES.get(os.path.splitext(rel)[1], "application/octet-stream")
+            async with sem:
+                await upload_file(os.path.join(root, rel), f"{base}/hls/{rel}", ctype)
+
+        await asyncio.gather(*(put(rel) for rel in files))
+        # Master last: its presence marks the ladder complete.
+        await put("master.m3u8")
+        return f"{_own_prefix()}{base}/{name}"
+
+
+RenditionInstance = RenditionService()
@@ -0,0 +1,278 @@
+"""Fetch just enough of a remote MP4 to decode its last frame.
+
+Chaining a shot needs one frame from the end of the previous clip, but
+downloading the clip costs the whole file (tens of MB) on the critical
+path of every director shot. TailFetcher reads only what ffmpeg needs:
+
+  1. Range-read the top-level box headers to find `moov` (front for
+     faststart files, after `mdat` otherwise) and fetch it whole;
+  2. from the video track's sample tables (stss/stsz/stsc/stco/stts)
+     work out the last keyframe at or before the seek point, and the
+     byte span from that sample to the end of the track;
+  3. fetch that span and write every fetched piece at its real offset
+     in a sparse file the size of the original.
+
+ffmpeg then opens the sparse file normally, seeks through the index to
+that keyframe and decodes forward; it never touches the zero-filled
+holes. For a clip with short GOPs this is a few hundred KB instead of
+the whole file.
+
+fetch() returns None (and the caller downloads the clip as before) when
+the server ignores Range, the file is fragmented or not MP4, or the tail
+GOP is larger than TAILFRAME_MAX_FRACTION of the file: a clip encoded
+with a single keyframe needs every byte anyway, and a full download at
+least leaves it in the media cache for the stitcher.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import aiohttp
+from pydantic import BaseModel
+
+from apps.web.util.metrics import counter
+
+log = logging.getLogger(__name__)
+
+TAILFRAME_HEAD_BYTES = 64 * 1024
+TAILFRAME_MAX_MOOV_BYTES = 16 * 1024 * 1024
+TAILFRAME_MAX_FRACTION = float(os.getenv("TAILFRAME_MAX_FRACTION", "0.5"))
+TAILFRAME_TIMEOUT_S = 30
+# Seek this far before the end, same as the full-download path.
+TAILFRAME_SEEK_BACK_S = 0.1
+# Slack for B-frame reordering between decode and presentation time.
+TAILFRAME_REORDER_SLACK_S = 0.1
+
+FETCHES = counter("creator_tailframe_fetches_total", "Tail-frame range fetches", ["result"])
+BYTES = counter("creator_tailframe_bytes_total", "Bytes fetched by tail-frame range reads")
+
+
+class TailFile(BaseModel):
+    path: str
+    duration: float
+    fetched_bytes: int
+    total_bytes: int
+
+
+class _NotRangeable(Exception):
+    pass
+
+
+def _boxes(buf: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int, int]]:
+    """(type, offset, header length, size) of the boxes in buf[start:end]."""
+    end = len(buf) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack(">I4s", buf[pos:pos + 8])
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack(">Q", buf[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header:
+            return
+        yield kind, pos, header, size
+        pos += size
+
+
+def _children(buf: bytes, offset: int, header: int, size: int) -> Dict[bytes, List[Tuple[int, int, int]]]:
+    out: Dict[bytes, List[Tuple[int, int, int]]] = {}
+    for kind, pos, hdr, sz in _boxes(buf, offset + header, offset + size):
+        out.setdefault(kind, []).append((pos, hdr, sz))
+    return out
+
+
+def _payload(buf: bytes, box: Tuple[int, int, int]) -> bytes:
+    pos, hdr, sz = box
+    return buf[pos + hdr:pos + sz]
+
+
+def _u32s(data: bytes, at: int, n: int) -> Tuple[int, ...]:
+    return struct.unpack(f">{n}I", data[at:at + 4 * n])
+
+
+class _VideoTrack(BaseModel):
+    timescale: int
+    sample_sizes: List[int]
+    sample_offsets: List[int]
+    decode_times: List[int]
+    total_time: int
+    sync_samples: List[int]  # 0-based; empty = every sample is a keyframe
+
+
+def _parse_video_track(moov: bytes) -> Optional[_VideoTrack]:
+    top = _children(moov, 0, 8, len(moov))
+    if b"mvex" in top:
+        return None  # fragmented MP4: samples live in moof boxes
+    for trak in top.get(b"trak", []):
+        mdia = _children(moov, *trak).get(b"mdia")
+        if not mdia:
+            continue
+        mdia_c = _children(moov, *mdia[0])
+        hdlr = _payload(moov, mdia_c[b"hdlr"][0]) if b"hdlr" in mdia_c else b""
+        if hdlr[8:12] != b"vide" or b"minf" not in mdia_c:
+            continue
+        mdhd = _payload(moov, mdia_c[b"mdhd"][0])
+        timescale = struct.unpack(">I", mdhd[20:24] if mdhd[0] == 1 else mdhd[12:16])[0]
+        stbl = _children(moov, *mdia_c[b"minf"][0]).get(b"stbl")
+        if not stbl:
+            return None
+        t = _children(moov, *stbl[0])
+
+        stsz = _payload(moov, t[b"stsz"][0])
+        fixed, count = struct.unpack(">II", stsz[4:12])
+        sizes = [fixed] * count if fixed else list(_u32s(stsz, 12, count))
+
+        if b"co64" in t:
+            co = _payload(moov, t[b"co64"][0])
+            n = struct.unpack(">I", co[4:8])[0]
+            chunk_offsets = list(struct.unpack(f">{n}Q", co[8:8 + 8 * n]))
+        else:
+            co = _payload(moov, t[b"stco"][0])
+            n = struct.unpack(">I", co[4:8])[0]
+            chunk_offsets = list(_u32s(co, 8, n))
+
+        stsc = _payload(moov, t[b"stsc"][0])
+        n = struct.unpack(">I", stsc[4:8])[0]
+        runs = [_u32s(stsc, 8 + 12 * i, 3) for i in range(n)]
+        offsets: List[int] = []
+        for i, (first_chunk, per_chunk, _desc) in enumerate(runs):
+            last_chunk = runs[i + 1][0] - 1 if i + 1 < len(runs) else len(chunk_offsets)
+            for chunk in range(first_chunk, last_chunk + 1):
+                pos = chunk_offsets[chunk - 1]
+                for _ in range(per_chunk):
+                    if len(offsets) == count:
+                        break
+                    offsets.append(pos)
+                    pos += sizes[len(offsets) - 1]
+
+        stts = _payload(moov, t[b"stts"][0])
+        n = struct.unpack(">I", stts[4:8])[0]
+        times, now = [], 0
+        for i in range(n):
+            run, delta = _u32s(stts, 8 + 8 * i, 2)
+            for _ in range(run):
+                times.append(now)
+                now += delta
+
+        sync: List[int] = []
+        if b"stss" in t:
+            stss = _payload(moov, t[b"stss"][0])
+            n = struct.unpack(">I", stss[4:8])[0]
+            sync = [s - 1 for s in _u32s(stss, 8, n)]
+
+        if len(offsets) != count or len(times) < count or not count:
+            return None
+        return _VideoTrack(
+            timescale=timescale or 1, sample_sizes=sizes, sample_offsets=offsets,
+            decode_times=times[:count], total_time=now, sync_samples=sync,
+        )
+    return None
+
+
+class TailFetcher:
+    async def _range(self, session: aiohttp.ClientSession, url: str,
+                     start: int, end: int) -> Tuple[bytes, int]:
+        """Bytes [start, end] and the full resource size."""
+        async with session.get(
+            url, headers={"Range": f"bytes={start}-{end}"},
+            timeout=aiohttp.ClientTimeout(total=TAILFRAME_TIMEOUT_S, sock_connect=10),
+        ) as r:
+            if r.status != 206:
+                raise _NotRangeable(f"HTTP {r.status} to a Range request")
+            total = int((r.headers.get("Content-Range") or "/0").rsplit("/", 1)[1] or 0)
+            data = await r.read()
+        BYTES.inc(len(data))
+        return data, total
+
+    async def fetch(self, url: str, dest_dir: str) -> Optional[TailFile]:
+        from apps.web.util.mediacache import MediaCacheInstance
+        session = MediaCacheInstance._get_session()
+        try:
+            result = await self._fetch(session, url, dest_dir)
+        except (_NotRangeable, aiohttp.ClientError, asyncio.TimeoutError,
+                struct.error, KeyError, IndexError, ValueError) as e:
+            log.info("tail-frame range fetch of %s not possible: %s", url[:120], e)
+            result = None
+        FETCHES.labels("range" if result else "fallback").inc()
+        return result
+
+    async def _fetch(self, session, url: str, dest_dir: str) -> Optional[TailFile]:
+        pieces: List[Tuple[int, bytes]] = []
+        head, total = await self._range(session, url, 0, TAILFRAME_HEAD_BYTES - 1)
+        if not total:
+            return None
+        pieces.append((0, head))
+
+        # Walk top-level boxes until moov, reading just the headers of
+        # boxes (mdat) that run past what we have.
+        moov = None
+        pos = 0
+        while pos < total and moov is None:
+            if pos + 16 <= len(head):
+                hdr = head[pos:pos + 16]
+            else:
+                hdr, _ = await self._range(session, url, pos, min(total, pos + 16) - 1)
+                pieces.append((pos, hdr))
+            if len(hdr) < 8:
+                return None
+            size, kind = struct.unpack(">I4s", hdr[:8])
+            if size == 1 and len(hdr) >= 16:
+                size = struct.unpack(">Q", hdr[8:16])[0]
+            elif size < 8:
+                return None  # size 0 ("to end of file") before moov, or garbage
+            if kind == b"moov":
+                if size > TAILFRAME_MAX_MOOV_BYTES:
+                    return None
+                if pos + size <= len(head):
+                    moov = head[pos:pos + size]
+                else:
+                    moov, _ = await self._range(session, url, pos, pos + size - 1)
+                    pieces.append((pos, moov))
+            pos += size
+        if moov is None:
+            return None
+
+        track = _parse_video_track(moov)
+        if track is None:
+            return None
+        duration = track.total_time / track.timescale
+        seek = max(0.0, duration - TAILFRAME_SEEK_BACK_S)
+        cutoff = int((seek - TAILFRAME_REORDER_SLACK_S) * track.timescale)
+        first = 0
+        if track.sync_samples:
+            candidates = [s for s in track.sync_samples if track.decode_times[s] <= cutoff]
+            first = candidates[-1] if candidates else track.sync_samples[0]
+        else:
+            first = max(0, bisect.bisect_right(track.decode_times, cutoff) - 1)
+
+        lo = min(track.sample_offsets[first:])
+        hi = max(o + s for o, s in zip(track.sample_offsets[first:], track.sample_sizes[first:]))
+        if hi - lo > TAILFRAME_MAX_FRACTION * total:
+            log.info("tail GOP of %s is %d of %d bytes; downloading whole clip",
+                     url[:120], hi - lo, total)
+            return None
+        gop, _ = await self._range(session, url, lo, hi - 1)
+        pieces.append((lo, gop))
+
+        path = os.path.join(dest_dir, "tail.mp4")
+        fetched = await asyncio.to_thread(self._write_sparse, path, total, pieces)
+        return TailFile(path=path, duration=duration, fetched_bytes=fetched, total_bytes=total)
+
+    @staticmethod
+    def _write_sparse(path: str, total: int, pieces: List[Tuple[int, bytes]]) -> int:
+        with open(path, "wb") as f:
+            f.truncate(total)
+            for offset, data in pieces:
+                f.seek(offset)
+                f.write(data)
+        return sum(len(d) for _o, d in pieces)
+
+
+TailFetcherInstance = TailFetcher()
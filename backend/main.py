@@ -98,16 +98,35 @@ https://github.com/open-webui/open-webui
 
 # bnb usdt pay listener
 from apps.listener.bnbusdt import BNBUSDTPayListenerInstance
-import asyncio
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("FastAPI Server Running，Start USDT Listener...")
-    listener_task = asyncio.create_task(BNBUSDTPayListenerInstance.start_listening())
+    from apps.web.util.leader import LeaderInstance
+    # Singleton loops: only the elected worker across all pods runs these.
+    LeaderInstance.register("bnbusdt-listener", BNBUSDTPayListenerInstance.start_listening)
+    from apps.web.util.rehost import RehostInstance
+    LeaderInstance.register("rehost-sweeper", RehostInstance.sweep_forever)
+    await LeaderInstance.start()
+    from apps.web.routers.canvas import CanvasJobQueue
+    await CanvasJobQueue.start()
     yield
-    listener_task.cancel()
-    await listener_task
+    await CanvasJobQueue.stop()
+    await LeaderInstance.stop()
+    from apps.web.ai.poller import PredictionPollerInstance
+    from apps.web.ai.wave import AsyncWaveApiInstance
+    from apps.web.util.mediacache import MediaCacheInstance
+    from apps.redis.redis_client import AsyncRedisClientInstance
+    from apps.web.util.chainrpc import ReceiptServiceInstance
+    from apps.web.util.postgen import PostGenInstance
+    await PredictionPollerInstance.close()
+    await AsyncWaveApiInstance.close()
+    await PostGenInstance.close()
+    await RehostInstance.close()
+    await MediaCacheInstance.close()
+    await ReceiptServiceInstance.close()
+    await AsyncRedisClientInstance.close()
     print("===============bnb usdt pay close===============")
 
 
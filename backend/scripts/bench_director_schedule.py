@@ -0,0 +1,139 @@
+"""Benchmark /director/run serial vs parallel scheduling.
+
+Drives the real director router (canvas _real_videogen, the shared
+prediction poller) against an in-process fake WaveSpeed that finishes
+every job after FAKE_SHOT_S seconds. Payment checks, last-frame
+extraction and stitching are stubbed out, and post-generation prep and
+rehosting are off; only shot scheduling is measured.
+
+    cd backend
+    WEBUI_SECRET_KEY=x python scripts/bench_director_schedule.py
+
+Options via env: FAKE_SHOT_S (default 3), BENCH_SCENES (3),
+BENCH_SHOTS_PER_SCENE (2). Needs the backend's requirements installed
+and a reachable DATABASE_URL (sqlite is fine).
+"""
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Poll fast so the poller's interval doesn't dominate the measurement.
+os.environ.setdefault("WAVESPEED_POLL_MIN_S", "0.2")
+os.environ.setdefault("WAVESPEED_POLL_MAX_S", "0.5")
+# The fake outputs don't exist; don't fetch them in the background.
+os.environ["POSTGEN_ENABLED"] = "0"
+os.environ["REHOST_ENABLED"] = "0"
+
+FAKE_SHOT_S = float(os.getenv("FAKE_SHOT_S", "3"))
+SCENES = int(os.getenv("BENCH_SCENES", "3"))
+SHOTS_PER_SCENE = int(os.getenv("BENCH_SHOTS_PER_SCENE", "2"))
+
+
+class FakeWaveSpeed:
+    """Stands in for AsyncWaveApiInstance: every job completes after FAKE_SHOT_S."""
+
+    def __init__(self):
+        self.jobs = {}
+        self.peak_in_flight = 0
+
+    def _create(self):
+        job_id = uuid.uuid4().hex
+        self.jobs[job_id] = time.monotonic()
+        now = time.monotonic()
+        in_flight = sum(1 for t in self.jobs.values() if now - t < FAKE_SHOT_S)
+        self.peak_in_flight = max(self.peak_in_flight, in_flight)
+        return {"code": 200, "data": {"id": job_id}}
+
+    async def x402create(self, *args, **kwargs):
+        return self._create()
+
+    async def x402create_i2v(self, *args, **kwargs):
+        return self._create()
+
+    async def get_prediction_result(self, request_id):
+        done = time.monotonic() - self.jobs[request_id] >= FAKE_SHOT_S
+        inner = {"status": "completed" if done else "processing"}
+        if done:
+            inner["outputs"] = [f"https://fake.wavespeed/{request_id}.mp4"]
+        return {"success": True, "data": {"data": inner}}
+
+
+def main():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    import apps.web.ai.wave as wave
+    from apps.web.routers import canvas, director
+    from utils.utils import get_current_user
+
+    fake = FakeWaveSpeed()
+    wave.AsyncWaveApiInstance = fake
+
+    async def fake_last_frame(video_url):
+        return video_url.replace(".mp4", "-lf.jpg")
+
+    async def fake_stitcher(body, started):
+        return canvas.CanvasRunBlockResponse(
+            block_id=body.block_id, status="ok", output_kind="video",
+            output_url="https://fake.oss/stitched.mp4", mode="real",
+        )
+
+    canvas._extract_last_frame_to_oss = fake_last_frame
+    canvas._real_stitcher = fake_stitcher
+
+    class FreeLedger:
+        async def reserve(self, *a):
+            return True, 1e9, ""
+
+        async def check(self, *a):
+            return True, 1e9, ""
+
+        async def commit(self, *a):
+            return None
+
+        async def release(self, *a):
+            return None
+
+    director.DirectorLedger = FreeLedger()
+
+    class BenchUser:
+        id = "bench"
+        role = "admin"
+
+    app = FastAPI()
+    app.include_router(director.router, prefix="/director")
+    app.dependency_overrides[get_current_user] = lambda: BenchUser()
+
+    shots = [
+        {"idx": scene * SHOTS_PER_SCENE + k, "scene_idx": scene, "prompt": f"scene {scene} shot {k}"}
+        for scene in range(SCENES)
+        for k in range(SHOTS_PER_SCENE)
+    ]
+    storyboard = {
+        "characters": [],
+        "shots": shots,
+        "total_cost_cr": 0,
+        "meta": {"scene_count": SCENES, "shot_count": len(shots), "lang": "en", "cached": False},
+    }
+
+    print(f"{len(shots)} shots ({SCENES} scenes x {SHOTS_PER_SCENE}), {FAKE_SHOT_S}s per fake shot")
+    with TestClient(app) as client:
+        for schedule in ("serial", "parallel"):
+            fake.peak_in_flight = 0
+            t0 = time.monotonic()
+            resp = client.post("/director/run", json={
+                "run_id": uuid.uuid4().hex, "storyboard": storyboard, "schedule": schedule,
+            })
+            elapsed = time.monotonic() - t0
+            events = [json.loads(line[6:]) for line in resp.text.splitlines() if line.startswith("data: ")]
+            done = [e for e in events if e["type"] == "done"]
+            order = [e["idx"] for e in events if e["type"] == "shot" and e["status"] == "ok"]
+            print(f"  {schedule:8s} {elapsed:6.2f}s  peak in-flight={fake.peak_in_flight}  "
+                  f"ok order={order}  {'done' if done else events[-1]}")
+
+
+if __name__ == "__main__":
+    main()